@@ -0,0 +1,283 @@
+"""NumPy (structure-of-arrays) state backend for PlanetWars
+
+`ArrayState` keeps the planets and fleets of a game in contiguous NumPy
+arrays, so that growth, fleet positions and battle resolution are each a handful of
+whole-array operations rather than a Python loop over entities. Select it with `PlanetWarsGame(gamestate, backend='arrays')` (or
+`--backend arrays` on the command line).
+
+The rest of the game, and the bots, still work with `Planet` and `Fleet`
+objects: `ArrayPlanet` and `ArrayFleet` are thin views that read and write
+their fields straight from the arrays. Results are identical to the default
+`ObjectState` backend (see planet_wars.py).
+
+"""
+import math
+
+import numpy as np
+
+from entities import Planet, Fleet, NEUTRAL_ID, SCALE_FACTOR, new_id
+from map_cache import PlanetColumns
+
+
+def _field(name, cast):
+	''' A property for a view, backed by element `_i` of array `name`. '''
+	def get(self):
+		return cast(getattr(self._state, name)[self._i])
+
+	def set(self, value):
+		getattr(self._state, name)[self._i] = value
+	return property(get, set)
+
+
+def _owner_field(name):
+	''' A property for a view, backed by an owner index in array `name`. '''
+	def get(self):
+		return self._state.owners[getattr(self._state, name)[self._i]]
+
+	def set(self, value):
+		getattr(self._state, name)[self._i] = self._state.owner_index(value)
+	return property(get, set)
+
+
+class ArrayPlanet(Planet):
+
+	''' A `Planet` whose fields live in the planet arrays of an ArrayState. '''
+
+	x = _field('px', float)
+	y = _field('py', float)
+	ships = _field('pships', int)
+	growth = _field('pgrowth', int)
+	owner = _owner_field('powner')
+
+	def __init__(self, state, i, ID):
+		self._state = state
+		self._i = i
+		self.ID = ID
+		self.vision_age = 0
+		self._vision_ships = None
+
+
+class ArrayFleet(Fleet):
+
+	''' A `Fleet` whose fields live in the fleet arrays of an ArrayState.
+		Fleet slots are compacted as fleets are removed, so `_i` can change.
+	'''
+
+	x = _field('fx', float)
+	y = _field('fy', float)
+	ships = _field('fships', int)
+	vx = _field('fvx', float)
+	vy = _field('fvy', float)
+	x0 = _field('fx0', float)
+	y0 = _field('fy0', float)
+	t0 = _field('ft0', int)
+	owner = _owner_field('fowner')
+
+	def __init__(self, state, i, ID):
+		self._state = state
+		self._i = i
+		self.ID = ID
+		self.vision_age = 0
+		self._vision_ships = None
+
+	@property
+	def dest(self):
+		return self._state.planet_views[self._state.fdest[self._i]]
+
+
+class _DetachedFleet():
+
+	''' One-fleet copy of the fleet arrays, which keeps a removed ArrayFleet
+		readable (e.g. for logging) after its slot has been reused.
+	'''
+
+	def __init__(self, state, i):
+		for name in ArrayState.FLEET_ARRAYS:
+			setattr(self, name, getattr(state, name)[i:i+1].copy())
+		self.owners = state.owners
+		self.planet_views = state.planet_views
+
+
+class ArrayState():
+
+	''' Planet and fleet state held in NumPy arrays (one array per field).
+		Owners are stored as an index into `owners`, neutral being 0.
+	'''
+
+	FLEET_ARRAYS = ('fx', 'fy', 'fx0', 'fy0', 'ft0', 'fvx', 'fvy', 'fships', 'fowner', 'fdest', 'fcx', 'fcy')
+
+	def __init__(self, game, capacity=64):
+		self.game = game
+		self.owners = [NEUTRAL_ID]
+		self._owner_index = {NEUTRAL_ID: 0}
+		self.planet_views = []
+		# fleets use the first n slots of the arrays (grown as needed)
+		self.n = 0
+		self.fleet_views = []
+		self.fx = np.zeros(capacity)
+		self.fy = np.zeros(capacity)
+		self.fx0 = np.zeros(capacity)  # launch position and tick
+		self.fy0 = np.zeros(capacity)
+		self.ft0 = np.zeros(capacity, np.int64)
+		self.fvx = np.zeros(capacity)  # per tick movement
+		self.fvy = np.zeros(capacity)
+		self.fships = np.zeros(capacity, np.int64)
+		self.fowner = np.zeros(capacity, np.int64)
+		self.fdest = np.zeros(capacity, np.int64)
+		self.fcx = np.zeros(capacity, np.int64)  # fleet_grid cell
+		self.fcy = np.zeros(capacity, np.int64)
+
+	def owner_index(self, owner):
+		i = self._owner_index.get(owner)
+		if i is None:
+			i = self._owner_index[owner] = len(self.owners)
+			self.owners.append(owner)
+		return i
+
+	def load_planets(self, planets_json):
+		''' Return a dict of new planet views, keyed by ID. '''
+		if isinstance(planets_json, PlanetColumns):
+			# straight from the cached map columns, with the defaults and scaling of `Entity`
+			n = len(planets_json)
+			IDs = [ID or new_id() for ID in planets_json.ID or [None] * n]
+			owners = [owner or NEUTRAL_ID for owner in planets_json.owner or [None] * n]
+			self.px = np.frombuffer(planets_json.x, dtype=float) * SCALE_FACTOR
+			self.py = np.frombuffer(planets_json.y, dtype=float) * SCALE_FACTOR
+			self.pships = np.array(planets_json.ships, dtype=np.int64)
+			self.pgrowth = np.array(planets_json.growth, dtype=np.int64)
+		else:
+			# use real planets to get the same defaults and scaling
+			planets = [Planet(p['x'], p['y'], p.get('ID'), p.get('owner'), p.get('ships'), p.get('growth'))
+					   for p in planets_json]
+			IDs = [p.ID for p in planets]
+			owners = [p.owner for p in planets]
+			self.px = np.array([p.x for p in planets], dtype=float)
+			self.py = np.array([p.y for p in planets], dtype=float)
+			self.pships = np.array([p.ships or 0 for p in planets], dtype=np.int64)
+			self.pgrowth = np.array([p.growth or 0 for p in planets], dtype=np.int64)
+		self.powner = np.array([self.owner_index(owner) for owner in owners], dtype=np.int64)
+		self.planet_views = [ArrayPlanet(self, i, ID) for i, ID in enumerate(IDs)]
+		return {p.ID: p for p in self.planet_views}
+
+	def new_fleet(self, ID, owner, ships, src, dest):
+		# a real fleet gives the exact same starting position and movement
+		return self._store(Fleet(ID, owner, ships, src, dest, tick=self.game.tick))
+
+	def load_fleet(self, fleet_json):
+		''' A new fleet view from its serialised form (see `Fleet.serialise`). '''
+		f = fleet_json
+		fleet = Fleet(f.get('ID'), f['owner'], f['ships'], dest=self.game.planets[f['dest']],
+					  x=f.get('x0', f['x']), y=f.get('y0', f['y']), tick=f.get('t0', self.game.tick))
+		fleet.update(self.game.tick)
+		return self._store(fleet)
+
+	def _store(self, fleet):
+		''' Copy a (plain) fleet into the next free slot, returning its view. '''
+		if self.n == len(self.fx):
+			for name in self.FLEET_ARRAYS:
+				old = getattr(self, name)
+				new = np.zeros(2 * len(old), old.dtype)
+				new[:len(old)] = old
+				setattr(self, name, new)
+		i = self.n
+		self.n += 1
+		cell_size = self.game.fleet_grid.cell_size
+		self.fx[i] = fleet.x
+		self.fy[i] = fleet.y
+		self.fx0[i] = fleet.x0
+		self.fy0[i] = fleet.y0
+		self.ft0[i] = fleet.t0
+		self.fvx[i] = fleet.vx
+		self.fvy[i] = fleet.vy
+		self.fships[i] = fleet.ships
+		self.fowner[i] = self.owner_index(fleet.owner)
+		self.fdest[i] = fleet.dest._i
+		self.fcx[i] = math.floor(fleet.x / cell_size)
+		self.fcy[i] = math.floor(fleet.y / cell_size)
+		view = ArrayFleet(self, i, fleet.ID)
+		self.fleet_views.append(view)
+		return view
+
+	def remove_fleet(self, fleet):
+		''' Free the slot of fleet, moving the last fleet into it. '''
+		i = fleet._i
+		fleet._state = _DetachedFleet(self, i)
+		fleet._i = 0
+		last = self.n - 1
+		if i != last:
+			for name in self.FLEET_ARRAYS:
+				a = getattr(self, name)
+				a[i] = a[last]
+			moved = self.fleet_views[i] = self.fleet_views[last]
+			moved._i = i
+		self.fleet_views.pop()
+		self.n = last
+
+	def grow_planets(self, ticks=1):
+		owned = self.powner != 0
+		self.pships[owned] += self.pgrowth[owned] * ticks
+
+	def move_fleets(self, tick):
+		''' Bring the position of every fleet (and the fleet grid) up to tick. '''
+		n = self.n
+		steps = tick - self.ft0[:n]
+		fx = self.fx[:n]
+		fy = self.fy[:n]
+		np.add(self.fx0[:n], self.fvx[:n] * steps, out=fx)
+		np.add(self.fy0[:n], self.fvy[:n] * steps, out=fy)
+		# only fleets that changed cell need to move in the fleet grid
+		grid = self.game.fleet_grid
+		cx = np.floor(fx / grid.cell_size).astype(np.int64)
+		cy = np.floor(fy / grid.cell_size).astype(np.int64)
+		for i in np.flatnonzero((cx != self.fcx[:n]) | (cy != self.fcy[:n])):
+			grid.move(self.fleet_views[i])
+		self.fcx[:n] = cx
+		self.fcy[:n] = cy
+
+	def resolve_arrivals(self, fleets):
+		''' Remove the arrived fleets and settle the owner and ships of each
+			planet they arrived at. Yields (planet, outcome) for each of those
+			planets, where outcome is one of 'reinforced', 'defended' or
+			'captured'.
+		'''
+		if len(fleets) == 0:
+			return
+		arrived = np.sort(np.array([f._i for f in fleets], dtype=np.int64))
+		dest = self.fdest[arrived]
+		planets = np.unique(dest)
+		# one force per (planet, owner), including the current occupier
+		owner_count = len(self.owners)
+		force_planet = np.concatenate((planets, dest))
+		force_owner = np.concatenate((self.powner[planets], self.fowner[arrived]))
+		force_ships = np.concatenate((self.pships[planets], self.fships[arrived]))
+		keys, inverse = np.unique(force_planet * owner_count + force_owner, return_inverse=True)
+		force = np.zeros(len(keys), np.int64)
+		np.add.at(force, inverse, force_ships)
+		force_planet = keys // owner_count
+		force_owner = keys % owner_count
+		# strongest force of each planet first
+		order = np.lexsort((-force, force_planet))
+		force_planet = force_planet[order]
+		force_owner = force_owner[order]
+		force = force[order]
+		first = np.searchsorted(force_planet, planets)
+		battle = np.diff(np.append(first, len(force))) > 1
+		second = np.where(battle, force[np.minimum(first + 1, len(force) - 1)], 0)
+		gap = force[first] - second
+		old_owner = self.powner[planets]
+		# if the planet winds up on 0, it stays with the current owner
+		winner = np.where(battle & (gap == 0), old_owner, force_owner[first])
+
+		for i in arrived[::-1]:
+			self.game._remove_fleet(self.fleet_views[i])
+		self.powner[planets] = winner
+		self.pships[planets] = gap
+
+		for p, is_battle, was, now in zip(planets.tolist(), battle.tolist(), old_owner.tolist(), winner.tolist()):
+			if not is_battle:
+				outcome = 'reinforced'
+			elif now == was:
+				outcome = 'defended'
+			else:
+				outcome = 'captured'
+			yield self.planet_views[p], outcome
@@ -0,0 +1 @@
+# this files has nothing, but makes the directory a python module
\ No newline at end of file
@@ -0,0 +1,98 @@
+""" Memory and throughput of fleet entities
+
+Compares the current (`__slots__`) `Fleet` against `LegacyFleet`, a copy of
+the previous dict-based implementation (uuid1 IDs, trig every tick, vision
+range recomputed for every check). Run from the repository root:
+
+	python -m benchmarks.entity_memory --fleets 20000 --ticks 50
+
+or as a script (python benchmarks/entity_memory.py ...).
+"""
+import argparse
+import math
+import pathlib
+import sys
+import time
+import tracemalloc
+import uuid
+
+# the repository root, for the game modules when run as a script
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from entities import Planet, Fleet, FLEET_SPEED, SCALE_FACTOR
+
+
+class LegacyFleet():
+
+	''' The fleet as it was before entities used __slots__. '''
+
+	def __init__(self, ID=None, owner=None, ships=None, src=None, dest=None):
+		self.ID = ID or str(uuid.uuid1())
+		self.x = (src.x/SCALE_FACTOR)*SCALE_FACTOR
+		self.y = (src.y/SCALE_FACTOR)*SCALE_FACTOR
+		self.ships = ships
+		self.owner = owner
+		self.vision_age = 0
+		self.dest = dest
+		self.heading = math.atan2((self.dest.y-self.y),(self.dest.x-self.x))
+
+	def vision_range(self):
+		return 50+self.ships*2.5
+
+	def update(self, tick=None):
+		# moves one step every call, whatever the tick
+		self.x += math.cos(self.heading) * FLEET_SPEED
+		self.y += math.sin(self.heading) * FLEET_SPEED
+
+
+def measure(cls, count, ticks, src, dest):
+	''' Returns (bytes per fleet, µs to create one, µs per fleet update,
+		µs per squared vision range lookup).
+	'''
+	tracemalloc.start()
+	before = tracemalloc.get_traced_memory()[0]
+	start = time.perf_counter()
+	fleets = [cls(None, '1', 10 + i % 100, src, dest) for i in range(count)]
+	create = time.perf_counter() - start
+	size = tracemalloc.get_traced_memory()[0] - before
+	tracemalloc.stop()
+
+	start = time.perf_counter()
+	# fleets start at tick 0, so tick t is t steps along
+	for t in range(1, ticks + 1):
+		for f in fleets:
+			f.update(t)
+	update = time.perf_counter() - start
+
+	start = time.perf_counter()
+	if hasattr(cls, 'vision_range_sq'):
+		for _ in range(ticks):
+			for f in fleets:
+				f.vision_range_sq()
+	else:
+		for _ in range(ticks):
+			for f in fleets:
+				f.vision_range()**2
+	vision = time.perf_counter() - start
+	# the list itself is the same for both, don't count it
+	size -= fleets.__sizeof__()
+	return size / count, create / count * 1e6, update / (count * ticks) * 1e6, vision / (count * ticks) * 1e6
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Fleet entity memory/throughput benchmark.")
+	parser.add_argument("--fleets", type=int, default=20000, help="Number of fleets to create.")
+	parser.add_argument("--ticks", type=int, default=50, help="Number of updates of every fleet.")
+	args = parser.parse_args()
+
+	src = Planet(0.1, 0.1, 'src', '1', 100, 2)
+	dest = Planet(0.9, 0.7, 'dest', '0', 100, 2)
+	print("%d fleets, %d ticks, Python %s" % (args.fleets, args.ticks, sys.version.split()[0]))
+	print("%-12s %14s %14s %14s %14s" % ("", "bytes/fleet", "create (us)", "update (us)", "vision^2 (us)"))
+	results = {}
+	for cls in (LegacyFleet, Fleet):
+		results[cls] = measure(cls, args.fleets, args.ticks, src, dest)
+		print("%-12s %14.1f %14.3f %14.3f %14.3f" % ((cls.__name__,) + results[cls]))
+	legacy, current = results[LegacyFleet], results[Fleet]
+	print("%-12s %13.0f%% %13.0f%% %13.0f%% %13.0f%%" % (("saving",) + tuple(
+		100 * (1 - c / l) for l, c in zip(legacy, current))))
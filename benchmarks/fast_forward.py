@@ -0,0 +1,64 @@
+""" Fast-forward vs tick-by-tick games
+
+Plays the same games with and without `fast_forward` (see `PlanetWarsGame`)
+and reports the wall time, the number of `update` calls and whether the games
+ended the same way. Only bots that sleep (see `Player.sleep_until`) let a game
+skip ticks; OneSlowMove, which never sleeps, is included to show it still
+plays every tick. Run from the repository root:
+
+	python -m benchmarks.fast_forward --maps map010 map050 --max-ticks 1000
+"""
+import argparse
+import json
+import pathlib
+import random
+import time
+
+from planet_wars import PlanetWarsGame
+from entities import NEUTRAL_ID
+
+MAPS_DIR = pathlib.Path(__file__).parent.parent.joinpath('maps')
+
+MATCHUPS = (
+	('Blanko', 'Blanko'),
+	('OneSleepyMove', 'Blanko'),
+	('OneSleepyMove', 'OneSleepyMove'),
+	('OneSlowMove', 'Blanko'),
+)
+
+
+def play(map_name, bots, max_ticks, fast_forward, seed=0):
+	''' Returns (wall time, update calls, final tick, final planet owners/ships). '''
+	random.seed(seed)
+	with open(MAPS_DIR.joinpath(map_name + '.json'), 'r') as f:
+		gamestate = json.loads(f.read())
+	gamestate['players'] = [{'ID': str(i + 1), 'name': name} for i, name in enumerate(bots)]
+	gamestate['max_ticks'] = max_ticks
+	game = PlanetWarsGame(gamestate, fast_forward=fast_forward)
+	game.paused = False
+	updates = 0
+	start = time.perf_counter()
+	while game.is_alive() and game.tick < game.max_ticks:
+		game.update()
+		updates += 1
+	elapsed = time.perf_counter() - start
+	# planet IDs may be random, so identify planets by position
+	planets = sorted((p.x, p.y, p.owner, p.ships) for p in game.planets.values() if p.owner != NEUTRAL_ID)
+	return elapsed, updates, game.tick, planets
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Fast-forward benchmark.")
+	parser.add_argument("--maps", nargs="+", default=["map010"], help="Maps (no extension) to play on.")
+	parser.add_argument("--max-ticks", type=int, default=1000, help="Tick limit of each game.")
+	args = parser.parse_args()
+
+	print("%-8s %-30s %10s %10s %8s %8s %8s %6s" % (
+		"map", "players", "tick (s)", "ff (s)", "updates", "ff upd.", "speedup", "same"))
+	for map_name in args.maps:
+		for bots in MATCHUPS:
+			slow = play(map_name, bots, args.max_ticks, False)
+			fast = play(map_name, bots, args.max_ticks, True)
+			print("%-8s %-30s %10.3f %10.3f %8d %8d %7.1fx %6s" % (
+				map_name, " v ".join(bots), slow[0], fast[0], slow[1], fast[1],
+				slow[0] / max(fast[0], 1e-9), slow[2:] == fast[2:]))
@@ -0,0 +1,193 @@
+""" Engine benchmark suite
+
+Plays a fixed set of headless games (bundled maps from 5 to 604 planets, the
+bundled bots and `Flood`, a bot that gives lots of orders every tick) with
+fixed seeds, and reports for each:
+
+ - ticks per second
+ - per tick latency percentiles (p50/p95/p99/max, in ms)
+ - peak RSS of the process that played it (each game gets a fresh one)
+ - bytes allocated per tick (mean peak traced by tracemalloc over a second,
+   shorter, run of the same game, as tracing slows everything down)
+
+Results are saved as JSON, so runs can be compared. Run from the repository
+root:
+
+	python -m benchmarks.suite run -o before.json
+	... change things ...
+	python -m benchmarks.suite run -o after.json
+	python -m benchmarks.suite compare before.json after.json --threshold 10
+
+`compare` lists every metric that got worse by more than the threshold (in
+percent) and exits with status 1 if there were any.
+"""
+import argparse
+import json
+import multiprocessing
+import pathlib
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+MAPS_DIR = pathlib.Path(__file__).parent.parent.joinpath('maps')
+
+MAPS = ('map001', 'map010', 'map030', 'map026', 'map058', 'map050')  # 5 to 604 planets
+PLAYERS = (
+	('Blanko', 'Blanko'),
+	('OneSlowMove', 'Blanko'),
+	('Flood', 'Flood'),
+)
+SEED = 1
+
+# metric -> True if bigger is better
+METRICS = {
+	'ticks_per_sec': True,
+	'p50_ms': False,
+	'p95_ms': False,
+	'p99_ms': False,
+	'peak_rss_kib': False,
+	'alloc_bytes_per_tick': False,
+}
+
+
+def new_game(map_name, players, ticks, backend, seed):
+	from planet_wars import PlanetWarsGame
+	import entities
+	random.seed(seed)
+	# fleet IDs too, so that every run is the same game
+	entities._id_random.seed(seed)
+	with open(MAPS_DIR.joinpath(map_name + '.json'), 'r') as f:
+		gamestate = json.loads(f.read())
+	gamestate['players'] = [{'ID': str(i + 1), 'name': name} for i, name in enumerate(players)]
+	gamestate['max_ticks'] = ticks
+	game = PlanetWarsGame(gamestate, backend=backend)
+	game.paused = False
+	return game
+
+
+def peak_rss_kib():
+	''' Peak resident set size of this process, or None where unknown. '''
+	try:
+		import resource
+	except ImportError:
+		return None  # Windows
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# bytes on macOS, KiB elsewhere
+	return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def run_case(case):
+	''' Play one case and return its metrics. Runs in its own process. '''
+	from profiler import percentile
+	game = new_game(case['map'], case['players'], case['ticks'], case['backend'], case['seed'])
+	latencies = []
+	start = time.perf_counter()
+	while game.is_alive() and game.tick < game.max_ticks:
+		t = time.perf_counter()
+		game.update()
+		latencies.append(time.perf_counter() - t)
+	elapsed = time.perf_counter() - start
+	ticks = game.tick
+	result = {
+		'ticks': ticks,
+		'ticks_per_sec': ticks / elapsed if elapsed else None,
+		'p50_ms': percentile(latencies, 50) * 1000,
+		'p95_ms': percentile(latencies, 95) * 1000,
+		'p99_ms': percentile(latencies, 99) * 1000,
+		'max_ms': max(latencies, default=0) * 1000,
+		'peak_rss_kib': peak_rss_kib(),
+	}
+
+	# same game again, with allocations traced
+	game = new_game(case['map'], case['players'], case['alloc_ticks'], case['backend'], case['seed'])
+	tracemalloc.start()
+	allocated = []
+	while game.is_alive() and game.tick < game.max_ticks:
+		tracemalloc.reset_peak()
+		before = tracemalloc.get_traced_memory()[0]
+		game.update()
+		allocated.append(tracemalloc.get_traced_memory()[1] - before)
+	tracemalloc.stop()
+	result['alloc_bytes_per_tick'] = sum(allocated) / len(allocated) if allocated else None
+	return result
+
+
+def run_suite(maps, players, ticks, alloc_ticks, backend, seed):
+	cases = [{
+		'map': map_name,
+		'players': list(names),
+		'ticks': ticks,
+		'alloc_ticks': alloc_ticks,
+		'backend': backend,
+		'seed': seed
+	} for map_name in maps for names in players]
+	results = {}
+	# a new process per case, so peak RSS is that case's alone
+	with multiprocessing.get_context('spawn').Pool(1, maxtasksperchild=1) as pool:
+		for case in cases:
+			name = "%s/%s" % (case['map'], "-".join(case['players']))
+			result = pool.apply(run_case, (case,))
+			results[name] = result
+			print("%-32s %8d ticks %10.1f ticks/s  p95 %8.3f ms  rss %8s KiB  %10.0f B/tick" % (
+				name, result['ticks'], result['ticks_per_sec'] or 0, result['p95_ms'],
+				result['peak_rss_kib'], result['alloc_bytes_per_tick'] or 0))
+	return {
+		'python': sys.version.split()[0],
+		'platform': platform.platform(),
+		'backend': backend,
+		'seed': seed,
+		'ticks': ticks,
+		'cases': results
+	}
+
+
+def compare(base, new, threshold):
+	''' Return a line for each metric of each case that is more than
+		threshold percent worse in new than in base.
+	'''
+	regressions = []
+	for name, old in base['cases'].items():
+		if name not in new['cases']:
+			continue
+		for metric, bigger_is_better in METRICS.items():
+			a, b = old.get(metric), new['cases'][name].get(metric)
+			if not a or b is None:
+				continue
+			change = (b - a) / a * 100
+			if (-change if bigger_is_better else change) > threshold:
+				regressions.append("%-32s %-22s %12.3f -> %12.3f (%+.1f%%)" % (name, metric, a, b, change))
+	return regressions
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="PlanetWars engine benchmark suite.")
+	commands = parser.add_subparsers(dest="command", required=True)
+	run = commands.add_parser("run", help="Run the suite and save the results.")
+	run.add_argument("-o", "--out", default="benchmark.json", help="JSON file to save the results to.")
+	run.add_argument("--maps", nargs="+", default=MAPS, help="Maps (no extension) to play on.")
+	run.add_argument("--ticks", type=int, default=300, help="Ticks to play per game.")
+	run.add_argument("--alloc-ticks", type=int, default=50, help="Ticks to play with allocations traced.")
+	run.add_argument("--backend", choices=["objects", "arrays"], default="objects", help="Game state backend.")
+	run.add_argument("--seed", type=int, default=SEED, help="Random seed of every game.")
+	cmp = commands.add_parser("compare", help="Compare two saved runs.")
+	cmp.add_argument("base", help="Results of the earlier run.")
+	cmp.add_argument("new", help="Results of the later run.")
+	cmp.add_argument("--threshold", type=float, default=10, help="Percent a metric can get worse before it is flagged.")
+	args = parser.parse_args()
+
+	if args.command == "run":
+		results = run_suite(args.maps, PLAYERS, args.ticks, args.alloc_ticks, args.backend, args.seed)
+		with open(args.out, 'w') as f:
+			json.dump(results, f, indent=1)
+	else:
+		with open(args.base, 'r') as f:
+			base = json.load(f)
+		with open(args.new, 'r') as f:
+			new = json.load(f)
+		regressions = compare(base, new, args.threshold)
+		for line in regressions:
+			print(line)
+		print("%d regressions beyond %g%%" % (len(regressions), args.threshold))
+		sys.exit(1 if regressions else 0)
@@ -43,8 +43,15 @@ There is also a player specific log if you want to leave a message
 
 	gameinfo.log("Here's a message from the bot")
 
+Your bot is updated every game tick. If it has nothing to do for a while it
+can say so, which lets a fast-forward game skip ahead (see planet_wars.py)
+
+	gameinfo.sleep_until(tick)  # next update at game tick `tick`
+	gameinfo.sleep_until_event()  # next update after fleets arrive somewhere
+
 '''
 
 class Blanko(object):
 	def update(self, gameinfo):
-		pass
\ No newline at end of file
+		# nothing to do, and nothing will change that
+		gameinfo.sleep_until_event()
\ No newline at end of file
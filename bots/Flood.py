@@ -0,0 +1,20 @@
+import random
+
+
+class Flood(object):
+	''' Synthetic load for benchmarks (see benchmarks/suite.py): every tick,
+		each of its planets with ships to spare sends half of them to a random
+		planet it doesn't own, and some of its fleets are split and diverted.
+		Uses the global `random`, so a seeded game plays the same each time.
+	'''
+
+	def update(self, gameinfo):
+		targets = list(gameinfo._not_my_planets().values())
+		if not targets:
+			return
+		for planet in gameinfo._my_planets().values():
+			if planet.ships > 1:
+				gameinfo.planet_order(planet, random.choice(targets), planet.ships // 2)
+		for fleet in gameinfo._my_fleets().values():
+			if fleet.ships > 1 and random.random() < 0.1:
+				gameinfo.fleet_order(fleet, random.choice(targets), fleet.ships // 2)
@@ -0,0 +1,18 @@
+class OneSleepyMove(object):
+	''' Sends all the ships of its first planet to the first planet it doesn't
+		own, then sleeps until fleets arrive somewhere (or for at most
+		`MAX_SLEEP` ticks). Shows a bot that plays well with fast-forward.
+	'''
+
+	MAX_SLEEP = 50
+
+	def update(self, gameinfo):
+		mine = gameinfo._my_planets()
+		others = gameinfo._not_my_planets()
+		if mine and others:
+			src = list(mine.values())[0]
+			dest = list(others.values())[0]
+			if src.ships > 0:
+				gameinfo.planet_order(src, dest, src.ships)
+		gameinfo.sleep_until(gameinfo.tick + self.MAX_SLEEP)
+		gameinfo.sleep_until_event()
@@ -0,0 +1,80 @@
+""" Consistency check of the facades sent to sandboxed bots
+
+Checks that `_FacadeDelta` (see sandbox.py) sends a bot's worker everything
+that changed in its facade. Plays a game in-process and, every tick, sends
+each player's facade the way `SandboxScheduler` sends it to the worker (a
+`_FacadeDelta` message, pickled as the pipe does, applied by
+`_apply_facade`) into a copy of the facade, as a worker holds it. Every
+planet and fleet of the copy must match the player's own facade,
+`vision_age` included. Exits with status 1 if any tick differs.
+
+Example:
+	python check_sandbox_facades.py --map map022 --ticks 120
+"""
+import argparse
+import pickle
+import random
+import sys
+
+from planet_wars import PlanetWarsGame
+from players import Player
+from entities import NEUTRAL_ID
+from map_cache import load_map
+from sandbox import _FacadeDelta, _apply_facade
+
+PLANET_FIELDS = ('owner', 'ships', 'x', 'y', 'growth', 'vision_age')
+FLEET_FIELDS = ('owner', 'ships', 'x', 'y', 'vx', 'vy', 'x0', 'y0', 't0', 'dest_id', 'vision_age')
+
+
+def differences(facade, copy):
+	''' What differs between the planets/fleets of facade and copy. '''
+	found = []
+	for kind, fields in (('planets', PLANET_FIELDS), ('fleets', FLEET_FIELDS)):
+		ours, theirs = getattr(facade, kind), getattr(copy, kind)
+		if list(ours) != list(theirs):
+			found.append("%s IDs differ" % kind)
+			continue
+		for ID, entity in ours.items():
+			for field in fields:
+				if getattr(entity, field) != getattr(theirs[ID], field):
+					found.append("%s %s %s: %r != %r" % (kind, ID, field, getattr(entity, field), getattr(theirs[ID], field)))
+	return found
+
+
+def check(map_name, bots, ticks, seed=0):
+	''' Returns the number of (player, tick) facades that differed. '''
+	random.seed(seed)
+	gamestate = load_map(map_name)
+	gamestate['players'] = [{'ID': str(i + 1), 'name': name} for i, name in enumerate(bots)]
+	game = PlanetWarsGame(gamestate)
+	players = [player for player in game.players.values() if player.ID != NEUTRAL_ID]
+	deltas = {player.ID: _FacadeDelta(player) for player in players}
+	# as the workers hold them (with no bot to run)
+	copies = {player.ID: Player(player.ID, player.name, controller=object()) for player in players}
+	failed = 0
+	for _ in range(ticks):
+		for player in players:
+			message = deltas[player.ID].facade(game.tick)
+			_apply_facade(copies[player.ID], *pickle.loads(pickle.dumps(message)))
+			deltas[player.ID].sent(message)
+			found = differences(player, copies[player.ID])
+			if found:
+				failed += 1
+				print("tick %d, player %s: %d differences, e.g. %s" % (game.tick, player.name, len(found), found[0]))
+		if not game.is_alive():
+			break
+		game.update(manual=True)
+	return failed
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Checks sandboxed bots are sent the same facades as in-process ones.")
+	parser.add_argument("--map", default="map022", help="Map to play on.")
+	parser.add_argument("-p", "--players", nargs="+", default=["OneSlowMove", "Blanko"], help="Bots to play.")
+	parser.add_argument("--ticks", type=int, default=120, help="Ticks to check.")
+	parser.add_argument("--seed", type=int, default=0, help="Random seed of the game.")
+	args = parser.parse_args()
+
+	failed = check(args.map, args.players, args.ticks, args.seed)
+	print("%d facades differed" % failed if failed else "facades match")
+	sys.exit(1 if failed else 0)
@@ -10,13 +10,28 @@ planets create new ships (based on their `growth_rate`).
 Fleets are launched from a planet (or fleet) and sent to a target planet.
 Fleets are always owned by one of the players.
 
+Entities use `__slots__` (there can be a lot of fleets in flight) and cache
+what doesn't change from tick to tick: a fleet's per tick movement, and the
+squared vision range of an entity until its number of ships changes.
+
 """
 import math
-import uuid
+import random
 
 NEUTRAL_ID = '0'
 FLEET_SPEED = 20
 SCALE_FACTOR = 1000
+# a planet's radius is (growth+1) times this: fleets arrive once inside it (and it is drawn that size)
+PLANET_RADIUS_FACTOR = 12
+
+# not the global `random`, so making IDs doesn't disturb seeded bots/games
+_id_random = random.Random()
+
+
+def new_id():
+	''' A new random (and so deliberately meaningless) entity ID. '''
+	return '%016x' % _id_random.getrandbits(64)
+
 
 class Entity():
 
@@ -25,11 +40,13 @@ class Entity():
 		See Fleet and Planet classes.
 	'''
 
+	__slots__ = ('ID', 'x', 'y', 'ships', 'owner', 'vision_age', '_vision_ships', '_vision_range_sq')
+
 	def __init__(self, x, y, ID=None, owner=None, ships=0):
 		if ID:
 			self.ID = ID
 		else:
-			self.ID = str(uuid.uuid1())
+			self.ID = new_id()
 
 		self.x = x*SCALE_FACTOR
 		self.y = y*SCALE_FACTOR
@@ -39,6 +56,7 @@ class Entity():
 		else:
 			self.owner = NEUTRAL_ID
 		self.vision_age = 0
+		self._vision_ships = None
 		# self._name = "%s:%s" % (type(self).__name__, str(id))
 
 
@@ -76,12 +94,21 @@ class Entity():
 	def update(self):
 		raise NotImplementedError("This method cannot be called on this 'abstract' class")
 
+	def vision_range_sq(self):
+		''' The square of `vision_range()` (for comparing with `distance_to`).
+			Cached until the number of ships changes.
+		'''
+		if self._vision_ships != self.ships:
+			self._vision_range_sq = self.vision_range()**2
+			self._vision_ships = self.ships
+		return self._vision_range_sq
+
 	def is_in_vision(self):
 		return self.vision_age == 0
 
 	def in_range(self, entities):
 		''' Returns a list of entity id's that are within vision range of this entity.'''
-		limit = self.vision_range()
+		limit = self.vision_range_sq()
 		return [p.ID for p in entities if self.distance_to(p) <= limit]
 
 	def __str__(self):
@@ -105,14 +132,18 @@ class Planet(Entity):
 		to the growth rate (size).
 	'''
 
+	__slots__ = ('growth',)
+
 	def __init__(self, x, y, ID=None, owner=None, ships=None, growth=1):
 		super().__init__(x, y, ID, owner, ships)
 		self.growth = growth
 
-	def update(self):
-		''' If the planet is owned, grow the number of ships (advancement). '''
+	def update(self, ticks=1):
+		''' If the planet is owned, grow the number of ships (advancement) by
+			`ticks` game steps worth.
+		'''
 		if self.owner != NEUTRAL_ID:
-			self.add_ships(self.growth)
+			self.add_ships(self.growth * ticks)
 
 	def vision_range(self):
 		return 100+50*self.growth+self.ships
@@ -125,21 +156,29 @@ class Planet(Entity):
 class Fleet(Entity):
 	''' A fleet in the game world. Each fleet is owned by a player and launched
 		from either a planet or a fleet (mid-flight). All fleets move at the
-		same speed each game step.
+		same speed each game step, in a straight line, so the position at any
+		tick follows from where (x0, y0) and when (t0) the fleet was launched.
+		`x` and `y` are only brought up to date when `update` is called.
 
-		Fleet id values are deliberately obscure (using UUID) to remove any
-		possible value an enemy players might gather from it.
+		Fleet id values are deliberately obscure (random, see `new_id`) to
+		remove any possible value an enemy players might gather from it.
 	'''
 
+	__slots__ = ('dest', 'vx', 'vy', 'x0', 'y0', 't0')
 
-	def __init__(self, ID=None, owner=None, ships=None, src=None, dest=None, x=None, y=None):
+	def __init__(self, ID=None, owner=None, ships=None, src=None, dest=None, x=None, y=None, tick=0):
 		super().__init__(
-			x or src.x/SCALE_FACTOR,
-			y or src.y/SCALE_FACTOR,
+			x if x is not None else src.x/SCALE_FACTOR,
+			y if y is not None else src.y/SCALE_FACTOR,
 			ID, owner, ships)
 		self.dest = dest
-		# we cache heading because it is unlikely to change from tick to tick
-		self.heading = math.atan2((self.dest.y-self.y),(self.dest.x-self.x))
+		self.x0 = self.x
+		self.y0 = self.y
+		self.t0 = tick
+		# fleets fly straight, so the movement per tick never changes
+		heading = math.atan2((self.dest.y-self.y),(self.dest.x-self.x))
+		self.vx = math.cos(heading) * FLEET_SPEED
+		self.vy = math.sin(heading) * FLEET_SPEED
 
 	# def in_range(self, entities, ignoredest=True):
 	# 	result = super(Fleet, self).in_range(entities)
@@ -147,14 +186,123 @@ class Fleet(Entity):
 	# 		result.append(self.dest)
 	# 	return result
 
+	@property
+	def heading(self):
+		return math.atan2(self.vy, self.vx)
+
 	def vision_range(self):
 		return 50+self.ships*2.5
 
-	def update(self):
-		''' Move the fleet (progress) by one game time step.'''
-		# update position
-		self.x += math.cos(self.heading) * FLEET_SPEED
-		self.y += math.sin(self.heading) * FLEET_SPEED
+	def position_at(self, tick):
+		''' Where the fleet is at game tick (in game units). '''
+		steps = tick - self.t0
+		return self.x0 + self.vx * steps, self.y0 + self.vy * steps
+
+	def update(self, tick):
+		''' Move the fleet to where it is at game tick. '''
+		self.x, self.y = self.position_at(tick)
 
 	def serialise(self):
-		return super().serialise()
\ No newline at end of file
+		serial = super().serialise()
+		# enough to put the fleet back exactly where it was headed
+		serial['dest'] = self.dest.ID
+		serial['x0'] = self.x0/SCALE_FACTOR
+		serial['y0'] = self.y0/SCALE_FACTOR
+		serial['t0'] = self.t0
+		return serial
+
+class _Snapshot():
+
+	''' Mixin for read-only copies of entities, as held in a player facade.
+
+		A snapshot copies the entity's plain fields once and is then reused
+		by the game for as long as the observable fields (`owner`, `ships`
+		and position) of the real entity stay the same. Only `vision_age`,
+		which the game maintains, (and private caches) can be changed after
+		creation.
+	'''
+
+	__slots__ = ()
+
+	def __setattr__(self, name, value):
+		if name != 'vision_age' and not name.startswith('_'):
+			raise AttributeError("%s is a read-only snapshot (can't set %s)" % (self.ID, name))
+		object.__setattr__(self, name, value)
+
+	def _copy_fields(self, **fields):
+		for name, value in fields.items():
+			object.__setattr__(self, name, value)
+
+	def __getstate__(self):
+		# the set slots, read straight from their descriptors, for pickling
+		# (e.g. to a sandboxed bot, see sandbox.py). A fleet's `_planets` is
+		# left for the receiver to point at its own copy of the facade.
+		state = {}
+		for cls in type(self).__mro__:
+			for name in cls.__dict__.get('__slots__', ()):
+				if name == '_planets':
+					continue
+				try:
+					state[name] = cls.__dict__[name].__get__(self, cls)
+				except AttributeError:
+					pass
+		return state
+
+	def __setstate__(self, state):
+		self._copy_fields(**state)
+
+	def matches(self, entity):
+		''' True if this snapshot still shows the current state of entity. '''
+		return (self.ships == entity.ships and self.owner == entity.owner
+				and self.x == entity.x and self.y == entity.y)
+
+
+class PlanetSnapshot(_Snapshot, Planet):
+
+	''' Read-only copy of a `Planet`. '''
+
+	__slots__ = ()
+
+	def __init__(self, planet):
+		self._copy_fields(
+			ID=planet.ID,
+			owner=planet.owner,
+			ships=planet.ships,
+			x=planet.x,
+			y=planet.y,
+			growth=planet.growth,
+			vision_age=0,
+			_vision_ships=None
+		)
+
+
+class FleetSnapshot(_Snapshot, Fleet):
+
+	''' Read-only copy of a `Fleet`. Rather than copying the destination,
+		`dest` looks up the planet in the facade the snapshot belongs to, so
+		it is always the owning player's current view of that planet.
+	'''
+
+	__slots__ = ('dest_id', '_planets')
+
+	def __init__(self, fleet, planets):
+		self._copy_fields(
+			ID=fleet.ID,
+			owner=fleet.owner,
+			ships=fleet.ships,
+			x=fleet.x,
+			y=fleet.y,
+			vx=fleet.vx,
+			vy=fleet.vy,
+			x0=fleet.x0,
+			y0=fleet.y0,
+			t0=fleet.t0,
+			dest_id=fleet.dest.ID,
+			_planets=planets,
+			vision_age=0,
+			_vision_ships=None
+		)
+
+	@property
+	def dest(self):
+		return self._planets[self.dest_id]
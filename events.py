@@ -0,0 +1,210 @@
+"""Structured game events for PlanetWars
+
+Rather than formatting a line of text for everything that happens, the game
+emits typed event records to `game.events`, an `EventStream`. A record is
+only built if something has subscribed to its kind, so a game nobody is
+listening to pays one dict lookup per would-be event.
+
+Records are named tuples (so cheap to make, and easy to turn into rows):
+
+ - `Launch` a fleet is launched from a planet or fleet
+ - `Reinforce` fleets arrive at a planet of their owner
+ - `Battle` fleets arrive at a planet and its owner holds it
+ - `Capture` fleets arrive at a planet and it changes hands
+ - `InvalidOrder` an order is ignored, or cut down to the ships available
+
+Sinks are callables taking a record. Those here are:
+
+ - `RingBuffer` keeps the last `size` records in memory
+ - `JsonlWriter` writes one JSON object per record, a buffer at a time
+ - `NpzExporter` collects a column per field of each kind of record and
+   saves them as a NumPy .npz (e.g. "launch.ships"), for analysis
+ - `TextLog` formats records as the lines the game used to log, for the
+   older `--logscript` loggers
+
+	game.events.subscribe(RingBuffer(1000))  # every kind of event
+	game.events.subscribe(JsonlWriter('events.jsonl'), Launch.kind, Capture.kind)
+
+"""
+import collections
+import json
+
+
+class Launch(collections.namedtuple('Launch', 'tick player source_type source fleet planet ships left')):
+	__slots__ = ()
+	kind = 'launch'
+
+
+class Reinforce(collections.namedtuple('Reinforce', 'tick player planet ships')):
+	__slots__ = ()
+	kind = 'reinforce'
+
+
+class Battle(collections.namedtuple('Battle', 'tick player planet ships')):
+	''' The owner (`player`) of a planet defended it, and has ships left. '''
+	__slots__ = ()
+	kind = 'battle'
+
+
+class Capture(collections.namedtuple('Capture', 'tick player previous planet ships')):
+	''' `player` took planet from `previous`, and has ships left on it. '''
+	__slots__ = ()
+	kind = 'capture'
+
+
+class InvalidOrder(collections.namedtuple('InvalidOrder', 'tick player reason order_type source destination ships ignored')):
+	''' An order with a problem (`reason`, one of REASONS). Orders asking for
+		too many ships are still carried out with what there is, the rest
+		are `ignored`.
+	'''
+	__slots__ = ()
+	kind = 'invalid_order'
+
+	REASONS = {
+		'bad_source': "not a valid source.",
+		'bad_destination': "not a valid destination.",
+		'not_owner': "player does not own source!",
+		'too_many_ships': "not enough ships. Max used.",
+		'no_ships': "no ships to launch.",
+		'fleet_id_taken': "new fleet ID already in use.",
+	}
+
+
+RECORDS = (Launch, Reinforce, Battle, Capture, InvalidOrder)
+
+
+class EventStream():
+
+	''' Passes each event record to the sinks subscribed to its kind. '''
+
+	def __init__(self):
+		self._sinks = {}  # kind -> [sink]
+
+	def subscribe(self, sink, *kinds):
+		''' Send events of kinds (by default, every kind) to sink. '''
+		for kind in kinds or [record.kind for record in RECORDS]:
+			self._sinks.setdefault(kind, []).append(sink)
+
+	def unsubscribe(self, sink):
+		for kind, sinks in list(self._sinks.items()):
+			if sink in sinks:
+				sinks.remove(sink)
+			if not sinks:
+				del self._sinks[kind]
+
+	def wants(self, kind):
+		''' True if something is subscribed to kind, so a record is worth making. '''
+		return kind in self._sinks
+
+	def emit(self, record):
+		for sink in self._sinks.get(record.kind, ()):
+			sink(record)
+
+	def close(self):
+		''' Close every sink that can be closed (e.g. to flush files). '''
+		closed = set()
+		for sinks in self._sinks.values():
+			for sink in sinks:
+				if id(sink) not in closed and hasattr(sink, 'close'):
+					closed.add(id(sink))
+					sink.close()
+
+
+class RingBuffer(collections.deque):
+
+	''' The last `size` records, oldest first. '''
+
+	def __init__(self, size=10000):
+		super().__init__(maxlen=size)
+
+	def __call__(self, record):
+		self.append(record)
+
+
+class JsonlWriter():
+
+	''' Writes each record as a JSON object (its fields, plus "event": its
+		kind) on a line of its own, `buffer_size` records at a time.
+	'''
+
+	def __init__(self, path, buffer_size=1000):
+		self.file = open(path, 'w')
+		self.buffer_size = buffer_size
+		self._buffer = []
+
+	def __call__(self, record):
+		self._buffer.append(record)
+		if len(self._buffer) >= self.buffer_size:
+			self.flush()
+
+	def flush(self):
+		self.file.writelines(json.dumps(dict(record._asdict(), event=record.kind)) + "\n" for record in self._buffer)
+		self._buffer = []
+		self.file.flush()
+
+	def close(self):
+		if not self.file.closed:
+			self.flush()
+			self.file.close()
+
+
+class NpzExporter():
+
+	''' Collects records as columns, saved to a .npz file on `close` with a
+		"<kind>.<field>" array for each field of each kind seen.
+	'''
+
+	def __init__(self, path):
+		self.path = path
+		self._columns = {}  # kind -> tuple of lists, one per field
+		self._closed = False
+
+	def __call__(self, record):
+		columns = self._columns.get(record.kind)
+		if columns is None:
+			columns = self._columns[record.kind] = tuple([] for _ in record._fields)
+		for column, value in zip(columns, record):
+			column.append(value)
+
+	def arrays(self):
+		''' The columns as a dict of NumPy arrays. '''
+		import numpy as np  # only needed here
+		arrays = {}
+		for record in RECORDS:
+			columns = self._columns.get(record.kind)
+			if columns is not None:
+				for field, column in zip(record._fields, columns):
+					arrays[record.kind + '.' + field] = np.array(column)
+		return arrays
+
+	def close(self):
+		if not self._closed:
+			import numpy as np
+			np.savez_compressed(self.path, **self.arrays())
+			self._closed = True
+
+
+class TextLog():
+
+	''' Formats records as lines of text for `log` (a callable taking a
+		string), as the game logged them before it had events.
+	'''
+
+	def __init__(self, log):
+		self.log = log
+
+	def __call__(self, record):
+		kind = record.kind
+		if kind == 'launch':
+			message = "{0:4d}: Player {1} launched {2} (left {3}) ships from {4} {5} to planet {6}".format(
+				record.tick, record.player, record.ships, record.left, record.source_type, record.source, record.planet)
+		elif kind == 'reinforce':
+			message = "{0:4d}: Player {1} reinforced planet {2}".format(record.tick, record.player, record.planet)
+		elif kind == 'battle':
+			message = "{0:4d}: Player {1} defended planet {2}".format(record.tick, record.player, record.planet)
+		elif kind == 'capture':
+			message = "{0:4d}: Player {1} now owns planet {2}".format(record.tick, record.player, record.planet)
+		else:
+			message = "Invalid order %s - %s" % (
+				"ignored" if record.ignored else "modified", InvalidOrder.REASONS[record.reason])
+		self.log(message)
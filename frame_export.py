@@ -0,0 +1,264 @@
+"""Headless frame export for PlanetWars
+
+Draws games the way the GUI does (with `PlanetWarsEntityRenderer`), but into
+an invisible window, and saves the frames as PNG files, so match
+visualisations can be made on machines without a display. pyglet is put in
+its headless (EGL) mode, which needs no display server; without a GPU, Mesa
+draws in software (llvmpipe). If 8x multisampling isn't available the frames
+are drawn without it. Import this module before anything else that loads
+pyglet's windowing (e.g. planet_wars_draw), or it can't be made headless.
+
+ - `export_game` plays a live `PlanetWarsGame` to its end, saving every
+   `stride`th tick
+ - `export_replay` does the same for a (.pwr) replay, splitting the ticks
+   between worker processes, each of which seeks (see `replay.seek`) to the
+   start of its share, so a long replay can be turned into frames quickly
+ - `write_apng` joins saved frames into one animated PNG
+
+Frames are saved as <out>/frame_<tick>.png.
+
+Example:
+	python frame_export.py replays/game.pwr -o frames --stride 10 --start 2000 --end 4000 -w 8 --apng clip.png
+"""
+
+import argparse
+import concurrent.futures
+import multiprocessing
+import pathlib
+import struct
+import sys
+import zlib
+
+import pyglet
+
+if 'pyglet.gl' not in sys.modules:
+	# too late once pyglet.gl is loaded (e.g. by the GUI), but a hidden window is still fine then
+	pyglet.options['headless'] = True
+
+import planet_wars_draw
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+BACKGROUND = pathlib.Path(__file__).parent.joinpath("images", "space.jpg")
+
+
+def _png_chunk(kind, data):
+	return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def write_png(path, width, height, rgba, compression=6):
+	''' Save rgba (bytes of width * height RGBA pixels, top row first) as a PNG. '''
+	stride = width * 4
+	# each row starts with its filter type, 0 (none)
+	raw = b''.join(b'\x00' + rgba[y*stride:(y+1)*stride] for y in range(height))
+	with open(path, 'wb') as f:
+		f.write(PNG_SIGNATURE)
+		f.write(_png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)))
+		f.write(_png_chunk(b'IDAT', zlib.compress(raw, compression)))
+		f.write(_png_chunk(b'IEND', b''))
+
+
+def _read_png(path):
+	''' The IHDR data and the (joined) IDAT data of a PNG file. '''
+	with open(path, 'rb') as f:
+		data = f.read()
+	if not data.startswith(PNG_SIGNATURE):
+		raise ValueError("%s is not a PNG file" % path)
+	pos = len(PNG_SIGNATURE)
+	header, idat = None, []
+	while pos < len(data):
+		length, kind = struct.unpack_from('>I4s', data, pos)
+		body = data[pos+8:pos+8+length]
+		if kind == b'IHDR':
+			header = body
+		elif kind == b'IDAT':
+			idat.append(body)
+		pos += 12 + length
+	return header, b''.join(idat)
+
+
+def write_apng(path, frames, fps=30):
+	''' Join PNG files (paths, all the same size) into an animated PNG, at
+		fps frames a second. The frames' image data is copied as it is, not
+		compressed again.
+	'''
+	frames = list(frames)
+	header, _ = _read_png(frames[0])
+	width, height = struct.unpack_from('>II', header)
+	sequence = 0
+	with open(path, 'wb') as f:
+		f.write(PNG_SIGNATURE)
+		f.write(_png_chunk(b'IHDR', header))
+		f.write(_png_chunk(b'acTL', struct.pack('>II', len(frames), 0)))  # frames, loop forever
+		for i, frame in enumerate(frames):
+			frame_header, data = _read_png(frame)
+			if frame_header != header:
+				raise ValueError("%s is not the same size/format as %s" % (frame, frames[0]))
+			# whole frame, shown for 1/fps seconds, replacing the last
+			f.write(_png_chunk(b'fcTL', struct.pack('>IIIIIHHBB', sequence, width, height, 0, 0, 1, int(fps), 0, 0)))
+			sequence += 1
+			if i == 0:
+				f.write(_png_chunk(b'IDAT', data))
+			else:
+				f.write(_png_chunk(b'fdAT', struct.pack('>I', sequence) + data))
+				sequence += 1
+		f.write(_png_chunk(b'IEND', b''))
+
+
+class FrameRenderer():
+
+	''' Draws games into an invisible window, as the GUI would show them. '''
+
+	def __init__(self, samples=8):
+		self.width, self.height = planet_wars_draw.WINDOW_X, planet_wars_draw.WINDOW_Y
+		try:
+			config = pyglet.gl.Config(double_buffer=True, sample_buffers=1, samples=samples)
+			self.window = pyglet.window.Window(self.width, self.height, visible=False, config=config)
+		except pyglet.window.NoSuchConfigException:
+			self.window = pyglet.window.Window(self.width, self.height, visible=False)
+		try:
+			self.bg = pyglet.sprite.Sprite(pyglet.image.load(str(BACKGROUND)))
+			self.bg.scale_x = self.width / self.bg.image.width
+			self.bg.scale_y = self.height / self.bg.image.height
+		except (OSError, pyglet.util.DecodeException):
+			# missing, or no decoder for it (pyglet needs e.g. Pillow for JPEGs) - plain black then
+			self.bg = None
+		self.step_label = pyglet.text.Label(
+			"", x=5, y=self.height - 20, color=planet_wars_draw.COLOR_NAMES_255["WHITE"])
+		self.renderer = None
+
+	def render(self, game, view_id=0):
+		''' The current frame of game (as RGBA bytes, top row first), of view
+			view_id (0 for everything, or the number of a player).
+		'''
+		self.window.switch_to()
+		if self.renderer is None or self.renderer.game is not game:
+			self.renderer = planet_wars_draw.PlanetWarsEntityRenderer(game, self.window)
+		self.renderer.view_id = view_id
+		self.window.clear()
+		if self.bg is not None:
+			self.bg.draw()
+		self.renderer.draw()
+		self.step_label.text = "Step:" + str(game.tick)
+		self.step_label.draw()
+		buffer = pyglet.image.get_buffer_manager().get_color_buffer().get_image_data()
+		# a negative pitch gives the rows top first, as PNG has them
+		return buffer.get_data('RGBA', -self.width * 4)
+
+	def save(self, game, path, view_id=0):
+		write_png(path, self.width, self.height, self.render(game, view_id))
+
+	def close(self):
+		self.window.close()
+
+
+def frame_path(out_dir, tick):
+	return pathlib.Path(out_dir).joinpath("frame_%06d.png" % tick)
+
+
+def _playing(game, end=None):
+	return (game.is_alive() and (game.max_ticks is None or game.tick < game.max_ticks)
+			and (end is None or game.tick < end))
+
+
+def export_game(game, out_dir, stride=1, end=None, view_id=0, renderer=None):
+	''' Play game to its end (or tick end), saving every stride'th tick to
+		out_dir. Returns the paths of the frames.
+	'''
+	renderer = renderer or FrameRenderer()
+	pathlib.Path(out_dir).mkdir(parents=True, exist_ok=True)
+	paths = []
+	start = game.tick
+	while True:
+		if (game.tick - start) % stride == 0:
+			paths.append(frame_path(out_dir, game.tick))
+			renderer.save(game, paths[-1], view_id)
+		if not _playing(game, end):
+			break
+		game.update(manual=True)
+	return paths
+
+
+def _export_ticks(replay_path, ticks, out_dir, view_id, backend):
+	''' Save the frames of a replay at ticks (ascending). Runs in a worker. '''
+	from replay import ReplayReader, seek
+	renderer = FrameRenderer()
+	paths = []
+	with open(replay_path, 'rb') as f:
+		reader = ReplayReader(f)
+		game = seek(reader, ticks[0], backend=backend)
+		for tick in ticks:
+			while game.tick < tick and _playing(game):
+				game.update(manual=True)
+			if game.tick != tick:
+				break  # the game ended sooner
+			paths.append(frame_path(out_dir, tick))
+			renderer.save(game, paths[-1], view_id)
+	renderer.close()
+	return paths
+
+
+def replay_end(replay_path):
+	''' The last tick of a replay (reading through its orders). '''
+	from replay import ReplayReader
+	with open(replay_path, 'rb') as f:
+		reader = ReplayReader(f)
+		last = reader.header.get('tick', 0)
+		for tick, _ in reader:
+			last = tick
+		if reader.end_tick is not None:
+			return reader.end_tick
+		max_ticks = reader.header.get('max_ticks')
+	return last if max_ticks is None else max(last, max_ticks)
+
+
+def export_replay(replay_path, out_dir, stride=1, start=0, end=None, view_id=0, workers=None, backend='objects'):
+	''' Save every stride'th tick from start to end (by default, the end of
+		the replay) to out_dir, using a pool of (up to `workers`) processes.
+		Returns the paths of the frames, in tick order.
+	'''
+	if end is None:
+		end = replay_end(replay_path)
+	ticks = list(range(start, end + 1, stride))
+	pathlib.Path(out_dir).mkdir(parents=True, exist_ok=True)
+	workers = workers or multiprocessing.cpu_count()
+	# a share of the ticks a job, a few per worker so they all finish about together
+	jobs = max(1, min(len(ticks), workers * 4))
+	shares = [ticks[i * len(ticks) // jobs:(i + 1) * len(ticks) // jobs] for i in range(jobs)]
+	paths = []
+	# spawned, so no worker starts with a copy of a GL context
+	context = multiprocessing.get_context('spawn')
+	with concurrent.futures.ProcessPoolExecutor(workers, mp_context=context) as pool:
+		futures = [pool.submit(_export_ticks, str(replay_path), share, str(out_dir), view_id, backend)
+				   for share in shares if share]
+		for future in futures:
+			paths.extend(future.result())
+	return paths
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(
+		prog="PlanetWars frame export",
+		description="Saves frames of a PlanetWars replay as PNG files, without needing a display."
+	)
+	parser.add_argument("replay", help="The (.pwr) replay file.")
+	parser.add_argument("-o", "--out", default="frames", help="Directory the frames are saved in.")
+	parser.add_argument("--stride", type=int, default=1, help="Save every this many ticks.")
+	parser.add_argument("--start", type=int, default=0, help="First tick to save.")
+	parser.add_argument("--end", type=int, default=None, help="Last tick to save. Defaults to the end of the replay.")
+	parser.add_argument(
+		"--view",
+		type=int,
+		default=0,
+		help="0 to show everything (the default), or the number of a player to show what they can see.",
+	)
+	parser.add_argument("-w", "--workers", type=int, default=None, help="Worker processes. Defaults to the number of CPUs.")
+	parser.add_argument("--backend", choices=["objects", "arrays"], default="objects", help="Game state backend.")
+	parser.add_argument("--apng", help="Also join the frames into this animated PNG file.")
+	parser.add_argument("--fps", type=int, default=30, help="Frames a second of the --apng animation.")
+	args = parser.parse_args()
+
+	paths = export_replay(args.replay, args.out, args.stride, args.start, args.end, args.view, args.workers, args.backend)
+	print("Saved %d frames to %s" % (len(paths), args.out))
+	if args.apng and paths:
+		write_apng(args.apng, paths, args.fps)
+		print("Saved %s" % args.apng)
@@ -0,0 +1,425 @@
+""" PlanetWars game server
+
+Hosts PlanetWars games for bots that connect over TCP or a Unix socket, so
+bots can run in processes (or on machines) of their own. remote_bot.py is
+the client side, and net_protocol.py describes what is sent.
+
+ - a bot connects and says hello, with its name and the lobby it wants to
+   play in. Once `seats` bots wait in a lobby, they are given a game on the
+   next of the server's maps, along with any `bots` (by name, from /bots)
+   that the server runs itself
+ - each tick, every awake remote bot is sent what changed in its facade since
+   the last tick it was sent (not the whole facade), and the game waits, up
+   to `deadline` seconds, for their orders. As with sandboxed bots (see
+   sandbox.py), a late bot forfeits that tick's orders and isn't sent another
+   tick until it has answered, and a bot that disconnects just stops playing
+ - every game is a task on the server's one event loop, which only waits on
+   the network between game updates, so one server plays many games at once
+
+A result is appended to the --out file (a JSON line, as in tournament.py) as
+each game ends:
+
+	{"map": "map001", "players": ["Blanko", "OneSlowMove"], "status": "ok",
+	 "winner": "OneSlowMove", "ticks": 312, "ships": [0, 160], "late": [0, 2],
+	 "wall_time": 4.2}
+
+`status` is "ok", "abandoned" (every remote bot disconnected) or "error".
+
+Example:
+	python game_server.py -m map001 map002 --seats 2 --port 8765
+	python remote_bot.py OneSlowMove --port 8765  # (twice)
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import sys
+import time
+import traceback
+
+import map_cache
+import net_protocol
+from net_protocol import Connection, ProtocolError
+from entities import NEUTRAL_ID
+from planet_wars import PlanetWarsGame
+from schedulers import SequentialScheduler
+
+HELLO_TIMEOUT = 30  # seconds a new connection has to say hello
+MAX_CLIENT_MESSAGE = 1024 * 1024
+
+
+def _checked_orders(orders):
+	''' The well formed orders of an ORDERS message, as `Player.orders`
+		tuples. Whether they can be carried out is up to the game, as for any
+		bot.
+	'''
+	if not isinstance(orders, list):
+		return []
+	return [
+		tuple(order) for order in orders
+		if isinstance(order, list) and len(order) == 5 and order[0] in ('planet', 'fleet')
+		and all(isinstance(ID, (str, int)) for ID in (order[1], order[2], order[4]))
+		and type(order[3]) is int
+	]
+
+
+class _Seat():
+
+	''' The server's end of a remote bot: its connection, and the facade it
+		was last sent (so only what has changed is sent again). It is also
+		the bot's controller in the game (see `Player`).
+	'''
+
+	def __init__(self, connection, name):
+		self.connection = connection
+		self.name = name
+		self.player = None  # once it is in a game
+		self.planets = {}  # ID -> snapshot last sent
+		self.ages = {}  # ID -> vision_age last sent
+		self.fleets = {}  # ID -> snapshot last sent
+		self.busy = None  # tick sent, and not answered yet
+		self.sent = None  # time it was sent
+		self.reply = None  # future of the answer to tick busy
+		self.alive = True
+
+	def delta(self, tick):
+		''' The planets, ages and fleets of a TICK message (see
+			net_protocol.py): what changed in the player's facade since the
+			last one.
+		'''
+		facade = self.player
+		planets = []
+		ages = []
+		for ID, planet in facade.planets.items():
+			last = self.planets.get(ID)
+			if last is not planet:
+				if last is None:
+					planets.append([ID, planet.owner, planet.ships, planet.x, planet.y, planet.growth])
+				elif last.owner != planet.owner or last.ships != planet.ships:
+					planets.append([ID, planet.owner, planet.ships])
+				self.planets[ID] = planet
+			if self.ages.get(ID) != planet.vision_age:
+				ages += (ID, planet.vision_age)
+				self.ages[ID] = planet.vision_age
+		fleets = []
+		for ID, fleet in facade.fleets.items():
+			last = self.fleets.get(ID)
+			if last is not None and (last is fleet or (
+					last.owner == fleet.owner and last.ships == fleet.ships and last.t0 == fleet.t0
+					and last.x0 == fleet.x0 and last.y0 == fleet.y0 and last.dest_id == fleet.dest_id)) \
+					and fleet.position_at(tick) == (fleet.x, fleet.y):
+				# the client can move it on itself
+				fleets.append(ID)
+			else:
+				fleets.append([ID, fleet.owner, fleet.ships, fleet.x, fleet.y, fleet.vx, fleet.vy,
+							   fleet.x0, fleet.y0, fleet.t0, fleet.dest_id])
+		self.fleets = dict(facade.fleets)
+		return planets, ages, fleets
+
+	async def send(self, kind, *values, timeout=None):
+		''' Send a message, dropping the bot if it can't be sent (within
+			timeout seconds, e.g. as it isn't reading them).
+		'''
+		if not self.alive:
+			return
+		try:
+			await asyncio.wait_for(self.connection.send(kind, *values), timeout)
+		except (OSError, asyncio.TimeoutError):
+			self.drop()
+
+	async def send_tick(self, tick, timeout=None):
+		self.busy = tick
+		self.sent = time.perf_counter()
+		self.reply = asyncio.get_running_loop().create_future()
+		await self.send(net_protocol.TICK, tick, *self.delta(tick), timeout=timeout)
+
+	async def listen(self):
+		''' Read the bot's messages until it disconnects. '''
+		try:
+			while True:
+				message = await self.connection.receive()
+				if message is None:
+					break
+				kind, values = message
+				if kind == net_protocol.ORDERS and len(values) == 4:
+					self.answer(*values)
+		except ProtocolError:
+			pass
+		finally:
+			self.drop()
+
+	def answer(self, tick, orders, wake_tick, wake_on_event):
+		''' Take the answer (if it is for the tick asked about). A late answer
+			still frees the bot to be sent the next tick.
+		'''
+		if self.busy is None or tick != self.busy:
+			return
+		self.busy = None
+		if not self.reply.done():
+			self.reply.set_result((
+				_checked_orders(orders),
+				wake_tick if type(wake_tick) is int else None,
+				wake_on_event is True,
+				time.perf_counter() - self.sent
+			))
+
+	def drop(self):
+		''' Stop playing the bot, and close its connection. '''
+		self.alive = False
+		if self.reply is not None and not self.reply.done():
+			self.reply.set_result(None)
+		self.connection.close()
+
+
+class _ServerScheduler(SequentialScheduler):
+
+	''' Phase 0 of a server game: remote players are given the orders their
+		bots sent (see `ServerGame.collect`), the rest are bots run in the
+		server, one after another.
+	'''
+
+	def __init__(self):
+		super().__init__()
+		self.replies = {}  # player ID -> (orders, wake_tick, wake_on_event, seconds)
+
+	def update(self, game, players):
+		local = []
+		for player in players:
+			if not isinstance(player.controller, _Seat):
+				local.append(player)
+				continue
+			reply = self.replies.pop(player.ID, None)
+			if reply is not None:
+				orders, player.wake_tick, player.wake_on_event, seconds = reply
+				player.orders.extend(orders)
+				if game.profiler:
+					game.profiler.bot(player, seconds)
+		super().update(game, local)
+
+
+class ServerGame():
+
+	''' A game between remote bots (seats), and any bots (names of bots in
+		/bots) run in the server. Players are numbered from 1, seats first.
+	'''
+
+	def __init__(self, gamestate, seats, bots=(), deadline=1.0, backend='objects', map_name=None):
+		self.seats = {}  # player ID -> _Seat
+		players = []
+		for seat in seats:
+			ID = str(len(players) + 1)
+			self.seats[ID] = seat
+			players.append({'ID': ID, 'name': seat.name})
+		for name in bots:
+			players.append({'ID': str(len(players) + 1), 'name': name})
+		gamestate['players'] = players
+		self.map_name = map_name
+		self.deadline = deadline
+		self.late = {ID: 0 for ID in self.seats}  # ticks forfeited by answering late
+		self.winner = None  # player ID, once the game is over
+		self.ships = None  # player ID -> ships, once the game is over
+		self.scheduler = _ServerScheduler()
+		self.game = PlanetWarsGame(gamestate, backend=backend, scheduler=self.scheduler, controllers=self.seats)
+		for ID, seat in self.seats.items():
+			seat.player = self.game.players[ID]
+
+	def playing(self):
+		game = self.game
+		return (game.is_alive() and (game.max_ticks is None or game.tick < game.max_ticks)
+				and any(seat.alive for seat in self.seats.values()))
+
+	async def collect(self):
+		''' Send each awake remote bot its tick, and wait (until the deadline)
+			for their orders, which are left for the scheduler.
+		'''
+		tick = self.game.tick
+		waiting = []
+		for seat in self.seats.values():
+			if seat.alive and seat.busy is None and seat.player.is_awake(tick):
+				await seat.send_tick(tick, self.deadline)
+				if seat.alive:
+					waiting.append(seat)
+		if not waiting:
+			return
+		await asyncio.wait([seat.reply for seat in waiting], timeout=self.deadline)
+		for seat in waiting:
+			reply = seat.reply.result() if seat.reply.done() else None
+			if reply is not None:
+				self.scheduler.replies[seat.player.ID] = reply
+			elif seat.alive:
+				self.late[seat.player.ID] += 1
+
+	async def play(self):
+		''' Play the game to its end, and return its result. '''
+		game = self.game
+		start = time.perf_counter()
+		status, error = 'ok', None
+		try:
+			players = {ID: player.name for ID, player in game.players.items() if ID != NEUTRAL_ID}
+			for ID, seat in self.seats.items():
+				await seat.send(net_protocol.WELCOME, ID, players, game.max_ticks, self.deadline, timeout=self.deadline)
+			while self.playing():
+				await self.collect()
+				game.update(manual=True)
+				# give the other games a turn
+				await asyncio.sleep(0)
+			if not any(seat.alive for seat in self.seats.values()):
+				status = 'abandoned'
+		except Exception:
+			status, error = 'error', traceback.format_exc()
+		finally:
+			self.scheduler.close()
+		result = self.result(status, time.perf_counter() - start)
+		if error is not None:
+			result['error'] = error
+		for seat in self.seats.values():
+			await seat.send(net_protocol.END, game.tick, self.winner, self.ships, timeout=self.deadline)
+			seat.drop()
+		return result
+
+	def result(self, status, wall_time):
+		''' The result of the game (as in tournament.py), once it is over. '''
+		game = self.game
+		ships = self.ships = {ID: game.owned_planets.ships[ID] + game.owned_fleets.ships[ID]
+							  for ID in game.players if ID != NEUTRAL_ID}
+		self.winner = None
+		if status == 'ok' and not game.is_alive():
+			# as is_alive counts them: players that still own planets or fleets
+			alive = [ID for ID in ships if ID in game.owned_planets.owned or ID in game.owned_fleets.owned]
+			if len(alive) == 1:
+				self.winner = alive[0]
+		return {
+			'map': self.map_name,
+			'players': [game.players[ID].name for ID in ships],
+			'status': status,
+			'winner': game.players[self.winner].name if self.winner is not None else None,
+			'ticks': game.tick,
+			'ships': list(ships.values()),
+			'late': [self.late.get(ID, 0) for ID in ships],
+			'wall_time': wall_time
+		}
+
+
+class GameServer():
+
+	''' Puts the bots that connect into games of `seats` remote bots (plus
+		`bots`, run in the server), on maps in turn, and plays them all on
+		one event loop.
+	'''
+
+	def __init__(self, maps, seats=2, bots=(), deadline=1.0, max_ticks=10000, backend='objects', results_file=None):
+		self.maps = itertools.cycle(maps)
+		self.seats = seats
+		self.bots = list(bots)
+		self.deadline = deadline
+		self.max_ticks = max_ticks
+		self.backend = backend
+		self.results_file = results_file
+		self.lobbies = {}  # lobby name -> [waiting _Seat]
+		self.games = set()  # tasks of the games being played
+		self.results = []
+		self.server = None
+
+	async def start(self, host=None, port=None, path=None):
+		''' Start listening on host:port, or on the Unix socket path. '''
+		if path is not None:
+			self.server = await asyncio.start_unix_server(self._connected, path)
+		else:
+			self.server = await asyncio.start_server(self._connected, host, port)
+		return self.server
+
+	async def serve(self, host=None, port=None, path=None):
+		''' Listen (see `start`) and play games until cancelled. '''
+		server = await self.start(host, port, path)
+		async with server:
+			await server.serve_forever()
+
+	async def _connected(self, reader, writer):
+		connection = Connection(reader, writer, MAX_CLIENT_MESSAGE)
+		try:
+			message = await asyncio.wait_for(connection.receive(), HELLO_TIMEOUT)
+		except (asyncio.TimeoutError, ProtocolError):
+			message = None
+		if (message is None or message[0] != net_protocol.HELLO or len(message[1]) != 3
+				or not all(isinstance(v, t) for v, t in zip(message[1], (int, str, str)))):
+			await self._refuse(connection, "Expected a hello")
+			return
+		version, name, lobby = message[1]
+		if version != net_protocol.VERSION:
+			await self._refuse(connection, "Protocol version %d is not supported (this is version %d)" % (version, net_protocol.VERSION))
+			return
+		seat = _Seat(connection, name)
+		waiting = self.lobbies.setdefault(lobby, [])
+		waiting.append(seat)
+		if len(waiting) >= self.seats:
+			del self.lobbies[lobby]
+			task = asyncio.ensure_future(self._play(waiting))
+			self.games.add(task)
+			task.add_done_callback(self.games.discard)
+		await seat.listen()
+		if seat in self.lobbies.get(lobby, ()):
+			# left before it got a game
+			self.lobbies[lobby].remove(seat)
+
+	async def _refuse(self, connection, reason):
+		try:
+			await asyncio.wait_for(connection.send(net_protocol.ERROR, reason), HELLO_TIMEOUT)
+		except (OSError, asyncio.TimeoutError):
+			pass
+		connection.close()
+
+	async def _play(self, seats):
+		map_name = next(self.maps)
+		try:
+			gamestate = map_cache.load_map(map_name)
+			gamestate['max_ticks'] = self.max_ticks
+			game = ServerGame(gamestate, seats, self.bots, self.deadline, self.backend, map_name)
+		except Exception:
+			traceback.print_exc()
+			for seat in seats:
+				await seat.send(net_protocol.ERROR, "Could not start a game on %s" % map_name, timeout=self.deadline)
+				seat.drop()
+			return
+		result = await game.play()
+		self.results.append(result)
+		if self.results_file is not None:
+			with open(self.results_file, 'a') as f:
+				f.write(json.dumps(result) + '\n')
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(
+		prog="PlanetWars game server",
+		description="Plays PlanetWars games between bots that connect over the network (see remote_bot.py)."
+	)
+	parser.add_argument(
+		"-m",
+		"--maps",
+		nargs="*",
+		help="Filenames (no extension) of the maps to play on, in turn. Defaults to every .json map in /maps.",
+	)
+	parser.add_argument("--seats", type=int, default=2, help="Number of remote bots in each game.")
+	parser.add_argument(
+		"-b",
+		"--bots",
+		nargs="*",
+		default=[],
+		help="Bots (from /bots) the server adds to every game, and runs itself.",
+	)
+	parser.add_argument("--host", default="127.0.0.1", help="Address to listen on.")
+	parser.add_argument("--port", type=int, default=8765, help="TCP port to listen on.")
+	parser.add_argument("--unix", help="Listen on this Unix socket, rather than TCP.")
+	parser.add_argument("--deadline", type=float, default=1.0, help="Seconds each bot has to answer each tick.")
+	parser.add_argument("--max-ticks", type=int, default=10000, help="Tick limit of each game.")
+	parser.add_argument("--backend", choices=["objects", "arrays"], default="objects", help="Game state backend.")
+	parser.add_argument("-o", "--out", default="server_results.jsonl", help="File the results are appended to (JSON lines).")
+	args = parser.parse_args()
+
+	maps = args.maps or sorted(p.stem for p in map_cache.MAPS_DIR.glob('*.json'))
+	server = GameServer(maps, args.seats, args.bots, args.deadline, args.max_ticks, args.backend, args.out)
+	print("Listening on %s" % (args.unix or "%s:%d" % (args.host, args.port)), file=sys.stderr)
+	try:
+		asyncio.run(server.serve(args.host, args.port, args.unix))
+	except KeyboardInterrupt:
+		pass
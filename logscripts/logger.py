@@ -1,4 +1,12 @@
 from collections import defaultdict
+import gzip
+import queue
+import threading
+import time
+
+
+def _ignore(message, *args):
+	pass
 
 
 class Logger(object):
@@ -14,18 +22,23 @@ class Logger(object):
 
 		If messages have not been logged the corresponding file is not created.
 
+		Everything is kept until the end of the game. See RollingLogger for
+		long games (or many games in one process).
 	'''
 
-	def __init__(self, filename_pattern):
+	def __init__(self, filename_pattern, disabled_players=()):
 		''' Creates a log file at this file location.
 			The pattern must contain one '%s' which will be replaced with the
 			name of each log file.
+			Messages of players in disabled_players are dropped (see
+			get_player_logger).
 		'''
 		self._pattern = filename_pattern
 		self._results = []
 		self._turns = []
 		self._errors = []
 		self._players = defaultdict(list)
+		self.disabled_players = set(disabled_players)
 
 	def flush(self):
 
@@ -60,11 +73,143 @@ class Logger(object):
 		self._append_message(self._players[player_id], message)
 
 	def get_player_logger(self, player_id):
-		''' Wrap (decorate) the player() log method with the player_id. '''
-		def player_log(message):
+		''' Wrap (decorate) the player() log method with the player_id.
+			Any extra arguments are %-formatted into the message, which is
+			only done if the player's log is enabled: a disabled player gets
+			a function that does nothing at all.
+		'''
+		if player_id in self.disabled_players:
+			return _ignore
+
+		def player_log(message, *args):
+			if args:
+				message = message % args
 			self.player(player_id, message)
 		return player_log
 
 	def error(self, message):
 		''' Use to log error details. '''
 		self._append_message(self._errors, message)
+
+
+class RollingLogger(Logger):
+
+	''' A Logger that keeps memory bounded by writing messages out as it
+		goes, rather than all at once at the end.
+
+		Messages are flushed (appended to the log files, so loggers sharing a
+		pattern add to what is there) once `max_lines` are buffered or
+		`max_seconds` have passed since the last flush. With `compress` the
+		files are gzipped (and ".gz" is added to their names). With
+		`background` the writing is done by a thread of its own, so the game
+		never waits on the disk; at most `max_batches` flushes can be waiting
+		to be written before a flush does wait, which keeps memory bounded if
+		the disk can't keep up. If the thread fails to write, the next flush()
+		or close() raises its error, and later flushes are written by the
+		caller.
+
+		Call close() when done, to write what is left and close the files.
+	'''
+
+	def __init__(self, filename_pattern, max_lines=1000, max_seconds=5.0, compress=False, background=True,
+				 max_batches=16, disabled_players=()):
+		super().__init__(filename_pattern, disabled_players)
+		self.max_lines = max_lines
+		self.max_seconds = max_seconds
+		self.compress = compress
+		self._buffered = 0
+		self._last_flush = time.monotonic()
+		self._files = {}  # log name -> open file, only used by the writer
+		self._queue = None
+		self._thread = None
+		self._error = None  # what the writer thread died of, for the next flush to raise
+		if background:
+			self._queue = queue.Queue(max_batches)
+			self._thread = threading.Thread(target=self._writer, name="logger", daemon=True)
+			self._thread.start()
+
+	def _append_message(self, log, message):
+		super()._append_message(log, message)
+		self._buffered += 1
+		if self._buffered >= self.max_lines or time.monotonic() - self._last_flush >= self.max_seconds:
+			self.flush()
+
+	def flush(self):
+		''' Hand the buffered messages over to be written. '''
+		self._check_writer()
+		batch = [('results', self._results), ('turns', self._turns), ('errors', self._errors)]
+		batch += [('player' + str(k), v) for k, v in self._players.items()]
+		batch = [(name, lines) for name, lines in batch if lines]
+		self._results = []
+		self._turns = []
+		self._errors = []
+		self._players = defaultdict(list)
+		self._buffered = 0
+		self._last_flush = time.monotonic()
+		if not batch:
+			return
+		if self._queue is not None:
+			self._put(batch)
+		else:
+			self._write(batch)
+
+	def _write(self, batch):
+		for name, lines in batch:
+			f = self._files.get(name)
+			if f is None:
+				path = self._pattern % name
+				if self.compress:
+					f = gzip.open(path + '.gz', 'at')
+				else:
+					f = open(path, 'a')
+				self._files[name] = f
+			f.writelines(lines)
+			f.flush()
+
+	def _writer(self):
+		while True:
+			batch = self._queue.get()
+			if batch is None:
+				break
+			try:
+				self._write(batch)
+			except Exception as e:
+				self._error = e
+				break
+
+	def _put(self, item):
+		''' Queue item for the writer, waiting while the queue is full, but
+			not on a writer that has died.
+		'''
+		while True:
+			try:
+				self._queue.put(item, timeout=0.1)
+				return
+			except queue.Full:
+				self._check_writer()
+
+	def _check_writer(self):
+		''' Raise the error the writer thread died of, if it has. Flushes
+			are written by the caller from then on.
+		'''
+		if self._error is not None:
+			error, self._error = self._error, None
+			self._thread.join()
+			self._thread = None
+			self._queue = None
+			raise error
+
+	def close(self):
+		''' Write out everything logged so far, and close the files. '''
+		try:
+			self.flush()
+			if self._thread is not None:
+				self._put(None)
+				self._thread.join()
+				# the writer may have failed on the last batches
+				self._check_writer()
+				self._thread = None
+		finally:
+			for f in self._files.values():
+				f.close()
+			self._files = {}
@@ -16,12 +16,17 @@ Updated 2024
 """
 
 from planet_wars import PlanetWarsGame
+from replay import ReplayReader, ReplayWriter, seek
+from profiler import TickProfiler
+from events import JsonlWriter, NpzExporter
+from sandbox import SandboxScheduler
+from schedulers import ThreadScheduler, AsyncScheduler
+from map_cache import load_map
 
 import argparse
 import json
 import pathlib
 import uuid
-import collections
 import datetime
 
 if __name__ == "__main__":
@@ -46,7 +51,7 @@ if __name__ == "__main__":
 	parser.add_argument(
 		"-m",
 		"--map",
-		help="Filename (no extension) of map to play on. If not supplied, a random map is generated for play.",
+		help="Filename (no extension) of map to play on, a .json or .jsonc file in /maps. If not supplied, a random map is generated for play.",
 	)
 	# parser.add_argument(
 	# 	"-g",
@@ -56,11 +61,22 @@ if __name__ == "__main__":
 	parser.add_argument(
 		"-r",
 		"--replay",
-		help="Filename (no extension) of replay to run. Does nothing without either --gui or --logscript being provided",
+		help="Filename (no extension) of replay to run (a .pwr replay, or an older .json one). Does nothing without either --gui or --logscript being provided",
+	)
+	parser.add_argument(
+		"--seek",
+		type=int,
+		help="Start the replay at this tick (from the nearest keyframe in the replay, rather than playing every tick from the start). Needs a .pwr --replay.",
 	)
 	parser.add_argument(
 		"--gui", help="Runs with the graphical output", action="store_true"
 	)
+	parser.add_argument(
+		"--tps",
+		type=float,
+		default=60,
+		help="Game ticks per second in the GUI, 0 for as fast as it will go. Change it with +/- while the game runs.",
+	)
 	parser.add_argument(
 		"--logscript",
 		help="Adds a log output script. Could be used to make game ticks/actions human readable or to print statistics about the game states.",
@@ -71,24 +87,86 @@ if __name__ == "__main__":
 		default=argparse.SUPPRESS,
 		help="Saves a replay. Optional: filename (no extension) to save the replay to. If not provided, the replay is saved to the replays directory with a UUID filename.",
 	)
+	parser.add_argument(
+		"--replay-compression",
+		type=int,
+		default=6,
+		help="zlib compression level (0-9) of saved replays. 0 saves them uncompressed.",
+	)
+	parser.add_argument(
+		"--keyframe-ticks",
+		type=int,
+		default=500,
+		help="Ticks between the full game state keyframes of saved replays (used to seek). 0 for none.",
+	)
 	parser.add_argument(
 		"--max-ticks",
 		type=int,
 		default=10000,
 		help="Saves a replay. Optional: filename (no extension) to save the replay to. If not provided, the replay is saved to the replays directory with a UUID filename.",
 	)
+	parser.add_argument(
+		"--backend",
+		choices=["objects", "arrays"],
+		default="objects",
+		help="Where the game state is kept: plain Python objects (default) or NumPy arrays (needs numpy, faster on large maps).",
+	)
+	parser.add_argument(
+		"--fast-forward",
+		action="store_true",
+		help="Skip over ticks in which nothing happens (no fleet arrives and every bot is asleep).",
+	)
+	parser.add_argument(
+		"--events",
+		help="File to save the game events (launches, battles, captures, invalid orders...) to: a NumPy .npz of columns if it ends in .npz, otherwise JSON lines.",
+	)
+	parser.add_argument(
+		"--profile",
+		action="store_true",
+		help="Time each phase of every game tick (and each bot) and print a summary at the end of the game.",
+	)
+	parser.add_argument(
+		"--profile-out",
+		help="File to save the per tick profile to (with --profile). JSON if it ends in .json, otherwise CSV.",
+	)
+	parser.add_argument(
+		"--scheduler",
+		choices=["sequential", "threads", "async"],
+		default="sequential",
+		help="How bots are updated each tick: one after another (default), at the same time in a thread pool (for bots that release the GIL, e.g. NumPy), or as coroutines on one event loop (for bots with an `async def update`).",
+	)
+	parser.add_argument(
+		"--bot-threads",
+		type=int,
+		help="Size of the bot thread pool (with --scheduler threads). Defaults to the number of CPUs + 4.",
+	)
+	parser.add_argument(
+		"--sandbox",
+		action="store_true",
+		help="Run each bot in its own process, all at the same time (instead of --scheduler). A bot that misses the --bot-deadline forfeits that tick's orders.",
+	)
+	parser.add_argument(
+		"--bot-deadline",
+		type=float,
+		default=1.0,
+		help="Seconds sandboxed bots have to give their orders each tick (with --sandbox).",
+	)
 	args = parser.parse_args()
 
 	if args.map and args.replay:
 		print("Cannot use both --maps and --replay")
 		exit()
 
-	if args.map or args.replay:
-		filename = args.map or args.replay
-		if args.map:
-			filename = pathlib.PurePath().joinpath('maps').joinpath(filename + ".json")
-		if args.replay:
-			filename = pathlib.PurePath().joinpath('replays').joinpath(filename + ".json")
+	replay = None
+	if args.replay and pathlib.Path('replays').joinpath(args.replay + ".pwr").exists():
+		# orders are read from the replay as the game gets to them
+		replay = ReplayReader(pathlib.Path('replays').joinpath(args.replay + ".pwr"))
+		gamestate = replay.header
+	elif args.map:
+		# maps/<map>.json or .jsonc, parsed once and then loaded from maps/.cache
+		gamestate = load_map(args.map)
+	elif args.replay:
+		filename = pathlib.PurePath().joinpath('replays').joinpath(args.replay + ".json")
 		f = open(filename, "r+")
 		gamestate = json.loads(f.read())
 	else:
@@ -108,35 +186,69 @@ if __name__ == "__main__":
 	if(args.max_ticks):
 		gamestate["max_ticks"] = args.max_ticks
 
-	replay_object = None
+	replay_writer = None
 	if not args.replay and hasattr(args, "save_replay"):
-		replay_object = collections.defaultdict(list)
-		
-
-	game = PlanetWarsGame(gamestate, args.logscript, replay_object)
-
-	def write_replay():
-		if replay_object:
-			try:
-				#args.save_replay will either be
-				# a) undefined - there is no replay, we error out and move on
-				# b) a string - we save the replay to that filename
-				# c) None - we save the replay to players + timestamp
-				if args.save_replay:
-					replay_file = open(pathlib.PurePath().joinpath('replays').joinpath(args.save_replay + ".json"), "w")
-				else:
-					filename = "".join(gamestate["players"])+str(datetime.datetime.now())+".json"
-					replay_file = open(pathlib.PurePath().joinpath('replays').joinpath(filename), "w")
-				replay_file.write(json.dumps(replay_object))
-			except:
-				pass
-
-
-	if args.gui:
-		from planet_wars_draw import PlanetWarsWindow
-		window = PlanetWarsWindow(game)
+		#args.save_replay will either be
+		# a) undefined - no replay is saved
+		# b) a string - we save the replay to that filename
+		# c) None - we save the replay to players + timestamp
+		if args.save_replay:
+			filename = args.save_replay + ".pwr"
+		else:
+			filename = "-".join(p["name"] for p in gamestate["players"]) + datetime.datetime.now().strftime("-%Y%m%d-%H%M%S") + ".pwr"
+		pathlib.Path('replays').mkdir(exist_ok=True)
+		# the replay is written as the game goes, so it survives a crash
+		replay_writer = ReplayWriter(
+			pathlib.Path('replays').joinpath(filename), args.replay_compression, keyframe_ticks=args.keyframe_ticks)
+
+	seek_to = None
+	if replay is not None:
+		def seek_to(tick):
+			''' A new game, at tick of the replay. '''
+			game = seek(replay, tick, logger=args.logscript, backend=args.backend, fast_forward=args.fast_forward)
+			if args.max_ticks:
+				game.max_ticks = args.max_ticks
+			return game
+
+	if args.seek is not None:
+		if seek_to is None:
+			print("--seek needs a (.pwr) --replay to seek in")
+			exit()
+		game = seek_to(args.seek)
 	else:
-		game.paused = False
-		while game.is_alive() and game.tick < game.max_ticks:
-			game.update()
-	write_replay()
+		game = PlanetWarsGame(gamestate, args.logscript, replay_writer, args.backend, args.fast_forward, replay)
+	if args.profile:
+		game.profiler = TickProfiler()
+	if args.events:
+		game.events.subscribe(NpzExporter(args.events) if args.events.endswith(".npz") else JsonlWriter(args.events))
+	if args.sandbox:
+		game.scheduler = SandboxScheduler(args.bot_deadline)
+	elif args.scheduler == "threads":
+		game.scheduler = ThreadScheduler(args.bot_threads)
+	elif args.scheduler == "async":
+		game.scheduler = AsyncScheduler()
+
+	try:
+		if args.gui:
+			from planet_wars_draw import PlanetWarsWindow
+			window = PlanetWarsWindow(game, seek_to, args.tps or None)
+		else:
+			game.paused = False
+			while game.is_alive() and game.tick < game.max_ticks:
+				game.update()
+	finally:
+		if replay_writer is not None:
+			replay_writer.close(game.tick)
+		if replay is not None:
+			replay.close()
+		game.scheduler.close()
+		game.events.close()
+		if args.sandbox:
+			for ID, late in game.scheduler.late.items():
+				print("%s missed the deadline %d times" % (game.players[ID].name, late))
+			for ID, error in game.scheduler.errors.items():
+				print("%s failed:\n%s" % (game.players[ID].name, error))
+		if args.profile:
+			print(game.profiler.summary())
+			if args.profile_out:
+				game.profiler.write(args.profile_out)
@@ -0,0 +1,235 @@
+"""Map loading with a binary cache for PlanetWars
+
+`load_map(name)` returns the gamestate of maps/<name>.json (or .jsonc, JSON
+with // and /* */ comments), parsing each map only once:
+
+ - the first time a map (as it is now - the cache is keyed by a hash of its
+   contents) is loaded, its planets are saved as arrays of x, y, ships and
+   growth to maps/.cache/<name>.<hash>.pwm, which later loads (in any
+   process) read straight back in, without parsing JSON
+ - parsed maps are also kept in an in-process LRU cache, so the games of a
+   tournament worker share them
+
+The planets of the returned gamestate are a `PlanetColumns`, which both state
+backends build their planets from directly (see `ObjectState.load_planets`
+and `ArrayState.load_planets`). It reads like a list of planet dicts for
+anything else. Maps with planets that don't fit the columns (e.g. missing
+fields, or extra ones) are cached with their planets as plain JSON.
+
+"""
+import array
+import functools
+import hashlib
+import json
+import os
+import pathlib
+import struct
+
+MAPS_DIR = pathlib.Path(__file__).parent.joinpath('maps')
+CACHE_DIR_NAME = '.cache'
+LRU_SIZE = 128
+
+MAGIC = b'PWM'
+VERSION = 1
+HEADER = struct.Struct('<3sBI')  # magic, version, planet count (or 0xFFFFFFFF: planets are in the JSON)
+NO_COLUMNS = 0xFFFFFFFF
+
+
+def strip_comments(text):
+	''' JSON text with any // line and /* block */ comments (outside of
+		strings) removed.
+	'''
+	out = []
+	i, n = 0, len(text)
+	start = 0
+	while i < n:
+		c = text[i]
+		if c == '"':
+			# skip the string, and any escapes in it
+			i += 1
+			while i < n and text[i] != '"':
+				i += 2 if text[i] == '\\' else 1
+			i += 1
+		elif c == '/' and text.startswith('//', i):
+			out.append(text[start:i])
+			i = text.find('\n', i)
+			if i < 0:
+				i = n
+			start = i
+		elif c == '/' and text.startswith('/*', i):
+			out.append(text[start:i])
+			i = text.find('*/', i)
+			i = n if i < 0 else i + 2
+			start = i
+		else:
+			i += 1
+	out.append(text[start:])
+	return ''.join(out)
+
+
+def parse_map(text):
+	''' The gamestate dict of map JSON text (comments allowed). '''
+	if '/' in text:
+		text = strip_comments(text)
+	return json.loads(text)
+
+
+class PlanetColumns():
+
+	''' The planets of a map as columns: `x`, `y`, `ships` and `growth`
+		arrays, and `ID` and `owner` lists (None where a planet has none, or
+		the whole list None if no planet has one). Shared between games, so
+		don't change it.
+	'''
+
+	def __init__(self, x, y, ships, growth, ID=None, owner=None):
+		self.x = x
+		self.y = y
+		self.ships = ships
+		self.growth = growth
+		self.ID = ID
+		self.owner = owner
+
+	@classmethod
+	def from_planets(cls, planets):
+		''' Columns of a list of planet dicts, or None if they don't fit. '''
+		columns = cls(array.array('d'), array.array('d'), array.array('q'), array.array('q'), [], [])
+		for p in planets:
+			if not set(p) <= {'x', 'y', 'ships', 'growth', 'ID', 'owner'}:
+				return None
+			x, y, ships, growth = p.get('x'), p.get('y'), p.get('ships'), p.get('growth')
+			# exactly these types, so planets come back just as json gives them
+			if not (type(x) is float and type(y) is float and type(ships) is int and type(growth) is int):
+				return None
+			try:
+				columns.ships.append(ships)
+				columns.growth.append(growth)
+			except OverflowError:
+				return None
+			columns.x.append(x)
+			columns.y.append(y)
+			columns.ID.append(p.get('ID'))
+			columns.owner.append(p.get('owner'))
+		if all(ID is None for ID in columns.ID):
+			columns.ID = None
+		if all(owner is None for owner in columns.owner):
+			columns.owner = None
+		return columns
+
+	def __len__(self):
+		return len(self.x)
+
+	def rows(self):
+		''' (x, y, ID, owner, ships, growth) of each planet. '''
+		n = len(self.x)
+		return zip(self.x, self.y, self.ID or [None] * n, self.owner or [None] * n, self.ships, self.growth)
+
+	def __iter__(self):
+		for x, y, ID, owner, ships, growth in self.rows():
+			planet = {'x': x, 'y': y, 'ships': ships, 'growth': growth}
+			if ID is not None:
+				planet['ID'] = ID
+			if owner is not None:
+				planet['owner'] = owner
+			yield planet
+
+
+def planet_rows(planets):
+	''' (x, y, ID, owner, ships, growth) of each planet of a gamestate's
+		planets, either `PlanetColumns` or a list of planet dicts.
+	'''
+	if isinstance(planets, PlanetColumns):
+		return planets.rows()
+	return ((p['x'], p['y'], p.get('ID'), p.get('owner'), p.get('ships'), p.get('growth')) for p in planets)
+
+
+def _dumps(gamestate):
+	''' The binary (.pwm) form of a parsed map. '''
+	planets = gamestate.get('planets', [])
+	columns = PlanetColumns.from_planets(planets)
+	rest = dict(gamestate)
+	if columns is None:
+		head = HEADER.pack(MAGIC, VERSION, NO_COLUMNS)
+		body = b''
+	else:
+		rest['planets'] = None
+		rest['planet_ID'] = columns.ID
+		rest['planet_owner'] = columns.owner
+		head = HEADER.pack(MAGIC, VERSION, len(columns))
+		body = columns.x.tobytes() + columns.y.tobytes() + columns.ships.tobytes() + columns.growth.tobytes()
+	return head + body + json.dumps(rest).encode()
+
+
+def _loads(data):
+	''' A parsed map (gamestate) from its binary form. '''
+	magic, version, n = HEADER.unpack_from(data)
+	if magic != MAGIC or version != VERSION:
+		raise ValueError("Not a version %d map cache file" % VERSION)
+	pos = HEADER.size
+	if n == NO_COLUMNS:
+		return json.loads(data[pos:])
+	arrays = []
+	for code in 'ddqq':
+		a = array.array(code)
+		a.frombytes(data[pos:pos + 8 * n])
+		arrays.append(a)
+		pos += 8 * n
+	gamestate = json.loads(data[pos:])
+	gamestate['planets'] = PlanetColumns(*arrays, gamestate.pop('planet_ID'), gamestate.pop('planet_owner'))
+	return gamestate
+
+
+def map_path(name, maps_dir=MAPS_DIR):
+	''' The .json (or else .jsonc) file of a map name, or name itself if it
+		is a path to a file.
+	'''
+	if os.path.isfile(name):
+		return pathlib.Path(name)
+	path = pathlib.Path(maps_dir).joinpath(name + '.json')
+	if not path.exists() and pathlib.Path(maps_dir).joinpath(name + '.jsonc').exists():
+		path = path.with_suffix('.jsonc')
+	return path
+
+
+@functools.lru_cache(LRU_SIZE)
+def _load(path, mtime_ns, size):
+	with open(path, 'rb') as f:
+		data = f.read()
+	digest = hashlib.sha1(data).hexdigest()[:16]
+	cache_dir = pathlib.Path(path).parent.joinpath(CACHE_DIR_NAME)
+	cached = cache_dir.joinpath('%s.%s.pwm' % (pathlib.Path(path).stem, digest))
+	try:
+		with open(cached, 'rb') as f:
+			return _loads(f.read())
+	except (OSError, ValueError):
+		pass
+	gamestate = parse_map(data.decode())
+	try:
+		cache_dir.mkdir(exist_ok=True)
+		# drop files of earlier versions of the map
+		for old in cache_dir.glob(pathlib.Path(path).stem + '.*.pwm'):
+			old.unlink()
+		temp = cached.with_suffix('.tmp%d' % os.getpid())
+		with open(temp, 'wb') as f:
+			f.write(_dumps(gamestate))
+		os.replace(temp, cached)
+	except OSError:
+		pass  # e.g. a read only maps directory - still fine, just slower next time
+	return _loads(_dumps(gamestate))
+
+
+def load_map(name, maps_dir=MAPS_DIR):
+	''' A new gamestate dict of the map called name (in maps_dir), or at path
+		name. Everything but the planets is a fresh copy, so it can be
+		changed (e.g. to add players).
+	'''
+	path = map_path(name, maps_dir)
+	stat = os.stat(path)
+	gamestate = _load(str(path), stat.st_mtime_ns, stat.st_size)
+	planets = gamestate.get('planets')
+	gamestate = json.loads(json.dumps({k: v for k, v in gamestate.items() if k != 'planets'}))
+	if isinstance(planets, PlanetColumns):
+		gamestate['planets'] = planets
+	elif planets is not None:
+		gamestate['planets'] = json.loads(json.dumps(planets))
+	return gamestate
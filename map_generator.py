@@ -1,116 +1,170 @@
-import random
+""" PlanetWars map generator
+
+Generates maps of planets scattered over a disc, with rotational symmetry:
+the planets of one sector of the disc are placed at random, copied into each
+of the other `symmetry` sectors, and then culled so no two planets are closer
+than `min_distance`. Maps are in the 0-1 square, as in /maps.
+
+Placement and rotation are done with NumPy over every planet at once, and the
+culling uses a grid of `min_distance` sized cells, so only planets in the 3x3
+cells around a planet are checked against it. That makes maps of tens of
+thousands of planets (use a small --min-distance) quick to make, e.g. for
+stress testing the engine. The same seed always gives the same maps.
+
+	import map_generator
+	maps = map_generator.generate_maps(5, planets=40, symmetry=2, seed=1)
+
+Examples:
+	python map_generator.py  # maps/map011.json ... map020.json, as before
+	python map_generator.py -n 1 --planets 20000 --symmetry 4 --min-distance 0.002 --name big --seed 1
+"""
+
+import argparse
 import json
-import numpy as np
-from scipy.stats import skewnorm
 import math
+import pathlib
+
+import numpy as np
+
+MAPS_DIR = pathlib.Path(__file__).parent.joinpath('maps')
+MIN_DISTANCE = 0.15
+# default planets per sector: skewed towards the low end of this range
+MIN_PLANETS = 2
+MAX_PLANETS = 100
+SKEWNESS = 15
+SKEW_BATCH = 10  # counts are spread over the range in batches of this many
+
 
-maps = []
-skewed_random_numbers = []
-next_random_number = 0
-
-number_of_maps = 10
-
-def generate_skewed_random_numbers():
-	skewness = 15  # Negative values create left-skewed distribution
-	min_value = 2  # The lower bound of your range
-	max_value = 100  # The upper bound of your range
-	# Generate random numbers
-	random_numbers = skewnorm.rvs(skewness, size=number_of_maps)
-	random_numbers = min_value + (max_value - min_value) * (random_numbers - np.min(random_numbers)) / (np.max(random_numbers) - np.min(random_numbers))
-	return random_numbers
-
-def get_skewed_random_number(i=None):
-	global next_random_number, skewed_random_numbers
-	if i:
-		return skewed_random_numbers[i]
-	else:
-		if next_random_number >= len(skewed_random_numbers):
-			skewed_random_numbers = generate_skewed_random_numbers()
-			next_random_number = 0
-		return skewed_random_numbers[next_random_number]
-
-def generate_planets(num_planets, sector_size=2*np.pi, sector_number=0):
-	planets = []
-	for _ in range(num_planets):
-		radius = random.uniform(0, 1)
-		sector_start_angle = sector_number * sector_size
-		sector_end_angle = (sector_number + 1) * sector_size
-		angle = random.uniform(sector_start_angle, sector_end_angle)
-		x = radius * np.cos(angle)
-		y = radius * np.sin(angle)
-		growth = random.randint(0, 8)
-		ships = random.randint(1, 1000)
-
-		planet = {
-			"x": (x+1)/2,
-			"y": y,
-			"growth": growth,
-			"ships": ships
-		}
-		planets.append(planet)
-	return planets
-
-def rotate_objects(objects, angle_rad):
-	rotated_objects = []
-	for obj in objects:
-		x = obj['x']
-		y = obj['y']
-		# Apply rotation transformation
-		new_x = x * math.cos(angle_rad) - y * math.sin(angle_rad)
-		new_y = x * math.sin(angle_rad) + y * math.cos(angle_rad)
-		# Create a new object with rotated coordinates
-		rotated_obj = {
-			'x': new_x,
-			'y': new_y,
-			'growth': obj['growth'],
-			'ships': obj['ships']
-		}
-		rotated_objects.append(rotated_obj)
-	return rotated_objects
-
-def rescale_planets(planets):
-	# Rescale planets to fit in the 0-1 range
-	for planet in planets:
-		planet['x'] = (planet['x'] + 1) / 2
-		planet['y'] = (planet['y'] + 1) / 2
-	return planets
-
-def cull_planets(planets, minimum_planet_distance=0.15):
-	# Remove planets that are too close to each other
-	ok_planets = []
-	for planet in planets:
-		# Check if planet is too close to any other planet
+def skewed_planet_counts(count, rng):
+	''' count planet counts (per sector), drawn from a skew normal
+		distribution and spread over MIN_PLANETS..MAX_PLANETS.
+	'''
+	counts = []
+	while len(counts) < count:
+		# skew normal samples, from two normal ones
+		delta = SKEWNESS / math.sqrt(1 + SKEWNESS**2)
+		u0, v = rng.standard_normal((2, SKEW_BATCH))
+		u1 = delta * u0 + math.sqrt(1 - delta**2) * v
+		samples = np.where(u0 >= 0, u1, -u1)
+		samples = MIN_PLANETS + (MAX_PLANETS - MIN_PLANETS) * (samples - samples.min()) / (samples.max() - samples.min())
+		counts.extend(samples.astype(int).tolist())
+	return counts[:count]
+
+
+def place_planets(num_planets, symmetry, rng):
+	''' x, y, growth and ships arrays of num_planets planets placed at random
+		in the first of `symmetry` sectors of the unit disc, and a copy of
+		them rotated into each other sector (sector by sector).
+	'''
+	sector_angle = 2 * math.pi / symmetry
+	radius = rng.uniform(0, 1, num_planets)
+	angle = rng.uniform(0, sector_angle, num_planets)
+	growth = rng.integers(0, 9, num_planets)
+	ships = rng.integers(1, 1001, num_planets)
+	# every sector's copy at once: one row of angles per sector
+	angles = angle + sector_angle * np.arange(symmetry)[:, None]
+	x = (radius * np.cos(angles)).ravel()
+	y = (radius * np.sin(angles)).ravel()
+	return x, y, np.tile(growth, symmetry), np.tile(ships, symmetry)
+
+
+def cull_planets(x, y, min_distance=MIN_DISTANCE):
+	''' Indexes of the planets (at x, y) to keep, so that no two are closer
+		than min_distance. Planets are kept first come first served, so each
+		is only dropped for one kept before it.
+	'''
+	if min_distance <= 0:
+		return np.arange(len(x))
+	limit = min_distance**2
+	cells = {}  # (cx, cy) -> [(x, y)] of kept planets
+	keep = []
+	xs, ys = x.tolist(), y.tolist()
+	cxs = np.floor(x / min_distance).astype(int).tolist()
+	cys = np.floor(y / min_distance).astype(int).tolist()
+	for i in range(len(xs)):
+		px, py, cx, cy = xs[i], ys[i], cxs[i], cys[i]
 		too_close = False
-		for other_planet in ok_planets:
-			dx = planet['x'] - other_planet['x']
-			dy = planet['y'] - other_planet['y']
-			distance = math.sqrt(dx**2 + dy**2)
-			if distance < minimum_planet_distance:
-				too_close = True
+		for nx in (cx - 1, cx, cx + 1):
+			for ny in (cy - 1, cy, cy + 1):
+				for ox, oy in cells.get((nx, ny), ()):
+					if (px - ox)**2 + (py - oy)**2 < limit:
+						too_close = True
+						break
+				if too_close:
+					break
+			if too_close:
 				break
-		# Add planet to culled list if it is not too close
 		if not too_close:
-			ok_planets.append(planet)
-	return ok_planets
-
-for i in range(number_of_maps):
-	num_sectors = i+1
-	sector_angle = 2 * np.pi / num_sectors
-	num_planets = int(get_skewed_random_number())
-	initial_planets = generate_planets(num_planets,sector_angle)
-	planets = []
-	for sector_num in range(num_sectors):
-		planets.extend(rotate_objects(initial_planets, sector_angle*sector_num))
-
-	planets = rescale_planets(planets)
-
-	planets = cull_planets(planets)
-	map_data = {
-		"planets": planets
+			keep.append(i)
+			cells.setdefault((cx, cy), []).append((px, py))
+	return np.array(keep, dtype=int)
+
+
+def generate_map(planets, symmetry=1, min_distance=MIN_DISTANCE, rng=None):
+	''' A gamestate dict of a new map, with `planets` planets per sector (so
+		up to planets * symmetry in all, before culling).
+	'''
+	if rng is None:
+		rng = np.random.default_rng()
+	x, y, growth, ships = place_planets(planets, symmetry, rng)
+	# from the unit disc to the 0-1 square
+	x = (x + 1) / 2
+	y = (y + 1) / 2
+	keep = cull_planets(x, y, min_distance)
+	return {
+		'planets': [
+			{'x': px, 'y': py, 'growth': g, 'ships': s}
+			for px, py, g, s in zip(x[keep].tolist(), y[keep].tolist(), growth[keep].tolist(), ships[keep].tolist())
+		]
 	}
 
-	# Write map data to file
-	filename = f"maps/map{i+11:03}.json"
-	with open(filename, "w") as file:
-		json.dump(map_data, file)
 
+def generate_maps(count, planets=None, symmetry=None, min_distance=MIN_DISTANCE, seed=None):
+	''' A list of count new maps (gamestate dicts). By default the number of
+		planets per sector is skewed towards a few (see
+		`skewed_planet_counts`), and map i has i + 1 sectors.
+	'''
+	rng = np.random.default_rng(seed)
+	counts = [planets] * count if planets is not None else skewed_planet_counts(count, rng)
+	return [
+		generate_map(counts[i], symmetry if symmetry is not None else i + 1, min_distance, rng)
+		for i in range(count)
+	]
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(
+		prog="PlanetWars map generator",
+		description="Generates symmetric random PlanetWars maps and saves them as .json files in /maps."
+	)
+	parser.add_argument("-n", "--count", type=int, default=10, help="Number of maps to generate.")
+	parser.add_argument(
+		"--planets",
+		type=int,
+		default=None,
+		help="Planets placed in each sector, before culling. Defaults to a random number (mostly small) for each map.",
+	)
+	parser.add_argument(
+		"--symmetry",
+		type=int,
+		default=None,
+		help="Number of rotationally symmetric sectors of each map. Defaults to 1 for the first map, 2 for the next, and so on.",
+	)
+	parser.add_argument(
+		"--min-distance",
+		type=float,
+		default=MIN_DISTANCE,
+		help="Smallest distance between planets (the maps are 1 across). Make it small for maps with many planets.",
+	)
+	parser.add_argument("--seed", type=int, default=None, help="Random seed. The same seed gives the same maps.")
+	parser.add_argument("--name", default="map", help="Start of the map filenames.")
+	parser.add_argument("--start", type=int, default=11, help="Number of the first map, e.g. map011.json.")
+	parser.add_argument("--out", default=str(MAPS_DIR), help="Directory the maps are saved in.")
+	args = parser.parse_args()
+
+	maps = generate_maps(args.count, args.planets, args.symmetry, args.min_distance, args.seed)
+	for i, map_data in enumerate(maps):
+		filename = pathlib.Path(args.out).joinpath("%s%03d.json" % (args.name, args.start + i))
+		with open(filename, "w") as file:
+			json.dump(map_data, file)
+		print("%s: %d planets" % (filename, len(map_data['planets'])))
@@ -0,0 +1,121 @@
+"""Binary protocol of the PlanetWars game server
+
+Spoken between game_server.py and its clients (see remote_bot.py). A
+connection, over TCP or a Unix socket, is a stream of messages (integers
+little-endian):
+
+	[length:uint32][type:uint8][payload: length bytes]
+
+A payload is a run of values, encoded as in a replay (see replay.py): a tag
+byte then the data, with integers as varints. Unlike a replay frame, the
+string table of each direction lasts for the whole connection, so an entity
+ID is only sent in full the first time, and as a short reference after that.
+
+Client to server:
+
+	HELLO    version name lobby  # lobby: the name of the lobby to wait in ('' by default)
+	ORDERS   tick orders wake_tick wake_on_event
+	         # orders: [[type, source, new_fleet_id, ships, destination], ...], as in `Player.orders`
+
+Server to client:
+
+	WELCOME  player_id players max_ticks deadline  # players: {ID: name}
+	TICK     tick planets ages fleets  # what changed in the player's facade, see below
+	END      tick winner ships  # winner: a player ID, or None; ships: {ID: ships}
+	ERROR    message
+
+A TICK is sent to a player when its bot is to be updated, and holds what
+changed in its facade since the last TICK it was sent:
+
+ - planets: [ID, owner, ships, x, y, growth] for each planet new to the
+   client, [ID, owner, ships] for each planet whose owner or ships changed
+ - ages: [ID, vision_age, ID, vision_age, ...] for each planet whose
+   `vision_age` changed
+ - fleets: every fleet in the facade, each either just its ID (a fleet sent
+   before, still on the same course: the client moves it to the tick with
+   `Fleet.position_at`) or [ID, owner, ships, x, y, vx, vy, x0, y0, t0, dest]
+
+"""
+import asyncio
+import struct
+
+from replay import _FrameEncoder, _FrameDecoder, ReplayError
+
+VERSION = 1
+HEADER = struct.Struct('<IB')
+MAX_MESSAGE = 64 * 1024 * 1024
+
+# client to server
+HELLO = 1
+ORDERS = 2
+# server to client
+WELCOME = 16
+TICK = 17
+END = 18
+ERROR = 19
+
+
+class ProtocolError(Exception):
+	pass
+
+
+class Connection():
+
+	''' One end of a connection: messages are read from `reader` and written
+		to `writer` (asyncio streams). Messages bigger than max_size are
+		refused.
+	'''
+
+	def __init__(self, reader, writer, max_size=MAX_MESSAGE):
+		self.reader = reader
+		self.writer = writer
+		self.max_size = max_size
+		self._sent = {}  # string -> index, for the strings sent so far
+		self._received = []
+
+	def encode(self, kind, values):
+		''' The bytes of a message. Strings in it are added to the table of
+			sent strings, so it must be sent (and in order).
+		'''
+		encoder = _FrameEncoder()
+		encoder.strings = self._sent
+		for value in values:
+			encoder.value(value)
+		return HEADER.pack(len(encoder.out), kind) + encoder.out
+
+	async def send(self, kind, *values):
+		self.writer.write(self.encode(kind, values))
+		await self.writer.drain()
+
+	async def receive(self):
+		''' The next message, as (type, [values]), or None once the other end
+			has closed the connection.
+		'''
+		try:
+			size, kind = HEADER.unpack(await self.reader.readexactly(HEADER.size))
+			if size > self.max_size:
+				raise ProtocolError("Message of %d bytes is too big" % size)
+			payload = await self.reader.readexactly(size)
+		except (asyncio.IncompleteReadError, ConnectionError):
+			return None
+		decoder = _FrameDecoder(payload)
+		decoder.strings = self._received
+		values = []
+		try:
+			while decoder.more():
+				values.append(decoder.value())
+		except (ReplayError, IndexError, struct.error, UnicodeDecodeError, RecursionError) as e:
+			raise ProtocolError("Bad message (type %d): %s" % (kind, e))
+		return kind, values
+
+	def close(self):
+		self.writer.close()
+
+
+async def connect(host=None, port=None, path=None):
+	''' A `Connection` to a server at host:port, or at the Unix socket path. '''
+	if path is not None:
+		reader, writer = await asyncio.open_unix_connection(path)
+	else:
+		reader, writer = await asyncio.open_connection(host, port)
+	return Connection(reader, writer)
@@ -0,0 +1,166 @@
+"""Ownership indexes for PlanetWarsGame and player facades
+
+`OwnerIndex` keeps, for each owner, the entities it owns (by ID), and the
+total ships (and growth, for planets) of those entities, so questions like
+"which planets does this player own?" or "is anyone else still alive?" don't
+need a scan of every planet and fleet.
+
+Entities are listed in the order their IDs were first added to the index,
+which is the order of the game's (or facade's) dict, so the answers come
+out in the same order as scanning the dict would give.
+
+The game updates its indexes (`PlanetWarsGame.owned_planets` and
+`owned_fleets`) as fleets are added/removed and planets change owner or
+ships. A facade uses `OwnedDict`, a dict that keeps its own index up to date,
+which works because facade snapshots never change owner or ships.
+
+"""
+import collections
+import heapq
+import itertools
+
+from entities import NEUTRAL_ID
+
+
+class OwnerIndex():
+
+	''' Entities by owner (as {ID: entity} dicts), with per owner totals of
+		`ships` and `growth`. An owner is only listed while it owns something.
+	'''
+
+	def __init__(self):
+		self.owned = {}  # owner -> {ID: entity}
+		self.ships = collections.Counter()
+		self.growth = collections.Counter()
+		self._rank = {}  # ID -> order of first adding
+		self._count = itertools.count()
+		self._unsorted = set()  # owners whose entities may be out of rank order
+		self.changes = 0  # goes up whenever an entity is added, removed or changes owner
+
+	def __contains__(self, owner):
+		return owner in self.owned
+
+	def _insert(self, entity):
+		self.changes += 1
+		ID, owner = entity.ID, entity.owner
+		rank = self._rank.get(ID)
+		if rank is None:
+			rank = self._rank[ID] = next(self._count)
+		owned = self.owned.get(owner)
+		if owned is None:
+			owned = self.owned[owner] = {}
+		elif owned and rank < self._rank[next(reversed(owned))]:
+			self._unsorted.add(owner)
+		owned[ID] = entity
+		self.ships[owner] += entity.ships or 0
+		self.growth[owner] += getattr(entity, 'growth', 0)
+
+	def _discard(self, ID, owner, ships, growth):
+		self.changes += 1
+		owned = self.owned[owner]
+		del owned[ID]
+		if not owned:
+			del self.owned[owner]
+			self._unsorted.discard(owner)
+		self.ships[owner] -= ships or 0
+		self.growth[owner] -= growth
+
+	def add(self, entity):
+		''' Index a new entity. '''
+		self._insert(entity)
+
+	def remove(self, entity):
+		''' Stop indexing an entity (as it is now). '''
+		self._discard(entity.ID, entity.owner, entity.ships, getattr(entity, 'growth', 0))
+		del self._rank[entity.ID]
+
+	def moved(self, entity, owner, ships):
+		''' Re-index an entity that was owned by owner, with ships, and has
+			changed since (keeping its place in the order).
+		'''
+		if entity.owner == owner:
+			self.owned[owner][entity.ID] = entity
+			self.ships[owner] += (entity.ships or 0) - (ships or 0)
+		else:
+			self._discard(entity.ID, owner, ships, getattr(entity, 'growth', 0))
+			self._insert(entity)
+
+	def grow(self, ticks=1):
+		''' Add `ticks` worth of growth to the ship totals of every (non neutral)
+			owner, as `Planet.update` does to its planets.
+		'''
+		for owner, growth in self.growth.items():
+			if owner != NEUTRAL_ID:
+				self.ships[owner] += growth * ticks
+
+	def _in_order(self, owner):
+		owned = self.owned.get(owner, {})
+		if owner in self._unsorted:
+			rank = self._rank
+			owned = self.owned[owner] = dict(sorted(owned.items(), key=lambda item: rank[item[0]]))
+			self._unsorted.discard(owner)
+		return owned
+
+	def owned_by(self, owner):
+		''' A new {ID: entity} dict of what owner owns. '''
+		return dict(self._in_order(owner))
+
+	def not_owned_by(self, *owners):
+		''' A new {ID: entity} dict of what anyone but owners owns. '''
+		parts = [self._in_order(owner).items() for owner in list(self.owned) if owner not in owners]
+		if len(parts) == 1:
+			return dict(parts[0])
+		rank = self._rank
+		return dict(heapq.merge(*parts, key=lambda item: rank[item[0]]))
+
+
+class OwnedDict(dict):
+
+	''' A dict of {ID: entity} that keeps an `OwnerIndex` (`index`) of its
+		values. Entities must not change owner or ships while in the dict
+		(replace them instead), as with facade snapshots.
+	'''
+
+	def __init__(self, *args, **kwargs):
+		super().__init__()
+		self.index = OwnerIndex()
+		self.update(*args, **kwargs)
+
+	def __setitem__(self, ID, entity):
+		old = self.get(ID)
+		if old is not None:
+			self.index.moved(entity, old.owner, old.ships)
+		else:
+			self.index.add(entity)
+		super().__setitem__(ID, entity)
+
+	def __delitem__(self, ID):
+		self.index.remove(self[ID])
+		super().__delitem__(ID)
+
+	def pop(self, ID, *default):
+		if ID in self:
+			self.index.remove(self[ID])
+		return super().pop(ID, *default)
+
+	def popitem(self):
+		ID, entity = super().popitem()
+		self.index.remove(entity)
+		return ID, entity
+
+	def setdefault(self, ID, entity=None):
+		if ID not in self:
+			self[ID] = entity
+		return self[ID]
+
+	def update(self, *args, **kwargs):
+		for ID, entity in dict(*args, **kwargs).items():
+			self[ID] = entity
+
+	def clear(self):
+		super().clear()
+		self.index = OwnerIndex()
+
+	def __reduce__(self):
+		# pickled (e.g. for a sandboxed bot) as a plain dict, rebuilt on arrival
+		return (type(self), (dict(self),))
@@ -1,100 +1,290 @@
-import copy
 import collections
-from entities import Planet, Fleet, NEUTRAL_ID
+import heapq
+import itertools
+import math
+from entities import Planet, Fleet, PlanetSnapshot, FleetSnapshot, NEUTRAL_ID, PLANET_RADIUS_FACTOR
 from players import Player
-from planet_wars_draw import PLANET_RADIUS_FACTOR
-import uuid
+from ownership import OwnerIndex, OwnedDict
+from schedulers import SequentialScheduler
+from spatial import SpatialGrid
+from vision import PlanetVision
+from map_cache import planet_rows
+from events import EventStream, TextLog, Launch, Reinforce, Battle, Capture, InvalidOrder
+
+# sets the vision_age of a (facade) snapshot without the Python level
+# `_Snapshot.__setattr__` check, as update_facade does it for every planet of
+# every facade, every tick
+_set_vision_age = Planet.vision_age.__set__
+
+
+def arrival_tick(fleet):
+	''' The tick of the game update in which fleet arrives at its destination
+		(is within the planet radius after moving), or None if it never will.
+
+		Fleets fly in a straight line at a constant speed, so this is the first
+		whole number of steps k >= 1 inside the roots of
+		|start + k*velocity - dest|^2 = radius^2. The result is checked (and
+		nudged) using `position_at`, so it agrees with the positions shown.
+	'''
+	dest = fleet.dest
+	radius_sq = ((dest.growth+1) * PLANET_RADIUS_FACTOR)**2
+
+	def arrived(k):
+		x, y = fleet.position_at(fleet.t0 + k)
+		return (x - dest.x)**2 + (y - dest.y)**2 <= radius_sq
+
+	dx = fleet.x0 - dest.x
+	dy = fleet.y0 - dest.y
+	a = fleet.vx * fleet.vx + fleet.vy * fleet.vy
+	b = 2 * (fleet.vx * dx + fleet.vy * dy)
+	c = dx * dx + dy * dy - radius_sq
+	disc = b * b - 4 * a * c
+	if disc < 0:
+		return None
+	last = (-b + math.sqrt(disc)) / (2 * a)
+	k = max(1, math.ceil((-b - math.sqrt(disc)) / (2 * a)))
+	while k > 1 and arrived(k - 1):
+		k -= 1
+	while not arrived(k):
+		if k > last + 1:
+			return None
+		k += 1
+	# launched during the update of tick t0, which is also its first step
+	return fleet.t0 + k - 1
+
+
+class ObjectState():
+
+	''' The default state backend: every planet and fleet is a plain entity
+		object, updated one at a time. See `ArrayState` (array_state.py) for
+		the NumPy backend, which implements the same methods.
+	'''
+
+	def __init__(self, game):
+		self.game = game
+
+	def load_planets(self, planets_json):
+		''' Return a dict of new planets, keyed by ID. '''
+		planets = {}
+		for x, y, ID, owner, ships, growth in planet_rows(planets_json):
+			p = Planet(x, y, ID, owner, ships, growth)
+			planets[p.ID] = p
+		return planets
+
+	def new_fleet(self, ID, owner, ships, src, dest):
+		return Fleet(ID, owner, ships, src, dest, tick=self.game.tick)
+
+	def load_fleet(self, fleet_json):
+		''' A new fleet from its serialised form (see `Fleet.serialise`). '''
+		f = fleet_json
+		fleet = Fleet(f.get('ID'), f['owner'], f['ships'], dest=self.game.planets[f['dest']],
+					  x=f.get('x0', f['x']), y=f.get('y0', f['y']), tick=f.get('t0', self.game.tick))
+		fleet.update(self.game.tick)
+		return fleet
+
+	def remove_fleet(self, fleet):
+		pass
+
+	def grow_planets(self, ticks=1):
+		for planet in self.game.planets.values():
+			planet.update(ticks)
+
+	def move_fleets(self, tick):
+		''' Bring the position of every fleet (and the fleet grid) up to tick. '''
+		for f in self.game.fleets.values():
+			f.update(tick)
+			self.game.fleet_grid.move(f)
+
+	def resolve_arrivals(self, fleets):
+		''' Remove the arrived fleets and settle the owner and ships of each
+			planet they arrived at. Yields (planet, outcome) for each of those
+			planets, where outcome is one of 'reinforced', 'defended' or
+			'captured'.
+		'''
+		arrivals = collections.defaultdict(list)
+		for f in fleets:
+			arrivals[f.dest].append(f)
+		for p, fleets in arrivals.items():
+			forces = collections.defaultdict(int)
+			# add the current occupier of the planet
+			forces[p.owner] = p.ships
+			# add arriving fleets
+			for f in fleets:
+				self.game._remove_fleet(f)
+				forces[f.owner] += f.ships
+			# no battle, just reinforce
+			if len(forces) == 1:
+				p.ships = forces[p.owner]
+				yield p, 'reinforced'
+			else:
+				# Battle!
+				# There are at least 2 forces, maybe more. Biggest force is winner.
+				# Gap between 1st and 2nd is the remaining force. (The rest cancel each out.)
+				result = sorted([(v, k)
+								for k, v in forces.items()], reverse=True)
+				winner = result[0][1]
+				gap_size = result[0][0] - result[1][0]
+				if gap_size == 0:
+					winner = p.owner  # if the planet winds up on 0, it stays with the current owner
+				outcome = 'defended' if winner == p.owner else 'captured'
+				# Set the new owner
+				p.owner = winner
+				p.ships = gap_size
+				yield p, outcome
 
 
 class PlanetWarsGame():
-	def __init__(self, gamestate_json, logger=None, replay_object=None):
-		self.planets = {}
-		for p in gamestate_json['planets']:
-			p = Planet(
-				p['x'],
-				p['y'],
-				p.get('ID'),
-				p.get('owner'),
-				p.get('ships'),
-				p.get('growth')
-			)
-			self.planets[p.ID] = p
+
+	''' A PlanetWars game. Each call of `update` plays one game tick.
+
+		With `fast_forward` set, `update` first jumps straight over ticks in
+		which nothing can happen: no fleet arrives, no replay orders are due
+		and every bot is asleep (see `Player.sleep_until` and
+		`Player.sleep_until_event`). Planet growth over the skipped ticks is
+		applied in one step, and the facades are refreshed once on landing, so
+		a facade's `vision_age` counts facade refreshes rather than ticks.
+		Bots that don't ask to sleep are woken every tick, as before, so a
+		game only gets faster when all of its bots opt in.
+
+		A `replay_writer` (see replay.py) records the game as it is played. A
+		game can be replayed from `replay`, an iterable of (tick, orders) such
+		as a `ReplayReader`, whose orders are read as the game reaches them.
+
+		A `profiler` (see profiler.py) is told when each phase of `update`
+		ends, and how long each bot took.
+
+		A `scheduler` (see schedulers.py) updates the awake bots each tick,
+		e.g. at the same time in threads or in their own processes. By
+		default they are updated one after another in this process.
+
+		`controllers` gives the bot controllers (by player ID) of players
+		whose bot isn't found by name in /bots, e.g. the remote bots of a
+		game server (see game_server.py).
+	'''
+
+	def __init__(self, gamestate_json, logger=None, replay_writer=None, backend='objects', fast_forward=False, replay=None,
+				 profiler=None, scheduler=None, controllers=None):
+		# where planet and fleet state is kept - see ObjectState
+		if backend == 'arrays':
+			from array_state import ArrayState  # needs numpy
+			self.state = ArrayState(self)
+		elif backend == 'objects':
+			self.state = ObjectState(self)
+		else:
+			raise ValueError("Unknown state backend %r" % backend)
+		# a gamestate saved part way through a game (e.g. a replay keyframe) carries on from its tick
+		self.tick = gamestate_json.get('tick', 0)
+		self.planets = self.state.load_planets(gamestate_json['planets'])
 		self.fleets = {}
+		# what each owner owns, kept up to date as fleets come and go and planets change hands (see ownership.py)
+		self.owned_planets = OwnerIndex()
+		for planet in self.planets.values():
+			self.owned_planets.add(planet)
+		self.owned_fleets = OwnerIndex()
+		# heap of (tick, n, fleet): the tick each fleet in flight arrives on
+		self.arrivals = []
+		self._arrival_count = itertools.count()
+		# spatial indexes used for vision checks. Planets never move, fleets
+		# are kept up to date as they are launched, move and arrive
+		self.planet_grid = SpatialGrid(self.planets.values())
+		self.fleet_grid = SpatialGrid()
+		# planets don't move, so what they can see is cached (see vision.py)
+		self.planet_vision = PlanetVision(self.planets)
+		self._last_seen = {}  # player ID -> (owned planets, what each could see, last_seen) of the last facade
 		if 'fleets' in gamestate_json:
 			for f in gamestate_json['fleets']:
-				f = Fleet(f)
-				self.fleets[f.ID] = f
+				self._add_fleet(self.state.load_fleet(f))
+		self._planet_order = {ID: i for i, ID in enumerate(self.planets)}
+		self._last_planet = next(reversed(self.planets.values()), None)
 		self.orders = collections.defaultdict(list)
 		if 'orders' in gamestate_json:
 			# gamestate orders generally come from a replay - they are executed before control is handed over to players
 			# they are just json object, but we want to order them by the tick they are executed on
 			for order in gamestate_json['orders']:
 				self.orders[order['tick']].append(order)
+		self.replay = iter(replay) if replay is not None else None
 		if 'players' in gamestate_json:
 			self.players = {}
 			self.players[NEUTRAL_ID] = Player(NEUTRAL_ID, "Neutral")
 			for p in gamestate_json['players']:
-				self.players[p["ID"]] = Player(p["ID"], p["name"])
+				self.players[p["ID"]] = Player(p["ID"], p["name"], (controllers or {}).get(p["ID"]))
+		# what happens in the game, for anything that subscribes (see events.py)
+		self.events = EventStream()
 		if logger:
 			logger = logger.replace('.py', '')
 			# ... the top logscript dir (dir)
 			module = __import__('logscript.'+logger)
 			module = getattr(module, logger)  # ... then the bot mod (file)
 			cls = getattr(module, logger)		# ... the class
-			self.turn_log = cls().log
+			self.events.subscribe(TextLog(cls().log))
 
-		self.tick = 0
 		self.max_ticks = gamestate_json.get('max_ticks')
 		self.winner = None
 		self.dirty = True
 		self.paused = True
+		self.fast_forward = fast_forward
+		self.profiler = profiler
+		# runs the bots in phase 0 of update
+		self.scheduler = scheduler if scheduler is not None else SequentialScheduler()
 
-		self.spawn_players()
+		if 'tick' not in gamestate_json:
+			# a new game rather than a saved one, where players may have been wiped out
+			self.spawn_players()
 		# set initial facades
 		for player in self.players.values():
 			if player.ID != NEUTRAL_ID:
 				self.update_facade(player)
 
-		self.replay_object = replay_object
-		if self.replay_object is not None:
-			self.replay_object["orders"] = []
-			self.serialise_to_replay()
+		self.replay_writer = replay_writer
+		if self.replay_writer is not None:
+			# Save the initial state to the replay file
+			self.replay_writer.write_header(self.serialise())
 
-	def serialise_to_replay(self):
-		# Save the initial state to the replay file
-		for planet in self.planets.values():
-			self.replay_object["planets"].append(planet.serialise())
-		for fleet in self.fleets.values():
-			self.replay_object["fleets"].append(fleet.serialise())
-		for player in self.players.values():
-			self.replay_object["players"].append(player.serialise())
-		
+	def serialise(self):
+		''' The current state of the game as a gamestate dict. '''
+		return {
+			'tick': self.tick,
+			'max_ticks': self.max_ticks,
+			'planets': [planet.serialise() for planet in self.planets.values()],
+			'fleets': [fleet.serialise() for fleet in self.fleets.values()],
+			'players': [player.serialise() for player in self.players.values() if player.ID != NEUTRAL_ID]
+		}
+
+	def _read_replay(self):
+		''' Make sure the orders of the next replayed tick (if any are left)
+			are in self.orders, so players stay out of it until it is over.
+		'''
+		if self.replay is not None and len(self.orders.keys()) == 0:
+			item = next(self.replay, None)
+			if item is None:
+				self.replay = None
+			else:
+				tick, orders = item
+				self.orders[tick].extend(orders)
 
 	def spawn_players(self):
 		players_to_be_spawned = []
-		# should we keep this on self as a speedy cache and just move planets around when they change hands?
-		planets_by_player = collections.defaultdict(list)
 		centroid_of_owned_planets = [0, 0]
 		sum_of_owned_planets = [0, 0]
 		sum_of_planets = [0, 0]
 		count_of_owned_planets = 0
 		for player in self.players.values():
-			for planet in self.planets.values():
-				sum_of_planets[0] += planet.x
-				sum_of_planets[1] += planet.y
-				if planet.owner == player.ID:
-					planets_by_player[player.ID].append(planet)
-					sum_of_owned_planets[0] += planet.x
-					sum_of_owned_planets[1] += planet.y
-					count_of_owned_planets += 1
-			if not player.ID in planets_by_player.keys():
+			owned = self.owned_planets.owned_by(player.ID)
+			for planet in owned.values():
+				sum_of_owned_planets[0] += planet.x
+				sum_of_owned_planets[1] += planet.y
+				count_of_owned_planets += 1
+			if not owned:
 				players_to_be_spawned.append(player.ID)
-		unowned_planets = planets_by_player.pop(NEUTRAL_ID)
+		unowned_planets = list(self.owned_planets.owned_by(NEUTRAL_ID).values())
 		# quick check that we have enough planets for players
 		if len(players_to_be_spawned) > len(unowned_planets):
 			raise ValueError("Not enough planets for players to spawn")
 		for playerID in players_to_be_spawned:
 			if count_of_owned_planets == 0:
+				for planet in self.planets.values():
+					sum_of_planets[0] += planet.x
+					sum_of_planets[1] += planet.y
 				centroid_of_owned_planets[0] = sum_of_planets[0] / \
 					count_of_owned_planets
 				centroid_of_owned_planets[1] = sum_of_planets[0] / \
@@ -115,159 +305,277 @@ class PlanetWarsGame():
 					candidate = planet
 					dist = _dist
 			candidate.owner = playerID
+			self.owned_planets.moved(candidate, NEUTRAL_ID, candidate.ships)
 			unowned_planets.remove(candidate)
 			sum_of_owned_planets[0] += candidate.x
 			sum_of_owned_planets[1] += candidate.y
 			count_of_owned_planets += 1
 			# if we use planets_by_player again, be sure to set it up here
 
-	# adds target to an entity dict (defaults to deepcopy)
-	# if it is in vision_range of src
-	# does not add if:
-	# - they have the same owner (force/update param overrides this behaviour)
-	# - target already exists in entity_list
-	# return True if planet aded, False otherwise
-	def add_to_vision_list(self, src, target, entity_dict, force=False, update=True, shallowcpy=False):
-		if shallowcpy:
-			_copy = copy.copy
-		else:
-			_copy = copy.deepcopy
-		# obviously it can see other entities owned by the same player
-		if src.owner == target.owner:
-			if force:
-				entity_dict[target.ID] = _copy(target)
-				return True
-			return False
-
-		# skip planets that have already be seen by something else
-		if force or update or target.ID not in entity_dict.facade.planets:
-			# check vision range and add if visible
-			if src.distance_to(target) < src.vision_range()**2:
-				entity_dict[target.ID] = copy.deepcopy(target)
-				return True
+	def _planet_view(self, player, planet):
+		''' Return the facade snapshot of planet for player, replacing the one
+			the player holds only if the planet has changed since.
+		'''
+		facade = player.planets.get(planet.ID)
+		if facade is None or not facade.matches(planet):
+			facade = player.planets[planet.ID] = PlanetSnapshot(planet)
+		return facade
+
+	def _fleet_view(self, player, previous, fleet):
+		''' Add a (visible) fleet to the player facade, reusing the snapshot
+			from the previous facade if the fleet hasn't changed since.
+		'''
+		facade = previous.get(fleet.ID)
+		if facade is None or not facade.matches(fleet):
+			facade = FleetSnapshot(fleet, player.planets)
+		facade.vision_age = 0
+		player.fleets[fleet.ID] = facade
 
 	def update_facade(self, player):
-		player.fleets = {}  # no memory of fleets last locations
+		''' Rebuild the fog-of-war facade (`planets` and `fleets`) of a player.
+
+			Fleet candidates come from the planet/fleet grids, so each source
+			only checks entities in nearby cells. What owned planets can see of
+			other planets comes from `planet_vision`, and is only worked out
+			again when it changes. The result (including each planet's
+			`vision_age`) matches the original all-pairs loop, in which every
+			source that could *not* see a planet bumped its `vision_age` by
+			one, and a source that could see it reset it to 0.
+
+			Facades hold read-only snapshots, which are only replaced when the
+			real entity's owner, ships or position has changed.
+		'''
+		previous = player.fleets
+		player.fleets = OwnedDict()  # no memory of fleets last locations
 		player.tick = self.tick
 		if len(player.planets) == 0:
 			# player starts the game with knowledge of the inital state of all planets
 			# TODO: this shouldn't be the case if the game is loaded from a later state
-			player.planets = copy.deepcopy(self.planets)
-		else:
 			for planet in self.planets.values():
-				if planet.owner == player.ID:
-					# you can see a planet if you own it
-					player.planets[planet.ID] = copy.deepcopy(planet)
-					# check what other planets this planet can see
-					for other in self.planets.values():
-						if self.add_to_vision_list(planet, other, player.planets):
-							player.planets[other.ID].vision_age = 0
-						else:
-							player.planets[other.ID].vision_age += 1
-					# same logic, but for fleets
-					for other in self.fleets.values():
-						if self.add_to_vision_list(planet, other, player.fleets):
-							player.fleets[other.ID].vision_age = 0
-
-		for fleet in self.fleets.values():
-			if fleet.owner == player.ID:
-				# you can see a fleet if you own it
-				player.fleets[fleet.ID] = copy.deepcopy(fleet)
-				# check what other planets this fleet can see
-				for other in self.planets.values():
-					if self.add_to_vision_list(fleet, other, player.planets):
-						player.planets[planet.ID].vision_age = 0
-					else:
-						player.planets[planet.ID].vision_age += 1
-
-				# same logic, but for fleets
-				for other in self.fleets.values():
-					if self.add_to_vision_list(fleet, other, player.fleets):
-						player.fleets[other.ID].vision_age = 0
+				player.planets[planet.ID] = PlanetSnapshot(planet)
+		else:
+			owned = list(self.owned_planets.owned_by(player.ID).values())
+			changes = self.owned_planets.changes
+			seen = [self.planet_vision.seen_by(planet, changes) for planet in owned]
+			cached = self._last_seen.get(player.ID)
+			if (cached is not None and cached[0] == owned
+					and all(a is b for a, b in zip(cached[1], seen))):
+				last_seen = cached[2]
+			else:
+				# rank of the last owned planet (in planet order) that saw each planet
+				last_seen = {}
+				for rank, planet in enumerate(owned):
+					# you can see a planet if you own it. It is (re)copied on its
+					# own turn and then aged by every owned planet from there on,
+					# itself included, as same-owner planets never "see" each other
+					last_seen[planet.ID] = rank - 1
+					for other in seen[rank]:
+						last_seen[other.ID] = rank
+				self._last_seen[player.ID] = (owned, seen, last_seen)
+			if any(owner != player.ID for owner in self.owned_fleets.owned):
+				# only worth looking if someone else has fleets out
+				for planet in owned:
+					for other in self.fleet_grid.in_range(planet):
+						if other.owner != player.ID:
+							self._fleet_view(player, previous, other)
+			count = len(owned)
+			for ID, facade in player.planets.items():
+				rank = last_seen.get(ID)
+				if rank is None:
+					_set_vision_age(facade, facade.vision_age + count)
+				else:
+					_set_vision_age(self._planet_view(player, self.planets[ID]), count - 1 - rank)
+
+		# Fleet vision of planets has always been credited to the last planet
+		# in the map (rather than the planet seen): kept as is so facades stay
+		# the same as the brute-force loop produced.
+		last = self._last_planet
+		for fleet in self.owned_fleets.owned_by(player.ID).values():
+			# you can see a fleet if you own it
+			self._fleet_view(player, previous, fleet)
+			# check what other planets this fleet can see
+			newest = -1
+			for other in self.planet_grid.in_range(fleet):
+				if other.owner != player.ID:
+					self._planet_view(player, other).vision_age = 0
+					newest = max(newest, self._planet_order[other.ID])
+			if newest >= 0:
+				player.planets[last.ID].vision_age = len(self.planets) - 1 - newest
+			else:
+				player.planets[last.ID].vision_age += len(self.planets)
+			# same logic, but for fleets
+			for other in self.fleet_grid.in_range(fleet):
+				if other.owner != player.ID:
+					self._fleet_view(player, previous, other)
 
 	def update(self, t=None, manual=False):
 		if self.paused and not manual:
 			return
+		profiler = self.profiler
+		if profiler:
+			profiler.start(self.tick)
+		self._read_replay()
+		if self.fast_forward and not self._skip_idle_ticks():
+			if profiler:
+				profiler.mark('skip')
+				profiler.end()
+			return
+		if profiler:
+			profiler.mark('skip')
 		# phase 0, Give each player (controller) a chance to create new fleets
 		# skipped if there are orders still in self.orders - players don't get to act until after the replay has finished
+		# sleeping players (see Player.sleep_until) are skipped too
+		order_count = 0
 		if len(self.orders.keys()) == 0:
-			for player in self.players.values():
-				if player.ID != NEUTRAL_ID:
-					player.update()
+			self.scheduler.update(self, [player for player in self.players.values()
+										 if player.ID != NEUTRAL_ID and player.is_awake(self.tick)])
+			if profiler:
+				profiler.mark('bots')
 			# phase 1, Retrieve and process all pending orders from each player or from the replay
+			recorded = []
 			for player in self.players.values():
 				if player.ID != NEUTRAL_ID:
+					if self.replay_writer is not None:
+						recorded.extend((player.ID, order) for order in player.orders)
+					order_count += len(player.orders)
 					self._process_orders(player.orders, player)
 					player.orders = []
+			if recorded:
+				# Save the orders to the replay file
+				self.replay_writer.write_orders(self.tick, recorded)
 		else:
+			order_count = len(self.orders[self.tick])
 			self._process_orders(self.orders[self.tick])
 			del self.orders[self.tick]
+		if profiler:
+			profiler.mark('orders')
 		# phase 2, Planet ship number growth (advancement)
-		for planet in self.planets.values():
-			planet.update()
-		# phase 3, Update fleets, check for arrivals
-		arrivals = collections.defaultdict(list)
-		for f in self.fleets.values():
-			f.update()
-			if f.distance_to(f.dest) <= ((f.dest.growth+1) * PLANET_RADIUS_FACTOR)**2:
-				arrivals[f.dest].append(f)
+		self.state.grow_planets()
+		self.owned_planets.grow()
+		if profiler:
+			profiler.mark('growth')
+		# phase 3, Collect the fleets due to arrive this tick
+		arrivals = []
+		while self.arrivals and self.arrivals[0][0] <= self.tick:
+			fleet = heapq.heappop(self.arrivals)[2]
+			# skip fleets that are gone (e.g. merged into a fleet order)
+			if self.fleets.get(fleet.ID) is fleet:
+				arrivals.append(fleet)
+		if profiler:
+			profiler.mark('arrivals')
 		# phase 4, Collate fleet arrivals and planet forces by owner
-		for p, fleets in arrivals.items():
-			forces = collections.defaultdict(int)
-			# add the current occupier of the planet
-			forces[p.owner] = p.ships
-			# add arriving fleets
-			for f in fleets:
-				self.fleets.pop(f.ID)
-				forces[f.owner] += f.ships
-			# no battle, just reinforce
-			if len(forces) == 1:
-				self.turn_log(
-					"{0:4d}: Player {1} reinforced planet {2}".format(self.tick, p.owner, p.ID))
-				p.ships = forces[p.owner]
-			else:
-				# Battle!
-				# There are at least 2 forces, maybe more. Biggest force is winner.
-				# Gap between 1st and 2nd is the remaining force. (The rest cancel each out.)
-				result = sorted([(v, k)
-								for k, v in forces.items()], reverse=True)
-				winner = result[0][1]
-				gap_size = result[0][0] - result[1][0]
-				if gap_size == 0:
-					winner = p.owner  # if the planet winds up on 0, it stays with the current owner
-				# If meaningful outcome, log it
-				if winner == p.owner:
-					self.turn_log(
-						"{0:4d}: Player {1} defended planet {2}".format(self.tick, winner, p.ID))
-				else:
-					self.turn_log(
-						"{0:4d}: Player {1} now owns planet {2}".format(self.tick, winner, p.ID))
-				# Set the new owner
-				p.owner = winner
-				p.ships = gap_size
+		events = self.events
+		before = {f.dest.ID: (f.dest.owner, f.dest.ships) for f in arrivals}
+		for p, outcome in self.state.resolve_arrivals(arrivals):
+			owner, ships = before[p.ID]
+			self.owned_planets.moved(p, owner, ships)
+			if outcome == 'reinforced':
+				if events.wants(Reinforce.kind):
+					events.emit(Reinforce(self.tick, p.owner, p.ID, p.ships))
+			elif outcome == 'defended':
+				if events.wants(Battle.kind):
+					events.emit(Battle(self.tick, p.owner, p.ID, p.ships))
+			elif events.wants(Capture.kind):
+				events.emit(Capture(self.tick, p.owner, owner, p.ID, p.ships))
 			# Either a planet changed hands or was defended/reinforced
 			# either way fleets/planets rendering need to be updated
 			self.dirty = True
+		if arrivals:
+			# fleets arriving is the event that sleep_until_event waits for (a
+			# bot sleeping just until a tick sleeps on)
+			for player in self.players.values():
+				if player.wake_on_event:
+					player.wake()
+		if profiler:
+			profiler.mark('battles')
 		# phase 5, Update the game tick count.
 		self.tick += 1
 		# phase 6, Resync current facade view of the map for each player
+		# fleets only move when something looks at them - this is it
+		self.state.move_fleets(self.tick)
+		if profiler:
+			profiler.mark('movement')
 		for player in self.players.values():
 			if player.ID != NEUTRAL_ID:
 				self.update_facade(player)
+		if self.replay_writer is not None and self.replay_writer.keyframe_due(self.tick):
+			self.replay_writer.write_keyframe(self.tick, self.serialise())
+		if profiler:
+			profiler.mark('facades')
+			profiler.count(planet_count=len(self.planets), fleet_count=len(self.fleets), order_count=order_count)
+			profiler.end()
+
+	def _next_busy_tick(self):
+		''' The first tick, from now on, in which something can happen: a fleet
+			arrives, replay orders are due or a player is awake. None if there
+			is no such tick (e.g. all players sleep until an event that can't
+			come), in which case the game is only limited by max_ticks.
+		'''
+		ticks = []
+		# drop the arrivals of fleets that are gone (e.g. merged into a fleet order)
+		while self.arrivals and self.fleets.get(self.arrivals[0][2].ID) is not self.arrivals[0][2]:
+			heapq.heappop(self.arrivals)
+		if self.arrivals:
+			ticks.append(self.arrivals[0][0])
+		if len(self.orders.keys()) != 0:
+			ticks.append(min(self.orders.keys()))
+		else:
+			for player in self.players.values():
+				if player.ID == NEUTRAL_ID:
+					continue
+				if player.is_awake(self.tick):
+					return self.tick
+				if player.wake_tick is not None:
+					ticks.append(player.wake_tick)
+		return max(self.tick, min(ticks)) if ticks else None
+
+	def _skip_idle_ticks(self):
+		''' Jump to the next busy tick (capped at max_ticks), as if every tick
+			in between had been played. Returns False if the game reached
+			max_ticks, with no tick left to play.
+		'''
+		tick = self._next_busy_tick()
+		if self.max_ticks is not None and (tick is None or tick > self.max_ticks):
+			tick = self.max_ticks
+		if tick is not None and tick > self.tick:
+			# planets grow by the same amount every tick they're not fought over
+			self.state.grow_planets(tick - self.tick)
+			self.owned_planets.grow(tick - self.tick)
+			self.tick = tick
+			self.state.move_fleets(self.tick)
+			for player in self.players.values():
+				if player.ID != NEUTRAL_ID:
+					self.update_facade(player)
+			self.dirty = True
+		return self.max_ticks is None or self.tick < self.max_ticks
 
 	def _process_orders(self, orders, player=None):
 		''' Process all pending orders for the player, then clears the orders.
 				An order sends ships from a player-owned fleet or planet to a planet.
 
 				Checks for valid order conditions:
-				- Valid source src (planet or fleet)
+				- Valid source src (planet or fleet, as the order type says)
 				- Valid destination dest (planet only)
 				- Source is owned by player
 				- Source has ships to launch (>0)
 				- Limits number of ships to number available
+				- The new fleet ID isn't already taken (a fleet can only reuse
+				  its own ID, when all of its ships go)
 
 				Invalid orders are modified (ship number limit) or ignored.
+
+				Orders are checked and carried out in one pass, in order. Several
+				orders can launch from the same source, each getting at most the
+				ships the earlier ones left. A fleet launched by these orders
+				can't itself be given an order until the next tick.
 		'''
+		planets = self.planets
+		fleets = self.fleets
+		events = self.events
+		# records are only made if someone is listening
+		log_invalid = events.wants(InvalidOrder.kind)
+		log_launch = events.wants(Launch.kind)
+		launched = set()  # IDs of the fleets launched by these orders
 		for order in orders:
 			try:
 				# order is a dict
@@ -281,76 +589,69 @@ class PlanetWarsGame():
 				# TODO: update player orders to use some nice JSON
 				o_type, src_id, new_id, ships, dest_id = order
 			# Check for valid fleet or planet id?
-			if src_id not in (self.planets.keys() | self.fleets.keys()):
-				self.turn_log("Invalid order ignored - not a valid source.")
+			if o_type == 'fleet':
+				src = fleets.get(src_id) if src_id not in launched else None
+			elif o_type == 'planet':
+				src = planets.get(src_id)
+			else:
+				src = None
 			# Check for valid planet destination?
 			# TODO: allow destination to be a fleet or an x,y coord
-			elif dest_id not in self.planets:
-				self.turn_log(
-					"Invalid order ignored - not a valid destination.")
+			dest = planets.get(dest_id)
+			if src is None:
+				if log_invalid:
+					events.emit(InvalidOrder(self.tick, player.ID, 'bad_source', o_type, src_id, dest_id, ships, True))
+			elif dest is None:
+				if log_invalid:
+					events.emit(InvalidOrder(self.tick, player.ID, 'bad_destination', o_type, src_id, dest_id, ships, True))
+			# Check that player owns the source of ships!
+			elif src.owner != player.ID:
+				if log_invalid:
+					events.emit(InvalidOrder(self.tick, player.ID, 'not_owner', o_type, src_id, dest_id, ships, True))
 			else:
-				# Extract and use the src and dest details
-				src = self.fleets[src_id] if o_type == 'fleet' else self.planets[src_id]
-				dest = self.planets[dest_id]
-				# Check that player owns the source of ships!
-				if src.owner is not player.ID:
-					self.turn_log(
-						"Invalid order ignored - player does not own source!")
 				# Is the number of ships requested valid?
 				if ships > src.ships:
-					self.turn_log(
-						"Invalid order modified - not enough ships. Max used.")
+					if log_invalid:
+						events.emit(InvalidOrder(self.tick, player.ID, 'too_many_ships', o_type, src_id, dest_id, ships, False))
 					ships = src.ships
 				# Still ships to launch? Do it ...
-				if ships > 0:
-					fleet = Fleet(new_id, player.ID, ships, src, dest)
+				if ships <= 0:
+					if log_invalid:
+						events.emit(InvalidOrder(self.tick, player.ID, 'no_ships', o_type, src_id, dest_id, ships, True))
+				elif new_id in planets or (new_id in fleets and (new_id != src_id or ships < src.ships)):
+					if log_invalid:
+						events.emit(InvalidOrder(self.tick, player.ID, 'fleet_id_taken', o_type, src_id, dest_id, ships, True))
+				else:
+					fleet = self.state.new_fleet(new_id, player.ID, ships, src, dest)
 					src.remove_ships(ships)
+					owned = self.owned_fleets if o_type == 'fleet' else self.owned_planets
+					owned.moved(src, src.owner, src.ships + ships)
 					# old empty fleet removal
 					if o_type == 'fleet' and src.ships == 0:
-						del self.fleets[src.id]
+						self._remove_fleet(src)
 					# keep new fleet
-					self.fleets[new_id] = fleet
-					msg = "{0:4d}: Player {1} launched {2} (left {3}) ships from {4} {5} to planet {6}".format(
-						self.tick, player.ID, ships, src.ships, o_type, src.ID, dest.ID)
-					self.turn_log(msg)
-					# player.log(msg)
+					self._add_fleet(fleet)
+					launched.add(new_id)
+					if log_launch:
+						events.emit(Launch(self.tick, player.ID, o_type, src.ID, new_id, dest.ID, ships, src.ships))
 					self.dirty = True
-				else:
-					self.turn_log(
-						"Invalid order ignored - no ships to launch.")
-
-				if self.replay_object:
-					# Save the orders to the replay file
-					for order in player.orders:
-						self.replay_object["orders"].append(
-							{
-								"ID": uuid.uuid1().__str__(),
-								"owner": player.ID,
-								"tick": self.tick,
-								"name": order[0],
-								"type": order[0],
-								"source": order[1],
-								"destination": order[4],
-								"ships": order[3],
-								"new_fleet_id": order[2].__str__()
-							}
-						)
 
+	def _add_fleet(self, fleet):
+		self.fleets[fleet.ID] = fleet
+		self.owned_fleets.add(fleet)
+		self.fleet_grid.insert(fleet)
+		tick = arrival_tick(fleet)
+		if tick is not None:
+			heapq.heappush(self.arrivals, (tick, next(self._arrival_count), fleet))
+
+	def _remove_fleet(self, fleet):
+		del self.fleets[fleet.ID]
+		self.owned_fleets.remove(fleet)
+		self.fleet_grid.remove(fleet)
+		self.state.remove_fleet(fleet)
 
 	def is_alive(self):
 		''' Return True if two or more players are still alive. '''
-		living_players = []
-		for planet in self.planets.values():
-			if planet.owner != NEUTRAL_ID and planet.owner not in living_players:
-				living_players.append(planet.owner)
-				if len(living_players) > 1:
-					return True
-		for fleet in self.fleets.values():
-			if fleet.owner != NEUTRAL_ID and fleet.owner not in living_players:
-				living_players.append(fleet.owner)
-				if len(living_players) > 1:
-					return True
-		return False
-
-	def turn_log(self, msg):
-		pass
+		living_players = set(self.owned_planets.owned) | set(self.owned_fleets.owned)
+		living_players.discard(NEUTRAL_ID)
+		return len(living_players) > 1
@@ -1,12 +1,25 @@
 import pyglet
+import collections
+import math
 import pathlib
-from entities import NEUTRAL_ID, SCALE_FACTOR
+import threading
+import time
+from entities import NEUTRAL_ID, SCALE_FACTOR, PLANET_RADIUS_FACTOR
 
 
-PLANET_RADIUS_FACTOR = 12
 FLEET_SIZE_FACTOR = 0.25
 WINDOW_X = 1000
 WINDOW_Y = 800
+SEEK_STEP = 100  # ticks jumped by the left/right keys in a replay (x10 with shift)
+TPS_STEPS = (1, 2, 5, 10, 20, 30, 60, 120, 250, 500, 1000, 2000, 5000, None)  # game speeds (ticks a second) of the +/- keys, None being as fast as it goes
+#level of detail: planets get a circle segment every SEGMENT_LENGTH pixels of outline (within these limits)
+SEGMENT_LENGTH = 6
+MIN_SEGMENTS = 8
+MAX_SEGMENTS = 40
+FLEET_LABEL_SHIPS = 20  # smaller fleets get no label of their own, but are counted in a cluster label
+CLUSTER_SIZE = 60  # small fleets of one owner in the same square (of pixels) this big are labelled together
+LABEL_CELL = 50  # grid (in pixels) that labels are checked for overlap in
+LABEL_CHAR_WIDTH = 0.6  # rough width of a character of a label, over its height
 
 #region colours
 COLOR_NAMES = {
@@ -40,92 +53,402 @@ IMAGES = {
 }
 
 
+#every fleet triangle is drawn from one vertex list (see FleetTriangles), with this shader
+FLEET_VERTEX_SOURCE = """#version 150 core
+	in vec2 position;
+	in vec4 colors;
+	out vec4 vertex_colors;
+
+	uniform WindowBlock
+	{
+		mat4 projection;
+		mat4 view;
+	} window;
+
+	void main()
+	{
+		gl_Position = window.projection * window.view * vec4(position, 0.0, 1.0);
+		vertex_colors = colors;
+	}
+"""
+
+FLEET_FRAGMENT_SOURCE = """#version 150 core
+	in vec4 vertex_colors;
+	out vec4 final_color;
+
+	void main()
+	{
+		final_color = vertex_colors;
+	}
+"""
+
+
+def to_screen(x, y):
+	''' Convert a position from game space to render space. '''
+	return ((x/SCALE_FACTOR-0.5)*0.9+0.5)*WINDOW_X, ((y/SCALE_FACTOR-0.5)*0.9+0.5)*WINDOW_Y
+
+
+def circle_segments(radius):
+	''' The number of segments to draw a circle of radius (in pixels) with. '''
+	return min(max(int(2 * math.pi * radius / SEGMENT_LENGTH), MIN_SEGMENTS), MAX_SEGMENTS)
+
+
+def label_size(text, font_size):
+	''' Roughly the width and height (in pixels) of a label, without laying it out. '''
+	height = font_size * 96 / 72	#points at pyglet's 96 dpi
+	return len(text) * height * LABEL_CHAR_WIDTH, height
+
+
+class LabelSpace:
+	''' The boxes of the labels placed so far, in a grid of LABEL_CELL sized
+		cells, so a label is only checked for overlap against those near it.
+		Labels are placed first come first served, so place the important
+		ones first. Labels placed in under (another LabelSpace) are kept clear
+		of too.
+	'''
+
+	def __init__(self, under=None):
+		self.cells = {}	#(cx, cy) -> [(left, bottom, right, top)]
+		self.under = under
+
+	def overlaps(self, box, cells):
+		left, bottom, right, top = box
+		for cell in cells:
+			for l, b, r, t in self.cells.get(cell, ()):
+				if left < r and l < right and bottom < t and b < top:
+					return True
+		return self.under is not None and self.under.overlaps(box, cells)
+
+	def place(self, x, y, text, font_size):
+		''' Take the space of a label centred at x, y if it is free. Returns
+			whether it was.
+		'''
+		w, h = label_size(text, font_size)
+		box = (x - w/2, y - h/2, x + w/2, y + h/2)
+		cells = [
+			(cx, cy)
+			for cx in range(int(box[0] // LABEL_CELL), int(box[2] // LABEL_CELL) + 1)
+			for cy in range(int(box[1] // LABEL_CELL), int(box[3] // LABEL_CELL) + 1)
+		]
+		if self.overlaps(box, cells):
+			return False
+		for cell in cells:
+			self.cells.setdefault(cell, []).append(box)
+		return True
+
+
 class RenderableEntity:
+	font_size = 12	#of the label (pyglet's default)
+
 	def __init__(self, entity):
 		self.entity = entity
-		self.x = ((entity.x/SCALE_FACTOR-0.5)*0.9+0.5)*WINDOW_X	#convert from game space to render space
-		self.y = ((entity.y/SCALE_FACTOR-0.5)*0.9+0.5)*WINDOW_Y
+		self.x, self.y = to_screen(entity.x, entity.y)
+		self.text = None
+		self.label = None	#only made while label culling shows it (see show_label)
+
+	def update(self, entity, displayproperty):
+		''' Show the current state of the entity (entity may be a newer
+			snapshot of it, for a player's view). Returns whether the text
+			changed.
+		'''
+		self.entity = entity
+		text = str(getattr(entity, displayproperty))
+		#laying out text is slow, so only when it has changed
+		if text == self.text:
+			return False
+		self.text = text
+		if self.label is not None:
+			self.label.text = text
+		return True
+
+	def label_position(self):
+		return self.x, self.y
+
+	def show_label(self, shown, batch):
+		''' Make the label (if shown), or delete it (if not). '''
+		if shown and self.label is None:
+			x, y = self.label_position()
+			self.label = pyglet.text.Label(
+				self.text,
+				x=x,
+				y=y,
+				anchor_x="center",
+				anchor_y="center",
+				batch=batch,
+				font_size=self.font_size
+			)
+		elif not shown and self.label is not None:
+			self.label.delete()
+			self.label = None
 
-	def update(self, displayproperty):
-		self.label.text = str(self.entity.__getattribute__(displayproperty))
+	def delete(self):
+		self.show_label(False, None)
 
 class RenderablePlanet(RenderableEntity):
 	def __init__(self, planet, batch, displayproperty, colour):
 		super().__init__(planet)
+		self.owner = planet.owner
+		self.radius = (planet.growth+1) * PLANET_RADIUS_FACTOR
+		#small planets don't need as many segments to look round
+		segments = circle_segments(self.radius)
 		self.circles = [
 			pyglet.shapes.Circle(
 				self.x,
 				self.y,
-				(planet.growth+1) * PLANET_RADIUS_FACTOR,
+				self.radius,
 				color=COLOR_NAMES_255["WHITE"],
-				segments=40,
+				segments=segments,
 				batch=batch
 			),
 			pyglet.shapes.Circle(
 				self.x,
 				self.y,
-				(planet.growth+1) * PLANET_RADIUS_FACTOR-2,
+				self.radius-2,
 				color=colour,
-				segments=40,
+				segments=segments,
 				batch=batch
 			)
 		]
-		self.label = pyglet.text.Label(
-			str(planet.__getattribute__(displayproperty)),
-			x=self.x-2,
-			y=self.y+4,	#centering is weirdly off
-			anchor_x="center", 
-			anchor_y="center",
-			batch=batch
-		)
+		self.text = str(getattr(planet, displayproperty))
+
+	def label_position(self):
+		return self.x-2, self.y+4	#centering is weirdly off
+
+	def recolour(self, owner, colour):
+		self.owner = owner
+		self.circles[1].color = colour
+
+	def delete(self):
+		super().delete()
+		for circle in self.circles:
+			circle.delete()
 
 
 
 class RenderableFleet(RenderableEntity):
-	def __init__(self, fleet, batch, displayproperty, colour):
+	font_size = 10
+
+	def __init__(self, fleet, batch, displayproperty):
 		super().__init__(fleet)
+		self.shape(fleet)
+		self.text = str(getattr(fleet, displayproperty))
+
+	def shape(self, fleet):
+		''' Work out the corners of the triangle (relative to the fleet),
+			pointing the way it is going and sized by its ships.
+		'''
+		self.ships = fleet.ships
 		triangle_half_size = min(max(FLEET_SIZE_FACTOR*fleet.ships//2, 10), 50)
-		
-		#vector pointing straight up defines size of triangle
-		v_temp = pyglet.math.Vec2(triangle_half_size, 0)
-		#rotate vector to travel direction, v1 is then the 'forward' point of the triangle
-		self.v1 = v_temp.from_heading(fleet.heading)
-		
-		#same vector, a little shorter, forms the trailing points, each rotated 120deg off the travel direction
-		v_temp = pyglet.math.Vec2(triangle_half_size*.75, 0)
-		v_temp = v_temp.from_heading(fleet.heading)
-		v2 = v_temp.rotate(2.094)	#120 deg in radian
-		v3 = v_temp.rotate(-2.094)	#120 deg in radian
-		
-		self.triangle = (pyglet.shapes.Triangle(
-			self.v1.x,	#x
-			self.v1.y,	#y
-			v2.x,	#x2
-			v2.y,	#y2
-			v3.x,	#x3
-			v3.y,	#y3
-			color=colour,
-			batch=batch
-		))
-		self.label = pyglet.text.Label(
-			str(fleet.__getattribute__(displayproperty)),
-			x=self.x,
-			y=self.y,
-			anchor_x="center", 
-			anchor_y="center",
-			batch=batch,
-			font_size=10
-		)
+		heading = fleet.heading
+		#the 'forward' point of the triangle, in the travel direction
+		self.corners = [(triangle_half_size*math.cos(heading), triangle_half_size*math.sin(heading))]
+		#a little shorter, the trailing points, each rotated 120deg off the travel direction
+		for turn in (2.094, -2.094):	#120 deg in radian
+			self.corners.append((triangle_half_size*.75*math.cos(heading+turn), triangle_half_size*.75*math.sin(heading+turn)))
+
+	def update(self, fleet, displayproperty, ahead=0):
+		super().update(fleet, displayproperty)
+		if fleet.ships != self.ships:
+			#fleets launched from a fleet leave it smaller
+			self.shape(fleet)
+		#fleets fly straight, so ahead ticks on is just more of the same
+		x, y = to_screen(fleet.x+fleet.vx*ahead, fleet.y+fleet.vy*ahead)
+		if (x, y) != (self.x, self.y):
+			self.x, self.y = x, y
+			if self.label is not None:
+				self.label.x = x
+				self.label.y = y
+
+	def vertices(self):
+		''' The x, y of each corner of the triangle, in render space. '''
+		return [v for dx, dy in self.corners for v in (self.x+dx, self.y+dy)]
+
+
+class FleetTriangles:
+	''' The triangles of every fleet, in one vertex list of 3 vertices a fleet,
+		so moving all the fleets is one update of the position buffer. Fleets
+		get a slot when they appear and give it back when they're gone, and
+		their colour is only written when they get a slot. Unused slots are
+		all zero, so draw nothing.
+	'''
+
+	def __init__(self, batch, capacity=64):
+		self.batch = batch
+		self.program = pyglet.graphics.shader.ShaderProgram(
+			pyglet.graphics.shader.Shader(FLEET_VERTEX_SOURCE, 'vertex'),
+			pyglet.graphics.shader.Shader(FLEET_FRAGMENT_SOURCE, 'fragment'))
+		#above the planets (shapes, order 0), and made before the labels, so under them
+		self.group = pyglet.graphics.ShaderGroup(self.program, order=1)
+		self.slots = {}	#fleet ID -> slot
+		self.free = []
+		self.capacity = 0
+		self.vertex_list = None
+		self.allocate(capacity)
+
+	def allocate(self, capacity):
+		''' (Re)make the vertex list with room for capacity fleets, keeping
+			the colours of the slots in use.
+		'''
+		colours = [0] * (capacity * 12)
+		if self.vertex_list is not None:
+			colours[:self.capacity * 12] = self.vertex_list.colors[:]
+			self.vertex_list.delete()
+		self.vertex_list = self.program.vertex_list(
+			capacity * 3, pyglet.gl.GL_TRIANGLES, batch=self.batch, group=self.group,
+			position=('f', [0.0] * (capacity * 6)),
+			colors=('Bn', colours))
+		#lowest slots first, to keep the used ones together
+		self.free.extend(range(capacity - 1, self.capacity - 1, -1))
+		self.free.sort(reverse=True)
+		self.capacity = capacity
+
+	def add(self, ID, colour):
+		if not self.free:
+			self.allocate(self.capacity * 2)
+		slot = self.slots[ID] = self.free.pop()
+		self.vertex_list.colors[slot*12:slot*12+12] = tuple(colour) * 3
+
+	def remove(self, ID):
+		self.free.append(self.slots.pop(ID))
+
+	def update(self, fleets):
+		''' Write the triangles of fleets (RenderableFleets by ID, for every
+			slot in use) to the position buffer.
+		'''
+		positions = [0.0] * (self.capacity * 6)
+		for ID, slot in self.slots.items():
+			positions[slot*6:slot*6+6] = fleets[ID].vertices()
+		self.vertex_list.position[:] = positions
+
+	def delete(self):
+		self.vertex_list.delete()
+
+
+def view_of(game, view_id):
+	''' The planets and fleets (dicts by ID) of a view of the game: 0 for
+		everything, or the number of a player for what they can see.
+	'''
+	if view_id == 0:
+		return game.planets, game.fleets
+	player = game.players[list(game.players.keys())[view_id-1]]
+	return player.planets, player.fleets
+
+
+class PlanetFrame(collections.namedtuple('PlanetFrame', 'ID owner ships x y growth vision_age')):
+	__slots__ = ()
+
+
+class FleetFrame(collections.namedtuple('FleetFrame', 'ID owner ships x y vx vy vision_age')):
+	__slots__ = ()
+
+	@property
+	def heading(self):
+		return math.atan2(self.vy, self.vx)
+
+
+class Frame:
+	''' A copy of one view (see view_of) of the game at a tick, made by the
+		simulation thread for the window to draw while the game goes on.
+		Takes over (and clears) game.dirty.
+	'''
+
+	def __init__(self, game, view_id, tps):
+		self.view_id = view_id
+		self.tick = game.tick
+		self.tps = None if game.paused else tps
+		self.time = time.perf_counter()
+		self.dirty = game.dirty
+		game.dirty = False
+		planets, fleets = view_of(game, view_id)
+		self.planets = {p.ID: PlanetFrame(p.ID, p.owner, p.ships, p.x, p.y, p.growth, p.vision_age) for p in planets.values()}
+		self.fleets = {f.ID: FleetFrame(f.ID, f.owner, f.ships, f.x, f.y, f.vx, f.vy, f.vision_age) for f in fleets.values()}
+
+	def ahead(self):
+		''' How far (in ticks, up to one) the game is likely to have got since
+			this frame, to move the fleets on by between frames.
+		'''
+		if not self.tps:
+			return 0
+		return min((time.perf_counter() - self.time) * self.tps, 1)
+
+
+class SimulationThread(threading.Thread):
+	''' Runs the game at `tps` ticks per second (None for as fast as it can),
+		apart from the window, so neither holds the other up. A Frame of the
+		game is made after a tick when the window has asked for one (see
+		take_frame). Anything else that changes the game must hold `lock`.
+	'''
+
+	def __init__(self, game, tps=60):
+		super().__init__(name="simulation", daemon=True)
+		self.game = game
+		self.tps = tps
+		self.lock = threading.Lock()
+		self.view_id = 0
+		self.frame = None
+		self.frame_wanted = True
+		self.stopped = False
+		self.finished = False
+		self.error = None
+
+	def publish(self):
+		''' Make a new frame (holding the lock). '''
+		#the game stops with the last frame, so it's not moved on
+		self.frame = Frame(self.game, self.view_id, None if self.finished else self.tps)
+		self.frame_wanted = False
+
+	def take_frame(self, view_id):
+		''' The latest frame, asking for the next one to be of view_id. '''
+		self.view_id = view_id
+		frame = self.frame
+		self.frame_wanted = True
+		return frame
+
+	def step(self):
+		''' Do one tick, e.g. while paused. '''
+		with self.lock:
+			self.game.update(manual=True)
+			self.publish()
+
+	def run(self):
+		next_tick = time.perf_counter()
+		try:
+			while not self.stopped:
+				with self.lock:
+					game = self.game
+					paused = game.paused
+					game.update()
+					self.finished = not game.is_alive() or game.tick >= game.max_ticks
+					if self.frame_wanted or self.finished:
+						self.publish()
+				if self.finished:
+					break
+				now = time.perf_counter()
+				if paused:
+					next_tick = now
+					time.sleep(1/60.)
+				elif self.tps:
+					next_tick += 1 / self.tps
+					if next_tick > now:
+						time.sleep(next_tick - now)
+					elif now - next_tick > 0.25:
+						#too far behind to catch up - carry on from now
+						next_tick = now
+		except BaseException as error:
+			self.error = error
+			self.finished = True
+
+	def stop(self):
+		self.stopped = True
+		self.join()
 
-	def update(self, displayproperty):
-		super().update(displayproperty)
-		self.triangle.x = self.x+self.v1.x
-		self.triangle.y = self.y+self.v1.y
-		self.label.x=self.x
-		self.label.y=self.y
 
 class PlanetWarsEntityRenderer:
 	# handles drawing/cached pos/size of PlanetWars game instance for a GUI
+	# shapes are kept between frames, by entity ID: they're only made (or
+	# deleted) as entities appear (or go), and recoloured as planets change
+	# hands. The game sets game.dirty whenever that might have happened.
+	# It draws the game itself, or the Frames of it given to draw.
 
 	def __init__(self, game, window):
 		self.game = game
@@ -144,62 +467,146 @@ class PlanetWarsEntityRenderer:
 		self.batch = pyglet.graphics.Batch()
 		self.displayproperty = "ships"
 		self.view_id = 0
+		self.frame = None
+		self.renderableplanets = {}	#ID -> RenderablePlanet
+		self.renderablefleets = {}	#ID -> RenderableFleet
+		self.fleet_triangles = FleetTriangles(self.batch)
+		self.planets_by_size = []	#biggest first, as their labels are placed
+		self.planet_labels = None	#LabelSpace of the planet labels shown, until one changes
+		self.cluster_labels = {}	#(owner, cx, cy) -> Label of the small fleets in a cluster
+		self.shown = None	#(view_id, tick, displayproperty, ahead) last synced
 		self.sync_all()
 
-	def draw(self):
+	def colour(self, owner):
+		return COLOR_NAMES_255[self.playercolours[owner]]
+
+	def state(self):
+		''' What is drawn (the game, or the latest frame of it) and its view. '''
+		if self.frame is not None:
+			return self.frame, self.frame.view_id
+		return self.game, self.view_id
+
+	def entities(self):
+		''' The planets and fleets (dicts by ID) being drawn. '''
+		if self.frame is not None:
+			return self.frame.planets, self.frame.fleets
+		return view_of(self.game, self.view_id)
+
+	def draw(self, frame=None):
+		if frame is not None:
+			self.frame = frame
+		state, view_id = self.state()
+		ahead = self.frame.ahead() if self.frame is not None else 0
 		#dirty is set whenever a planet changes hands, a fleet is created
-		if self.game.dirty:
-			self.sync_all()
-		# update planet text labels
-		for planet in self.renderableplanets:
-			planet.update(self.displayproperty)
-		#update fleet positions & labels
-		for fleet in self.renderablefleets:
-			fleet.update(self.displayproperty)
+		#a player's view can change as they see more, so is synced every tick
+		if state.dirty or self.shown[0] != view_id or (view_id != 0 and self.shown[1] != state.tick):
+			self.sync_all(ahead)
+		elif self.shown != (view_id, state.tick, self.displayproperty, ahead):
+			# update planet text labels, fleet positions & labels
+			self.update(ahead)
 		# draw planets
 		self.batch.draw()
 
-	def sync_all(self):
+	def sync_all(self, ahead=0):
 		#sync_all and dirty are used to update the renderer when:
 		#planet ownership changes
 		#fleets are created and destroyed
-		#TODO: this is actually called every tick, which is not ideal
-		if self.view_id == 0:
-			planets = self.game.planets.values()
-			fleets = self.game.fleets.values()
-		else:
-			player = list(self.game.players.keys())[self.view_id-1]
-			planets = self.game.players[player].planets.values()
-			fleets = self.game.players[player].fleets.values()
-			
-
-
-		self.renderableplanets = []
-		for p in planets:
-			#something something view type
-			self.renderableplanets.append(
-				RenderablePlanet(
-					p, 
-					self.batch, 
-					self.displayproperty, 
-					COLOR_NAMES_255[self.playercolours[p.owner]] #bad practice to have properties of p accessed here
-				))
-
-		self.renderablefleets = []
-		for f in fleets:
-			#something something view type
-			self.renderablefleets.append(
-				RenderableFleet(
-					f, 
-					self.batch, 
-					self.displayproperty, 
-					COLOR_NAMES_255[self.playercolours[f.owner]] #bad practice to have properties of p accessed here
-				))
-		self.game.dirty = False
-
-	def update(self):
-		#todo upate text labels after every game loop
-		pass
+		planets, fleets = self.entities()
+
+		for ID in [ID for ID in self.renderableplanets if ID not in planets]:
+			self.renderableplanets.pop(ID).delete()
+		for p in planets.values():
+			planet = self.renderableplanets.get(p.ID)
+			if planet is None:
+				self.renderableplanets[p.ID] = RenderablePlanet(p, self.batch, self.displayproperty, self.colour(p.owner))
+			elif planet.owner != p.owner:
+				planet.recolour(p.owner, self.colour(p.owner))
+		if len(self.planets_by_size) != len(self.renderableplanets) or any(p.entity.ID not in planets for p in self.planets_by_size):
+			self.planets_by_size = sorted(self.renderableplanets.values(), key=lambda p: -p.radius)
+			self.planet_labels = None
+
+		for ID in [ID for ID in self.renderablefleets if ID not in fleets]:
+			self.renderablefleets.pop(ID).delete()
+			self.fleet_triangles.remove(ID)
+		for f in fleets.values():
+			if f.ID not in self.renderablefleets:
+				self.renderablefleets[f.ID] = RenderableFleet(f, self.batch, self.displayproperty)
+				self.fleet_triangles.add(f.ID, self.colour(f.owner))
+		self.state()[0].dirty = False
+		self.update(ahead)
+
+	def update(self, ahead=0):
+		''' Update planet text labels, fleet positions & labels. Fleets are
+			moved on by ahead ticks, to show them between frames.
+		'''
+		planets, fleets = self.entities()
+		if len(planets) != len(self.renderableplanets) or len(fleets) != len(self.renderablefleets):
+			#entities came or went without the game being marked dirty
+			return self.sync_all(ahead)
+		for ID, planet in self.renderableplanets.items():
+			if planet.update(planets[ID], self.displayproperty):
+				self.planet_labels = None
+		for ID, fleet in self.renderablefleets.items():
+			fleet.update(fleets[ID], self.displayproperty, ahead)
+		self.fleet_triangles.update(self.renderablefleets)
+		self.place_labels()
+		state, view_id = self.state()
+		self.shown = (view_id, state.tick, self.displayproperty, ahead)
+
+	def place_labels(self):
+		''' Label culling: show the labels of the biggest planets, and then the
+			biggest fleets, that don't overlap one already shown. Fleets of
+			fewer than FLEET_LABEL_SHIPS ships aren't labelled, but each cluster
+			of them (by owner, in CLUSTER_SIZE squares) gets one label of its
+			total ships and (in brackets) fleets. So however many entities
+			there are, only as many labels as fit are laid out.
+		'''
+		if self.planet_labels is None:
+			#planets don't move, so their labels are only placed again when their text changes
+			self.planet_labels = LabelSpace()
+			for planet in self.planets_by_size:
+				x, y = planet.label_position()
+				planet.show_label(self.planet_labels.place(x, y, planet.text, planet.font_size), self.batch)
+		space = LabelSpace(self.planet_labels)
+		clusters = {}
+		for fleet in sorted(self.renderablefleets.values(), key=lambda f: -f.ships):
+			if fleet.ships >= FLEET_LABEL_SHIPS:
+				fleet.show_label(space.place(fleet.x, fleet.y, fleet.text, fleet.font_size), self.batch)
+			else:
+				fleet.show_label(False, self.batch)
+				key = (fleet.entity.owner, int(fleet.x // CLUSTER_SIZE), int(fleet.y // CLUSTER_SIZE))
+				clusters.setdefault(key, []).append(fleet)
+
+		labels = {}
+		for key, members in clusters.items():
+			if len(members) < 2:
+				continue	#a lone small fleet is just its triangle
+			x = sum(f.x for f in members) / len(members)
+			y = sum(f.y for f in members) / len(members)
+			text = "%d (%d)" % (sum(f.ships for f in members), len(members))
+			if not space.place(x, y, text, RenderableFleet.font_size):
+				continue
+			label = self.cluster_labels.pop(key, None)
+			if label is None:
+				label = pyglet.text.Label(
+					text,
+					x=x,
+					y=y,
+					anchor_x="center",
+					anchor_y="center",
+					batch=self.batch,
+					font_size=RenderableFleet.font_size,
+					color=self.colour(key[0])
+				)
+			else:
+				if label.text != text:
+					label.text = text
+				label.x = x
+				label.y = y
+			labels[key] = label
+		for label in self.cluster_labels.values():
+			label.delete()
+		self.cluster_labels = labels
 
 
 class PlanetWarsUI:
@@ -215,8 +622,10 @@ class PlanetWarsUI:
 
 class PlanetWarsWindow(pyglet.window.Window):
 
-	def __init__(self, game):
+	def __init__(self, game, seek=None, tps=60):
 		self.game = game
+		# seek(tick) returns a new game at tick, when viewing a replay
+		self.seek = seek
 
 		#init the Pyglet window
 		super(PlanetWarsWindow, self).__init__(
@@ -234,7 +643,7 @@ class PlanetWarsWindow(pyglet.window.Window):
 		self.set_location(10, 10)
 
 		#load the background and scale it to the widnow size
-		
+
 		self.bg = pyglet.sprite.Sprite(pyglet.image.load(pathlib.PurePath().joinpath(".\\images\\space.jpg")))
 		self.bg.scale_x = self.width / self.bg.image.width
 		self.bg.scale_y = self.height / self.bg.image.height
@@ -243,14 +652,24 @@ class PlanetWarsWindow(pyglet.window.Window):
 		#load the renderer for game elements
 		self.gamerenderer = PlanetWarsEntityRenderer(self.game, self)
 
+		#the game runs (at tps ticks a second) in its own thread, and the
+		#window draws the latest frame of it at the display rate
+		self.simulation = SimulationThread(self.game, tps)
+		self.simulation.start()
 		pyglet.clock.schedule_interval(self.update, 1/60.)
-		pyglet.app.run()
+		try:
+			pyglet.app.run()
+		finally:
+			self.simulation.stop()
+		if self.simulation.error is not None:
+			raise self.simulation.error
 
 	def update(self, args):
 		# update step label
 		msg = "Step:" + str(self.game.tick)
 		if self.game.paused:
 			msg += " [PAUSED]"
+		msg += "  --  Speed: " + (str(self.simulation.tps) + " ticks/s" if self.simulation.tps else "max")
 		msg += f'  --  POV: [{self.gamerenderer.view_id}] '
 		if self.gamerenderer.view_id == 0:
 			msg += 'ALL'
@@ -259,16 +678,20 @@ class PlanetWarsWindow(pyglet.window.Window):
 			msg += self.game.players[view_id].name
 		msg += "  --  Show: " + self.gamerenderer.displayproperty
 		self.ui.step_label.text = msg
-		
-		# gets called by the scheduler at the step_fps interval set
-		if self.game:
-			self.game.update()
-			# Has the game ended? (Should we close?)
-			if not self.game.is_alive() or self.game.tick >= self.game.max_ticks:
-				self.close()
-			if self.game.dirty or True: #or True bypasses game.dirty render optimisation - TODO: figure out a way to bring it back
-				self.gamerenderer.sync_all()
 
+		# Has the game ended? (Should we close?)
+		if self.simulation.finished:
+			self.close()
+
+	def set_tps(self, steps):
+		''' Move the game speed steps along TPS_STEPS. '''
+		tps = self.simulation.tps
+		speeds = list(TPS_STEPS)
+		if tps not in speeds:
+			speeds.append(tps)
+			speeds.sort(key=lambda s: float('inf') if s is None else s)
+		i = min(max(speeds.index(tps) + steps, 0), len(speeds) - 1)
+		self.simulation.tps = speeds[i]
 
 	def on_key_press(self, symbol, modifiers):
 		# Single Player View, or All View
@@ -293,20 +716,43 @@ class PlanetWarsWindow(pyglet.window.Window):
 			self.gamerenderer.displayproperty = l[l.index(i) + 1] if l.index(i) < (len(l) - 1) else l[0]
 		# Do one step
 		elif symbol == pyglet.window.key.N:
-			self.game.update(manual=True)
+			self.simulation.step()
 		# Pause toggle?
 		elif symbol == pyglet.window.key.P:
-			self.game.paused = not self.game.paused
+			with self.simulation.lock:
+				self.game.paused = not self.game.paused
 		# Speed up (+) or slow down (-) the sim
 		elif symbol in [pyglet.window.key.PLUS, pyglet.window.key.EQUAL]:
-			self.set_fps(pyglet.window.fps + 5)
+			self.set_tps(1)
 		elif symbol == pyglet.window.key.MINUS:
-			self.set_fps(pyglet.window.fps - 5)
+			self.set_tps(-1)
+		# Seek back/forward through a replay
+		elif symbol in [pyglet.window.key.LEFT, pyglet.window.key.RIGHT] and self.seek:
+			step = SEEK_STEP * 10 if modifiers & pyglet.window.key.MOD_SHIFT else SEEK_STEP
+			if symbol == pyglet.window.key.LEFT:
+				step = -step
+			self.seek_to(max(0, self.game.tick + step))
 		elif symbol == pyglet.window.key.ESCAPE:
 			pyglet.app.exit()
 
+	def seek_to(self, tick):
+		''' Swap in the game at tick of the replay, keeping the view settings. '''
+		with self.simulation.lock:
+			old = self.gamerenderer
+			paused = self.game.paused
+			self.game = self.seek(tick)
+			self.game.paused = paused
+			self.gamerenderer = PlanetWarsEntityRenderer(self.game, self)
+			self.gamerenderer.view_id = old.view_id
+			self.gamerenderer.displayproperty = old.displayproperty
+			self.simulation.game = self.game
+			self.simulation.view_id = old.view_id
+			self.simulation.publish()
+
 	def on_draw(self):
 		self.clear()
 		self.bg.draw()
 		self.ui.draw()
-		self.gamerenderer.draw()
\ No newline at end of file
+		frame = self.simulation.take_frame(self.gamerenderer.view_id)
+		if frame is not None:
+			self.gamerenderer.draw(frame)
@@ -1,5 +1,5 @@
-import uuid
-from entities import NEUTRAL_ID
+from entities import NEUTRAL_ID, new_id
+from ownership import OwnedDict
 
 class Player(object):
 	# This is used by the actual `PlanetWars` game instance to represent each
@@ -15,19 +15,36 @@ class Player(object):
  	# The Player facade represents a "fog-of-war" view of the true game
 	# environment. A player bot can only "see" what is in range of it's own
 	# occupied planets or fleets in transit across the map. This creates an
-	# incentive for bots to exploit scout details.
+	# incentive for bots to exploit scout details. Facade entities are read-only
+	# snapshots (see `PlanetSnapshot` and `FleetSnapshot` in entities.py).
+	#
+	# A bot is updated every tick unless it asks to sleep (`sleep_until` a tick
+	# and/or `sleep_until_event`). Sleeping bots let the game skip ticks when
+	# it is run with fast-forward (see `PlanetWarsGame`).
+	#
+	# A bot's `update` may be an `async def`, to await external work. It is
+	# run by the game's scheduler (see schedulers.py), which can also run
+	# bots at the same time in threads or processes.
+	#
+	# The controller can also be given, rather than found by name, e.g. for
+	# a bot playing over the network (see game_server.py and remote_bot.py).
  
-	def __init__(self, ID, name):
+	def __init__(self, ID, name, controller=None):
 		self.ID = ID  # as allocated by the game
 		self.name = name.replace('.py', '')  # accept both "Dumbo" or "Dumbo.py"
 		#self.log = log or (lambda *p, **kw: None)
 		self.orders = []
 		self.ships = 0
 		self._alive = True
-		self.planets = {}	#actually the planets in the facade.. rename?
-		self.fleets = {}	#actually the fleets in the facade.. rename?
+		self.planets = OwnedDict()	#actually the planets in the facade.. rename?
+		self.fleets = OwnedDict()	#actually the fleets in the facade.. rename?
+		self.wake_tick = None  # don't update the bot before this tick
+		self.wake_on_event = False  # don't update the bot until a fleet arrives
 
-		if self.ID != NEUTRAL_ID:
+		if controller is not None:
+			# a bot that isn't in ./bots, e.g. a remote one (see game_server.py)
+			self.controller = controller
+		elif self.ID != NEUTRAL_ID:
 			# Create a controller object based on the name
 			# - Look for a ./bots/BotName.py module (file) we need
 			mod = __import__('bots.' + name)  # ... the top level bots mod (dir)
@@ -48,7 +65,33 @@ class Player(object):
 		# Assumes gameinfo facade details are ready - let the bot issue orders!
 		# Note: the bot controller has a reference to our *_order methods.
 		if self.ID != NEUTRAL_ID:
-			self.controller.update(self)
+			# awake every tick from now on, unless the bot says otherwise
+			self.wake()
+			# a coroutine if the bot has an `async def update` - see schedulers.py
+			return self.controller.update(self)
+
+	def sleep_until(self, tick):
+		''' Don't update (call the bot) again until game tick `tick`, or an
+			event if also sleeping until one.
+		'''
+		self.wake_tick = tick
+
+	def sleep_until_event(self):
+		''' Don't update (call the bot) again until fleets arrive at a planet
+			(a planet is reinforced, defended or captured), or the tick given
+			to `sleep_until` if there is one.
+		'''
+		self.wake_on_event = True
+
+	def wake(self):
+		self.wake_tick = None
+		self.wake_on_event = False
+
+	def is_awake(self, tick):
+		''' True if the bot should be updated at game tick `tick`. '''
+		if self.wake_tick is not None and self.wake_tick <= tick:
+			return True
+		return self.wake_tick is None and not self.wake_on_event
 
 	def fleet_order(self, src_fleet, dest, ships):
 		''' Order fleet to divert (some/all) fleet ships to a destination planet.
@@ -56,7 +99,7 @@ class Player(object):
 			if it is done, but no guarantee - the game decides and enforces the rules.
 		'''
 		# If source fleet splitting we'll need a new fleet_id else keep old one
-		fleetid = uuid.uuid4() if ships < src_fleet.ships else src_fleet.ID
+		fleetid = new_id() if ships < src_fleet.ships else src_fleet.ID
 		self.orders.append(('fleet', src_fleet.ID, fleetid, ships, dest.ID))
 		return fleetid
 
@@ -65,27 +108,29 @@ class Player(object):
 			Note: this is just a request for it to be done, and fleetid is our reference
 			if it is done, but no guarantee - the game decides and enforces the rules.
 		'''
-		fleetid = uuid.uuid4()
+		fleetid = new_id()
 		self.orders.append(('planet', src_planet.ID, fleetid, ships, dest.ID))
 		return fleetid
 
 	# Helper functions
 	# It is strongly recommended that you cache the results of these function calls
 	# Multiple calls within the same game tick will produce the same results
+	# Each returns a new dict, in facade order, from the ownership index of the
+	# facade (see ownership.py) rather than a scan of it
 	def _my_planets(self):
-		return dict([(k, p) for k, p in self.planets.items() if p.owner == self.ID])
+		return self.planets.index.owned_by(self.ID)
 
 	def _enemy_planets(self):
-		return dict([(k, p) for k, p in self.planets.items() if p.owner not in (NEUTRAL_ID, self.ID)])
+		return self.planets.index.not_owned_by(NEUTRAL_ID, self.ID)
 
 	def _not_my_planets(self):
-		return dict([(k, p) for k, p in self.planets.items() if p.owner != self.ID])
+		return self.planets.index.not_owned_by(self.ID)
 
 	def _neutral_planets(self):
-		return dict([(k, p) for k, p in self.planets.items() if p.owner == NEUTRAL_ID])
+		return self.planets.index.owned_by(NEUTRAL_ID)
 
 	def _my_fleets(self):
-		return dict([(k, f) for k, f in self.fleets.items() if f.owner == self.ID])
+		return self.fleets.index.owned_by(self.ID)
 
 	def _enemy_fleets(self):
-		return dict([(k, f) for k, f in self.fleets.items() if f.owner != self.ID])
+		return self.fleets.index.not_owned_by(self.ID)
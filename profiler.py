@@ -0,0 +1,106 @@
+"""Per-tick profiling of PlanetWarsGame.update
+
+A `TickProfiler` given to a game (`game.profiler = TickProfiler()`, or
+`--profile` on the command line) records, for every tick:
+
+ - the wall time of each phase of `PlanetWarsGame.update` (see `PHASES`)
+ - the time each bot spent in its `update`
+ - the number of planets, fleets and orders
+
+Timing is a `time.perf_counter()` call at the end of each phase, so it is
+cheap enough to leave on for a whole game. The rows can be written out as a
+CSV or JSON time series, and `summary` gives p50/p95/max of each phase.
+
+"""
+import csv
+import json
+import time
+
+PHASES = ('skip', 'bots', 'orders', 'growth', 'arrivals', 'battles', 'movement', 'facades')
+
+
+def percentile(values, p):
+	''' The p-th percentile (nearest rank) of values, 0 if there are none. '''
+	if not values:
+		return 0
+	values = sorted(values)
+	return values[min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))]
+
+
+class TickProfiler():
+
+	''' Collects one row of timings and counts per game tick. '''
+
+	def __init__(self):
+		self.rows = []
+		self.bots = {}  # player ID -> bot name
+		self._row = None
+		self._last = None
+
+	def start(self, tick):
+		''' Start the row of a tick (called at the start of `update`). '''
+		self._row = {'tick': tick}
+		self._last = time.perf_counter()
+
+	def mark(self, phase):
+		''' The phase that has just finished. '''
+		now = time.perf_counter()
+		self._row[phase] = self._row.get(phase, 0) + now - self._last
+		self._last = now
+
+	def bot(self, player, seconds):
+		''' Time taken by the `update` of a player's bot. '''
+		self.bots[player.ID] = player.name
+		self._row['bot ' + player.ID] = seconds
+
+	def count(self, **counts):
+		''' Counts (e.g. of entities) for the current tick. '''
+		self._row.update(counts)
+
+	def end(self):
+		''' Finish the row of the current tick. '''
+		row = self._row
+		row['total'] = sum(row.get(phase, 0) for phase in PHASES)
+		self.rows.append(row)
+		self._row = None
+
+	def columns(self):
+		columns = ['tick'] + list(PHASES) + ['total']
+		columns += ['bot ' + ID for ID in self.bots]
+		extra = set()
+		for row in self.rows:
+			extra.update(row)
+		columns += sorted(extra - set(columns))
+		return columns
+
+	def write_csv(self, path):
+		with open(path, 'w', newline='') as f:
+			writer = csv.DictWriter(f, self.columns(), restval=0)
+			writer.writeheader()
+			writer.writerows(self.rows)
+
+	def write_json(self, path):
+		with open(path, 'w') as f:
+			json.dump({'bots': self.bots, 'phases': PHASES, 'rows': self.rows}, f)
+
+	def write(self, path):
+		''' Write the rows to path, as JSON if it ends in .json, else CSV. '''
+		if str(path).endswith('.json'):
+			self.write_json(path)
+		else:
+			self.write_csv(path)
+
+	def summary(self):
+		''' A table of p50/p95/max (in ms) of each phase and bot, per tick. '''
+		lines = ["%-28s %10s %10s %10s %10s" % ("(ms per tick)", "p50", "p95", "max", "total")]
+		names = [(phase, phase) for phase in PHASES + ('total',)]
+		names += [('bot ' + ID, 'bot %s (%s)' % (name, ID[:8])) for ID, name in self.bots.items()]
+		for key, label in names:
+			values = [row.get(key, 0) * 1000 for row in self.rows]
+			lines.append("%-28s %10.3f %10.3f %10.3f %10.1f" % (
+				label, percentile(values, 50), percentile(values, 95), max(values, default=0), sum(values)))
+		if self.rows:
+			last = self.rows[-1]
+			lines.append("%d ticks, %s" % (len(self.rows), ", ".join(
+				"%s: %s" % (k, last[k]) for k in ('planet_count', 'fleet_count', 'order_count') if k in last)))
+		return "\n".join(lines)
@@ -0,0 +1,157 @@
+""" Remote bots for the PlanetWars game server
+
+Plays a bot on a game server (see game_server.py) from its own process, on
+this machine or another. The bot is any bot from /bots (or any object with
+an `update(player)` method, which may be an `async def`), and sees just what
+it would in the game's process: a `Player` whose facade (`planets` and
+`fleets`) is kept up to date from what the server sends each tick (see
+net_protocol.py), and whose orders (and requests to sleep) are sent back.
+
+Only the game's entity modules are needed here, not the game itself.
+
+Example:
+	python remote_bot.py OneSlowMove --host 10.0.0.5 --port 8765 --games 10
+	python remote_bot.py OneSlowMove --unix /tmp/planetwars.sock --lobby league
+
+	import remote_bot
+	result = remote_bot.run(MyBot(), "MyBot", port=8765)
+"""
+
+import argparse
+import asyncio
+import inspect
+import traceback
+
+import net_protocol
+from net_protocol import ProtocolError
+from entities import PlanetSnapshot, FleetSnapshot
+from ownership import OwnedDict
+from players import Player
+
+
+def load_bot(name):
+	''' A new controller of the bot in ./bots/<name>.py (as `Player` makes). '''
+	name = name.replace('.py', '')
+	module = getattr(__import__('bots.' + name), name)
+	return getattr(module, name)()
+
+
+def _snapshot(cls, fields):
+	''' A facade snapshot with fields, made as unpickling would make it. '''
+	snapshot = cls.__new__(cls)
+	snapshot.__setstate__(fields)
+	return snapshot
+
+
+def apply_tick(player, tick, planets, ages, fleets):
+	''' Bring the facade of player up to tick, from the planets, ages and
+		fleets of a TICK message (see net_protocol.py).
+	'''
+	player.tick = tick
+	for record in planets:
+		if len(record) == 6:
+			ID, owner, ships, x, y, growth = record
+			vision_age = 0
+		else:
+			ID, owner, ships = record
+			old = player.planets[ID]
+			x, y, growth, vision_age = old.x, old.y, old.growth, old.vision_age
+		player.planets[ID] = _snapshot(PlanetSnapshot, {
+			'ID': ID, 'owner': owner, 'ships': ships, 'x': x, 'y': y, 'growth': growth,
+			'vision_age': vision_age, '_vision_ships': None
+		})
+	for i in range(0, len(ages), 2):
+		player.planets[ages[i]].vision_age = ages[i + 1]
+	previous = player.fleets
+	# fleets are sent in full (as IDs of ones on the same course), so forgotten fleets drop out
+	player.fleets = OwnedDict()
+	for record in fleets:
+		if isinstance(record, list):
+			ID, owner, ships, x, y, vx, vy, x0, y0, t0, dest_id = record
+			fields = {
+				'ID': ID, 'owner': owner, 'ships': ships, 'x': x, 'y': y, 'vx': vx, 'vy': vy,
+				'x0': x0, 'y0': y0, 't0': t0, 'dest_id': dest_id, 'vision_age': 0, '_vision_ships': None
+			}
+		else:
+			ID = record
+			old = previous[ID]
+			fields = old.__getstate__()
+			fields['x'], fields['y'] = old.position_at(tick)
+		fields['_planets'] = player.planets
+		player.fleets[ID] = _snapshot(FleetSnapshot, fields)
+
+
+async def _think(player):
+	''' Update the bot, and return the values of its ORDERS message. A bot
+		that raises forfeits that tick's orders.
+	'''
+	player.orders = []
+	try:
+		result = player.update()
+		if inspect.iscoroutine(result):
+			await result
+	except Exception:
+		traceback.print_exc()
+		player.orders = []
+	orders = [[o_type, source, new_id, int(ships), dest] for o_type, source, new_id, ships, dest in player.orders]
+	return orders, player.wake_tick, player.wake_on_event
+
+
+async def play(controller, name, host=None, port=None, path=None, lobby=''):
+	''' Play one game with bot controller (called name) on the server at
+		host:port, or the Unix socket path, waiting in lobby for the game.
+		Returns how it ended: a dict of `player` (the bot's player ID),
+		`tick`, `winner` (a player ID, or None) and `ships` (by player ID).
+	'''
+	connection = await net_protocol.connect(host, port, path)
+	try:
+		await connection.send(net_protocol.HELLO, net_protocol.VERSION, name, lobby)
+		player = None
+		while True:
+			message = await connection.receive()
+			if message is None:
+				raise ConnectionError("The server closed the connection")
+			kind, values = message
+			if kind == net_protocol.TICK and player is not None:
+				tick = values[0]
+				apply_tick(player, *values)
+				await connection.send(net_protocol.ORDERS, tick, *await _think(player))
+			elif kind == net_protocol.WELCOME:
+				ID, players, max_ticks, deadline = values
+				player = Player(ID, name, controller)
+			elif kind == net_protocol.END:
+				tick, winner, ships = values
+				return {'player': player.ID if player else None, 'tick': tick, 'winner': winner, 'ships': ships}
+			elif kind == net_protocol.ERROR:
+				raise ProtocolError("The server refused: %s" % values[0])
+			else:
+				raise ProtocolError("Unexpected message type %d" % kind)
+	finally:
+		connection.close()
+
+
+def run(controller, name, host=None, port=None, path=None, lobby=''):
+	''' Play one game (see `play`), on an event loop of its own. '''
+	return asyncio.run(play(controller, name, host, port, path, lobby))
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(
+		prog="PlanetWars remote bot",
+		description="Plays a bot from /bots on a PlanetWars game server (see game_server.py)."
+	)
+	parser.add_argument("bot", help="The name (no extension) of the bot, a file found in /bots.")
+	parser.add_argument("--host", default="127.0.0.1", help="Address of the server.")
+	parser.add_argument("--port", type=int, default=8765, help="TCP port of the server.")
+	parser.add_argument("--unix", help="Connect to the server's Unix socket, rather than TCP.")
+	parser.add_argument("--lobby", default="", help="Lobby to wait in for a game.")
+	parser.add_argument("--games", type=int, default=1, help="Number of games to play, one after another.")
+	args = parser.parse_args()
+
+	for _ in range(args.games):
+		result = run(load_bot(args.bot), args.bot, args.host, args.port, args.unix, args.lobby)
+		if result['winner'] is None:
+			outcome = "no winner"
+		else:
+			outcome = "won" if result['winner'] == result['player'] else "lost"
+		print("Player %s: %s at tick %d, ships %s" % (result['player'], outcome, result['tick'], result['ships']))
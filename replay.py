@@ -0,0 +1,498 @@
+"""Streaming binary replays for PlanetWars
+
+A replay is written as the game is played, one frame at a time, so a long
+game never holds its replay in memory and a crash loses at most the frame
+being filled. A `ReplayReader` reads it back just as lazily, handing the
+orders of each tick to the game as it gets there (see `PlanetWarsGame`).
+
+Every `keyframe_ticks` the full state of the game is saved in a keyframe,
+so a replay can be started from any tick by loading the keyframe before it
+and only playing the ticks since (see `seek`).
+
+File layout (all integers little-endian)::
+
+	b'PWR' version:uint8
+	frame*  # [length:uint32][flags:uint8][payload: length bytes]
+	index_offset:uint64 b'PWRI'
+
+Frame flags: bit 0 means the payload is zlib compressed, bit 1 that the
+frame starts with the header or a keyframe, bit 2 that it is the index. A
+payload is a run of records, each a record type byte followed by its values:
+
+	HEADER    gamestate  # planets, fleets, players, max_ticks, tick ...
+	ORDERS    tick count (owner type source new_fleet_id ships destination)*count
+	KEYFRAME  tick size gamestate  # size (in bytes) of the gamestate value
+	END       tick  # the tick the game stopped on
+	INDEX     [[tick, offset], ...]  # file offset of every header/keyframe frame
+
+The index frame and the trailer pointing to it are written on `close`. If
+they are missing (the game crashed) the reader rebuilds the index by
+skipping from frame to frame.
+
+Values are msgpack-like: a tag byte then the data, with unsigned integers as
+varints. Strings are interned per frame: the first use of a string in a frame
+stores it, later uses store its index. The table starts empty in every frame
+so each frame can be decoded on its own, and is emptied again after a
+keyframe so that it can be skipped.
+
+Example:
+
+	with ReplayWriter('replays/game.pwr') as replay:
+		game = PlanetWarsGame(gamestate, replay_writer=replay)
+		...
+		replay.close(game.tick)
+
+	reader = ReplayReader('replays/game.pwr')
+	game = PlanetWarsGame(reader.header, replay=reader)
+	game = seek(reader, 8000)  # or go straight to tick 8000
+"""
+import bisect
+import os
+import struct
+import zlib
+
+MAGIC = b'PWR'
+VERSION = 1
+
+_FRAME = struct.Struct('<IB')
+_DOUBLE = struct.Struct('<d')
+_TRAILER = struct.Struct('<Q4s')
+INDEX_MAGIC = b'PWRI'
+FLAG_ZLIB = 1
+FLAG_KEYFRAME = 2
+FLAG_INDEX = 4
+
+REC_HEADER = 1
+REC_ORDERS = 2
+REC_END = 3
+REC_KEYFRAME = 4
+REC_INDEX = 5
+
+# value tags
+_NONE, _FALSE, _TRUE, _INT, _NEG_INT, _FLOAT, _STR, _STR_REF, _LIST, _DICT = range(10)
+
+
+class ReplayError(Exception):
+	pass
+
+
+def _write_varint(out, n):
+	while n > 0x7f:
+		out.append((n & 0x7f) | 0x80)
+		n >>= 7
+	out.append(n)
+
+
+def _read_varint(buf, pos):
+	n = shift = 0
+	while True:
+		b = buf[pos]
+		pos += 1
+		n |= (b & 0x7f) << shift
+		if b < 0x80:
+			return n, pos
+		shift += 7
+
+
+class _FrameEncoder():
+
+	''' Encodes records into one frame payload, interning strings. '''
+
+	def __init__(self, flags=0):
+		self.out = bytearray()
+		self.strings = {}
+		self.flags = flags
+
+	def value(self, v):
+		out = self.out
+		if v is None:
+			out.append(_NONE)
+		elif v is True:
+			out.append(_TRUE)
+		elif v is False:
+			out.append(_FALSE)
+		elif isinstance(v, int):
+			out.append(_INT if v >= 0 else _NEG_INT)
+			_write_varint(out, abs(v))
+		elif isinstance(v, float):
+			out.append(_FLOAT)
+			out += _DOUBLE.pack(v)
+		elif isinstance(v, str):
+			i = self.strings.get(v)
+			if i is None:
+				self.strings[v] = len(self.strings)
+				data = v.encode('utf-8')
+				out.append(_STR)
+				_write_varint(out, len(data))
+				out += data
+			else:
+				out.append(_STR_REF)
+				_write_varint(out, i)
+		elif isinstance(v, (list, tuple)):
+			out.append(_LIST)
+			_write_varint(out, len(v))
+			for item in v:
+				self.value(item)
+		elif isinstance(v, dict):
+			out.append(_DICT)
+			_write_varint(out, len(v))
+			for key, item in v.items():
+				self.value(key)
+				self.value(item)
+		else:
+			raise TypeError("Can't write %r to a replay" % (v,))
+
+
+class _FrameDecoder():
+
+	''' Reads the records back out of one frame payload. '''
+
+	def __init__(self, payload):
+		self.buf = payload
+		self.pos = 0
+		self.strings = []
+
+	def more(self):
+		return self.pos < len(self.buf)
+
+	def varint(self):
+		n, self.pos = _read_varint(self.buf, self.pos)
+		return n
+
+	def value(self):
+		tag = self.buf[self.pos]
+		self.pos += 1
+		if tag == _NONE:
+			return None
+		if tag == _TRUE:
+			return True
+		if tag == _FALSE:
+			return False
+		if tag == _INT:
+			return self.varint()
+		if tag == _NEG_INT:
+			return -self.varint()
+		if tag == _FLOAT:
+			v = _DOUBLE.unpack_from(self.buf, self.pos)[0]
+			self.pos += _DOUBLE.size
+			return v
+		if tag == _STR:
+			n = self.varint()
+			v = bytes(self.buf[self.pos:self.pos + n]).decode('utf-8')
+			self.pos += n
+			self.strings.append(v)
+			return v
+		if tag == _STR_REF:
+			return self.strings[self.varint()]
+		if tag == _LIST:
+			return [self.value() for _ in range(self.varint())]
+		if tag == _DICT:
+			d = {}
+			for _ in range(self.varint()):
+				key = self.value()
+				d[key] = self.value()
+			return d
+		raise ReplayError("Bad value tag %d at %d" % (tag, self.pos - 1))
+
+
+class ReplayWriter():
+
+	''' Writes a replay to `file` (a path or a binary file object) as the game
+		is played. Records are gathered into a frame which is written, and the
+		file flushed, every `frame_ticks` ticks. `compression` is the zlib
+		level of each frame (0 to store frames uncompressed). A keyframe is
+		due every `keyframe_ticks` (0 for none).
+	'''
+
+	def __init__(self, file, compression=6, frame_ticks=100, keyframe_ticks=500):
+		if isinstance(file, (str, bytes)) or hasattr(file, '__fspath__'):
+			file = open(file, 'wb')
+		self.file = file
+		self.compression = compression
+		self.frame_ticks = frame_ticks
+		self.keyframe_ticks = keyframe_ticks
+		self.frame = None
+		self.frame_start = None
+		self.closed = False
+		self.index = []  # (tick, file offset) of the header and each keyframe
+		self.file.write(MAGIC + bytes((VERSION,)))
+		self.offset = len(MAGIC) + 1
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def _record(self, rec_type, tick=None):
+		if self.closed:
+			raise ReplayError("Replay is closed")
+		if self.frame is not None and tick is not None and tick - self.frame_start >= self.frame_ticks:
+			self.flush()
+		if self.frame is None:
+			self.frame = _FrameEncoder()
+			self.frame_start = tick
+		self.frame.out.append(rec_type)
+		return self.frame
+
+	def write_header(self, gamestate):
+		''' Record the initial state of the game (a gamestate dict). '''
+		self.flush()
+		self.index.append((gamestate.get('tick', 0), self.offset))
+		self.frame = _FrameEncoder(FLAG_KEYFRAME)
+		self._record(REC_HEADER).value(gamestate)
+		self.flush()
+
+	def keyframe_due(self, tick):
+		return bool(self.keyframe_ticks and self.index) and tick - self.index[-1][0] >= self.keyframe_ticks
+
+	def write_keyframe(self, tick, gamestate):
+		''' Record the full state of the game at the start of tick, as the
+			first record of a new frame.
+		'''
+		self.flush()
+		self.index.append((tick, self.offset))
+		self.frame = _FrameEncoder(FLAG_KEYFRAME)
+		self.frame_start = tick
+		frame = self._record(REC_KEYFRAME, tick)
+		_write_varint(frame.out, tick)
+		start = len(frame.out)
+		frame.value(gamestate)
+		# size first, so readers can skip over the state without decoding it
+		size = bytearray()
+		_write_varint(size, len(frame.out) - start)
+		frame.out[start:start] = size
+		# ... which means its strings can't be used by the records after it
+		frame.strings = {}
+
+	def write_orders(self, tick, orders):
+		''' Record the orders given at tick, as (owner, order tuple) pairs.
+			Nothing is written for a tick without orders.
+		'''
+		if not orders:
+			return
+		frame = self._record(REC_ORDERS, tick)
+		_write_varint(frame.out, tick)
+		_write_varint(frame.out, len(orders))
+		for owner, (o_type, src_id, new_id, ships, dest_id) in orders:
+			for v in (owner, o_type, src_id, new_id, ships, dest_id):
+				frame.value(v)
+
+	def flush(self):
+		''' Write out the current frame (if any) and flush the file. '''
+		if self.frame is not None and self.frame.out:
+			payload = bytes(self.frame.out)
+			flags = self.frame.flags
+			if self.compression:
+				payload = zlib.compress(payload, self.compression)
+				flags |= FLAG_ZLIB
+			self.file.write(_FRAME.pack(len(payload), flags))
+			self.file.write(payload)
+			self.offset += _FRAME.size + len(payload)
+		self.frame = None
+		self.file.flush()
+
+	def close(self, tick=None):
+		''' Record the end of the game (at tick, if known) and close the file.
+			Closing again does nothing.
+		'''
+		if self.closed:
+			return
+		if tick is not None:
+			_write_varint(self._record(REC_END).out, tick)
+		self.flush()
+		index_offset = self.offset
+		self.frame = _FrameEncoder(FLAG_INDEX)
+		self._record(REC_INDEX).value([list(entry) for entry in self.index])
+		self.flush()
+		self.file.write(_TRAILER.pack(index_offset, INDEX_MAGIC))
+		self.closed = True
+		self.file.close()
+
+
+class ReplayReader():
+
+	''' Reads a replay written by `ReplayWriter`. The gamestate header is
+		read straight away (`header`); iterating the reader then yields
+		(tick, orders) for each tick with orders, reading one frame at a
+		time. Orders are dicts, as `PlanetWarsGame._process_orders` expects.
+		The last item is (end tick, []) if the game's end was recorded.
+
+		`keyframe` jumps to the keyframe at or before a tick, after which
+		iterating carries on from there.
+	'''
+
+	def __init__(self, file):
+		if isinstance(file, (str, bytes)) or hasattr(file, '__fspath__'):
+			file = open(file, 'rb')
+		self.file = file
+		if self.file.read(len(MAGIC)) != MAGIC:
+			raise ReplayError("Not a PlanetWars replay")
+		version = self.file.read(1)
+		if not version or version[0] != VERSION:
+			raise ReplayError("Unsupported replay version")
+		self.end_tick = None
+		self.truncated = False
+		self.index = None  # (tick, file offset) of each keyframe, read when first needed
+		records = self._records()
+		rec_type, decoder = next(records, (None, None))
+		if rec_type != REC_HEADER:
+			raise ReplayError("Replay has no header")
+		self.header = decoder.value()
+		self._rest = records
+
+	def _read_frame(self, decode=True):
+		''' Read the next frame. Returns (flags, decoder), with decoder None
+			unless decode is true, or None at the end of the file.
+		'''
+		head = self.file.read(_FRAME.size)
+		if not head:
+			return None
+		if len(head) < _FRAME.size:
+			raise ReplayError("Replay ends part way through a frame")
+		length, flags = _FRAME.unpack(head)
+		payload = self.file.read(length)
+		if len(payload) < length:
+			raise ReplayError("Replay ends part way through a frame")
+		if not decode:
+			return flags, None
+		if flags & FLAG_ZLIB:
+			payload = zlib.decompress(payload)
+		return flags, _FrameDecoder(payload)
+
+	def _frames(self):
+		''' Yield the decoder of each frame in turn. A replay cut short (the
+			game crashed) ends quietly after its last whole frame, setting
+			`truncated`.
+		'''
+		while True:
+			try:
+				frame = self._read_frame()
+			except ReplayError:
+				self.truncated = True
+				return
+			if frame is None:
+				return
+			yield frame[1]
+
+	def _records(self):
+		''' Yield (record type, decoder positioned after the type) per record. '''
+		for decoder in self._frames():
+			while decoder.more():
+				rec_type = decoder.buf[decoder.pos]
+				decoder.pos += 1
+				yield rec_type, decoder
+
+	def __iter__(self):
+		for rec_type, decoder in self._rest:
+			if rec_type == REC_ORDERS:
+				tick = decoder.varint()
+				orders = []
+				for _ in range(decoder.varint()):
+					owner, o_type, src_id, new_id, ships, dest_id = (decoder.value() for _ in range(6))
+					orders.append({
+						'owner': owner,
+						'tick': tick,
+						'type': o_type,
+						'source': src_id,
+						'new_fleet_id': new_id,
+						'ships': ships,
+						'destination': dest_id
+					})
+				yield tick, orders
+			elif rec_type == REC_KEYFRAME:
+				# the game being replayed is already in this state
+				decoder.varint()
+				size = decoder.varint()
+				decoder.pos += size
+				decoder.strings = []
+			elif rec_type == REC_END:
+				self.end_tick = decoder.varint()
+				yield self.end_tick, []
+			elif rec_type == REC_INDEX:
+				return
+			else:
+				raise ReplayError("Unexpected record type %d" % rec_type)
+
+	def _read_index(self):
+		''' The index from the end of the file, or rebuilt if it isn't there. '''
+		try:
+			self.file.seek(-_TRAILER.size, os.SEEK_END)
+			index_offset, magic = _TRAILER.unpack(self.file.read(_TRAILER.size))
+		except (OSError, struct.error):
+			magic = None
+		if magic == INDEX_MAGIC:
+			self.file.seek(index_offset)
+			frame = self._read_frame()
+			if frame is not None and frame[0] & FLAG_INDEX and frame[1].buf[0] == REC_INDEX:
+				frame[1].pos = 1
+				return [tuple(entry) for entry in frame[1].value()]
+		return self._scan_index()
+
+	def _scan_index(self):
+		''' Find the keyframes by skipping from frame to frame. Stops quietly
+			at a frame cut short (e.g. by a crash).
+		'''
+		index = []
+		self.file.seek(len(MAGIC) + 1)
+		while True:
+			offset = self.file.tell()
+			try:
+				head = self.file.read(_FRAME.size)
+				if len(head) < _FRAME.size or _FRAME.unpack(head)[1] & FLAG_INDEX:
+					break
+				self.file.seek(offset)
+				frame = self._read_frame(decode=_FRAME.unpack(head)[1] & FLAG_KEYFRAME)
+			except (ReplayError, zlib.error):
+				break
+			flags, decoder = frame
+			if decoder is None:
+				continue
+			if decoder.buf[0] == REC_HEADER:
+				index.append((self.header.get('tick', 0), offset))
+			elif decoder.buf[0] == REC_KEYFRAME:
+				decoder.pos = 1
+				index.append((decoder.varint(), offset))
+		return index or [(self.header.get('tick', 0), len(MAGIC) + 1)]
+
+	def keyframe(self, tick):
+		''' Return the gamestate of the last keyframe at or before `tick` (or
+			the header), and carry on reading (iterating) from there. Games
+			already replaying from this reader can't be used afterwards.
+		'''
+		if self.index is None:
+			self.index = self._read_index()
+		i = bisect.bisect_right([t for t, offset in self.index], tick) - 1
+		self.file.seek(self.index[max(i, 0)][1])
+		self._rest = self._records()
+		rec_type, decoder = next(self._rest)
+		gamestate = dict(self.header)
+		if rec_type == REC_KEYFRAME:
+			decoder.varint()
+			decoder.varint()
+			gamestate.update(decoder.value())
+			decoder.strings = []
+		elif rec_type == REC_HEADER:
+			decoder.value()
+		else:
+			raise ReplayError("Index doesn't point at a keyframe")
+		return gamestate
+
+	def close(self):
+		self.file.close()
+
+
+def seek(reader, tick, **kwargs):
+	''' A new game replaying `reader`, from the keyframe before `tick` played
+		up to the start of `tick` (or the end of the game, if sooner). Any
+		kwargs are passed on to `PlanetWarsGame`.
+	'''
+	# imported here as the game needs pyglet, which the replay format doesn't
+	from planet_wars import PlanetWarsGame
+	game = PlanetWarsGame(reader.keyframe(tick), replay=reader, **kwargs)
+	# one tick at a time, as fast-forward could jump past tick
+	fast_forward, game.fast_forward = game.fast_forward, False
+	while game.tick < tick and game.is_alive() and (game.max_ticks is None or game.tick < game.max_ticks):
+		game.update(manual=True)
+	game.fast_forward = fast_forward
+	return game
@@ -0,0 +1,243 @@
+"""Sandboxed bots for PlanetWars
+
+A `SandboxScheduler` given to a game (`PlanetWarsGame(..., scheduler=...)`, or
+`--sandbox` on the command line; see schedulers.py for the others) runs each bot controller in its own worker
+process rather than in the game's. Each tick, every awake bot is sent its
+facade (only the snapshots, and planet `vision_age`s, that changed since it
+was last sent one, see `_FacadeDelta`) and all of them think at the same time, one per core. The
+game then waits until a shared deadline for their orders:
+
+ - a bot that answers in time has its orders (and any request to sleep, see
+   `Player.sleep_until`) applied as if it had run in the game's process
+ - a bot that is late forfeits that tick's orders. Its worker is left to
+   finish, and the bot is skipped until it has, so a bot stuck in a loop
+   just stops playing rather than holding up the game
+ - a bot that raises, or whose worker dies, forfeits that tick's orders too.
+   The error is kept in `errors`, and a dead worker is not restarted
+
+Workers are started (and the bots created in them) on the first tick they're
+needed, and waited for without a deadline. Each worker's `random` (and entity
+IDs) are seeded from the game process's `random`, so seeded games are still
+the same game, as long as every bot makes its deadline.
+
+To check that workers are sent the same facades that bots see in-process
+(after changing `_FacadeDelta` or `_apply_facade`), run
+check_sandbox_facades.py.
+
+"""
+import multiprocessing
+import random
+import time
+import traceback
+
+from players import Player
+from ownership import OwnedDict
+from schedulers import SequentialScheduler
+import entities
+
+# how long a new worker has to import and create its bot
+START_TIMEOUT = 60
+
+
+def _apply_facade(player, tick, planets, ages, fleets, removed):
+	''' Bring the worker's copy of a facade up to date, from a message of
+		`_FacadeDelta.facade`.
+	'''
+	player.tick = tick
+	player.planets.update(planets)
+	for ID in removed:
+		player.planets.pop(ID, None)
+	for ID, age in ages.items():
+		player.planets[ID].vision_age = age
+	# fleets are sent in full (as IDs of unchanged ones), so forgotten fleets drop out
+	player.fleets = OwnedDict((ID, player.fleets[ID] if fleet is None else fleet) for ID, fleet in fleets.items())
+	for fleet in player.fleets.values():
+		fleet._planets = player.planets
+
+
+def _worker(conn, ID, name, seed):
+	''' Body of a worker process: run the bot of one player, a tick at a time. '''
+	random.seed(seed)
+	entities._id_random.seed(seed)
+	try:
+		player = Player(ID, name)
+	except Exception:
+		conn.send(('error', traceback.format_exc()))
+		return
+	conn.send(('ready', None))
+	scheduler = SequentialScheduler()  # runs async bots too
+	while True:
+		try:
+			message = conn.recv()
+		except EOFError:
+			return
+		if message is None:
+			return
+		tick = message[0]
+		_apply_facade(player, *message)
+		player.orders = []
+		start = time.perf_counter()
+		try:
+			scheduler.run_bot(player)
+			error = None
+		except Exception:
+			error = traceback.format_exc()
+		conn.send((tick, player.orders, player.wake_tick, player.wake_on_event, time.perf_counter() - start, error))
+
+
+class _FacadeDelta():
+
+	''' The facade of a player as last sent to its worker, so only what has
+		changed is sent again.
+	'''
+
+	def __init__(self, player):
+		self.player = player
+		self.planets = {}
+		self.ages = {}  # ID -> vision_age last sent
+		self.fleets = {}
+
+	def facade(self, tick):
+		''' The message (see `_apply_facade`) of the changes to the player's
+			facade for tick, from what was last sent.
+		'''
+		player = self.player
+		planets = {ID: p for ID, p in player.planets.items() if self.planets.get(ID) is not p}
+		removed = [ID for ID in self.planets if ID not in player.planets]
+		# the game changes vision_age in place on the snapshots it reuses, so
+		# a planet's age can change without its snapshot being sent again
+		ages = {ID: p.vision_age for ID, p in player.planets.items() if self.ages.get(ID) != p.vision_age}
+		fleets = {ID: None if self.fleets.get(ID) is f else f for ID, f in player.fleets.items()}
+		return tick, planets, ages, fleets, removed
+
+	def sent(self, message):
+		''' Remember what message (of `facade`) told the worker. '''
+		_, _, ages, _, removed = message
+		self.planets = dict(self.player.planets)
+		self.ages.update(ages)
+		for ID in removed:
+			self.ages.pop(ID, None)
+		self.fleets = dict(self.player.fleets)
+
+
+class _FacadeSender(_FacadeDelta):
+
+	''' The parent's end of a worker: the process, its pipe, and the facade
+		last sent to it (see `_FacadeDelta`).
+	'''
+
+	def __init__(self, player, context):
+		super().__init__(player)
+		self.conn, child = context.Pipe()
+		self.process = context.Process(
+			target=_worker, args=(child, player.ID, player.name, random.getrandbits(64)),
+			name="bot-%s" % player.name, daemon=True)
+		self.process.start()
+		child.close()
+		self.busy = None  # tick the worker is still thinking about, if any
+		self.alive = True
+
+	def wait_ready(self):
+		if not self.conn.poll(START_TIMEOUT):
+			raise RuntimeError("Sandboxed bot %s did not start" % self.player.name)
+		status, error = self.conn.recv()
+		if status != 'ready':
+			raise RuntimeError("Sandboxed bot %s could not be created:\n%s" % (self.player.name, error))
+
+	def send(self, tick):
+		''' Send the (changes to the) player's facade for tick. '''
+		message = self.facade(tick)
+		try:
+			self.conn.send(message)
+		except OSError:
+			self.alive = False
+			return
+		self.sent(message)
+		self.busy = tick
+
+	def receive(self):
+		''' The next reply of the worker (None if it has died). '''
+		try:
+			reply = self.conn.recv()
+		except (EOFError, OSError):
+			self.alive = False
+			return None
+		self.busy = None
+		return reply
+
+	def close(self):
+		if self.alive:
+			try:
+				self.conn.send(None)
+			except OSError:
+				pass
+		self.process.join(0.5)
+		if self.process.is_alive():
+			self.process.terminate()
+			self.process.join()
+		self.conn.close()
+
+
+class SandboxScheduler():
+
+	''' Runs the bots of a game in worker processes, with a per tick deadline
+		(in seconds).
+	'''
+
+	def __init__(self, deadline=1.0):
+		self.deadline = deadline
+		self.workers = {}  # player ID -> _FacadeSender
+		self.late = {}  # player ID -> ticks forfeited by answering late
+		self.errors = {}  # player ID -> last error (traceback) of the bot
+		self._context = multiprocessing.get_context('spawn')
+
+	def _worker(self, player):
+		worker = self.workers.get(player.ID)
+		if worker is None:
+			worker = self.workers[player.ID] = _FacadeSender(player, self._context)
+			worker.wait_ready()
+		return worker
+
+	def update(self, game, players):
+		''' Update the bots of players (at game.tick), leaving their orders in
+			`player.orders` as `Player.update` would.
+		'''
+		tick = game.tick
+		waiting = []
+		for player in players:
+			worker = self._worker(player)
+			if not worker.alive:
+				continue
+			if worker.busy is not None and worker.conn.poll():
+				# late answer to an earlier tick, already forfeited
+				worker.receive()
+			if worker.alive and worker.busy is None:
+				worker.send(tick)
+				if worker.alive:
+					waiting.append(worker)
+			if not worker.alive:
+				# died since the last tick (found sending, or reading a late answer)
+				self.errors[player.ID] = "worker process died"
+		end = time.perf_counter() + self.deadline
+		for worker in waiting:
+			player = worker.player
+			if not worker.conn.poll(max(0, end - time.perf_counter())):
+				self.late[player.ID] = self.late.get(player.ID, 0) + 1
+				continue
+			reply = worker.receive()
+			if reply is None:
+				self.errors[player.ID] = "worker process died"
+				continue
+			_, orders, player.wake_tick, player.wake_on_event, seconds, error = reply
+			if game.profiler:
+				game.profiler.bot(player, seconds)
+			if error is not None:
+				self.errors[player.ID] = error
+				continue
+			player.orders.extend(orders)
+
+	def close(self):
+		''' Stop every worker. '''
+		for worker in self.workers.values():
+			worker.close()
+		self.workers = {}
@@ -0,0 +1,138 @@
+"""Bot schedulers for PlanetWars
+
+A scheduler runs phase 0 of `PlanetWarsGame.update`: it updates the bots of
+the awake players, which leave their orders in `player.orders`. Each bot only
+reads its own facade and writes its own orders, so bots can be run in any
+order, or at the same time. The orders are always merged (processed) in the
+order of `game.players` once every bot is done, whichever finished first.
+
+ - `SequentialScheduler` (the default) updates one bot after another.
+ - `ThreadScheduler` updates them in a thread pool. This only helps bots
+   that spend their time outside the GIL, e.g. in NumPy.
+ - `AsyncScheduler` runs `async def update` bots as coroutines on one event
+   loop, so bots that await external work (a network service, a model) wait
+   at the same time. Plain bots are updated as they're reached.
+ - `SandboxScheduler` (see sandbox.py) runs each bot in its own process.
+
+A bot can have an `async def update` with any scheduler: the others just run
+the coroutine to completion as the bot is updated. With threads or
+coroutines, bots that draw from module level random state (`random`, or the
+fleet IDs of `Player.planet_order`) get those numbers in whatever order they
+ask for them, so only the sequential scheduler keeps seeded games exactly
+the same.
+
+"""
+import asyncio
+import concurrent.futures
+import inspect
+import time
+
+
+class SequentialScheduler():
+
+	''' Updates the bots one after another, in the game process. '''
+
+	def __init__(self):
+		self._loop = None
+
+	def run_bot(self, player):
+		''' Update the bot of player, to completion even if it is a coroutine. '''
+		result = player.update()
+		if inspect.iscoroutine(result):
+			if self._loop is None:
+				# kept for the whole game, as bots may hold on to loop resources
+				self._loop = asyncio.new_event_loop()
+			self._loop.run_until_complete(result)
+
+	def update(self, game, players):
+		''' Update the bots of players (at game.tick). '''
+		profiler = game.profiler
+		for player in players:
+			if profiler:
+				start = time.perf_counter()
+				self.run_bot(player)
+				profiler.bot(player, time.perf_counter() - start)
+			else:
+				self.run_bot(player)
+
+	def close(self):
+		if self._loop is not None:
+			self._loop.close()
+			self._loop = None
+
+
+class ThreadScheduler(SequentialScheduler):
+
+	''' Updates the bots at the same time, in a pool of (up to `workers`)
+		threads. An error raised by a bot is raised again once they are all
+		done (the first, in player order, if there are several).
+	'''
+
+	def __init__(self, workers=None):
+		super().__init__()
+		self.workers = workers
+		self._pool = None
+
+	def _timed(self, player):
+		start = time.perf_counter()
+		self.run_bot(player)
+		return time.perf_counter() - start
+
+	def run_bot(self, player):
+		result = player.update()
+		if inspect.iscoroutine(result):
+			# an event loop of its own, as other threads may be running one
+			asyncio.run(result)
+
+	def update(self, game, players):
+		if len(players) < 2:
+			return super().update(game, players)
+		if self._pool is None:
+			self._pool = concurrent.futures.ThreadPoolExecutor(self.workers, thread_name_prefix="bot")
+		futures = [self._pool.submit(self._timed, player) for player in players]
+		concurrent.futures.wait(futures)
+		for player, future in zip(players, futures):
+			seconds = future.result()  # raises the bot's error, if any
+			if game.profiler:
+				game.profiler.bot(player, seconds)
+
+	def close(self):
+		if self._pool is not None:
+			self._pool.shutdown()
+			self._pool = None
+		super().close()
+
+
+class AsyncScheduler(SequentialScheduler):
+
+	''' Runs the `async def update` of bots concurrently, on one event loop
+		kept for the whole game. The time profiled for an async bot runs
+		until its coroutine is done, so includes time spent waiting.
+	'''
+
+	def update(self, game, players):
+		if self._loop is None:
+			self._loop = asyncio.new_event_loop()
+		self._loop.run_until_complete(self._update(game, players))
+
+	async def _update(self, game, players):
+		timed = []
+		for player in players:
+			start = time.perf_counter()
+			result = player.update()
+			if inspect.iscoroutine(result):
+				timed.append((player, self._timed(result, start)))
+			elif game.profiler:
+				game.profiler.bot(player, time.perf_counter() - start)
+		if timed:
+			# like the thread pool, every bot finishes before an error is raised
+			results = await asyncio.gather(*(coroutine for _, coroutine in timed), return_exceptions=True)
+			for (player, _), result in zip(timed, results):
+				if isinstance(result, BaseException):
+					raise result
+				if game.profiler:
+					game.profiler.bot(player, result)
+
+	async def _timed(self, coroutine, start):
+		await coroutine
+		return time.perf_counter() - start
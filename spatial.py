@@ -0,0 +1,104 @@
+"""Spatial index for PlanetWars entities
+
+`SpatialGrid` buckets entities into square cells of a uniform grid (in game
+units, i.e. after `SCALE_FACTOR` has been applied). A query returns every
+entity stored in a cell that overlaps the bounding square of a circle, so the
+result is a superset of the entities within the radius - callers still do
+their own exact distance test.
+
+Planets never move, so the game builds one grid for them up front. Fleets are
+kept in a second grid which the game updates as fleets are launched, move and
+arrive.
+
+"""
+import math
+
+DEFAULT_CELL_SIZE = 100
+
+
+class SpatialGrid():
+
+	''' Uniform grid over entity `x`/`y` positions, keyed by entity ID. '''
+
+	def __init__(self, entities=(), cell_size=DEFAULT_CELL_SIZE):
+		self.cell_size = cell_size
+		self._cells = {}   # (cx, cy) -> {ID: entity}
+		self._where = {}   # ID -> (cx, cy)
+		for e in entities:
+			self.insert(e)
+
+	def __len__(self):
+		return len(self._where)
+
+	def __contains__(self, ID):
+		return ID in self._where
+
+	def _cell_of(self, x, y):
+		return (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+
+	def insert(self, entity):
+		''' Add (or re-add) an entity at its current position. '''
+		if entity.ID in self._where:
+			self.remove(entity)
+		cell = self._cell_of(entity.x, entity.y)
+		self._cells.setdefault(cell, {})[entity.ID] = entity
+		self._where[entity.ID] = cell
+
+	def remove(self, entity):
+		''' Remove an entity, if present. '''
+		cell = self._where.pop(entity.ID, None)
+		if cell is not None:
+			bucket = self._cells[cell]
+			del bucket[entity.ID]
+			if not bucket:
+				del self._cells[cell]
+
+	def move(self, entity):
+		''' Update the cell of an entity that has changed position. '''
+		cell = self._cell_of(entity.x, entity.y)
+		old = self._where.get(entity.ID)
+		if old == cell:
+			# still the same cell, but make sure we hold the current object
+			self._cells[cell][entity.ID] = entity
+			return
+		if old is not None:
+			bucket = self._cells[old]
+			del bucket[entity.ID]
+			if not bucket:
+				del self._cells[old]
+		self._cells.setdefault(cell, {})[entity.ID] = entity
+		self._where[entity.ID] = cell
+
+	def near(self, x, y, radius):
+		''' Yield the entities in every cell overlapping the square of side
+			2*radius centred on x, y. Includes entities outside the radius.
+		'''
+		x0, y0 = self._cell_of(x - radius, y - radius)
+		x1, y1 = self._cell_of(x + radius, y + radius)
+		if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self._cells):
+			# big radius - cheaper to walk the occupied cells than the range
+			for (cx, cy), bucket in self._cells.items():
+				if x0 <= cx <= x1 and y0 <= cy <= y1:
+					yield from bucket.values()
+		else:
+			cells = self._cells
+			for cx in range(x0, x1 + 1):
+				for cy in range(y0, y1 + 1):
+					bucket = cells.get((cx, cy))
+					if bucket:
+						yield from bucket.values()
+
+	def in_range(self, src, radius=None):
+		''' Yield the entities strictly inside the vision range of `src` (or
+			`radius` if given), using the same test as the brute-force loop.
+		'''
+		if radius is None:
+			radius = src.vision_range()
+			limit = src.vision_range_sq()
+		else:
+			limit = radius**2
+		# pad the cell search a little so float rounding at a cell edge can
+		# never drop an entity the exact test below would have accepted
+		for e in self.near(src.x, src.y, radius + 1):
+			if src.distance_to(e) < limit:
+				yield e
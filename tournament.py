@@ -0,0 +1,254 @@
+""" Headless PlanetWars tournament runner
+
+Plays every matchup of the given bots on every given map, for each seed and
+repetition, spreading the games over a pool of worker processes. One JSON
+line is appended to the results file as each game finishes:
+
+	{"map": "map001", "seed": 1, "repeat": 0, "players": ["Blanko", "OneSlowMove"],
+	 "status": "ok", "winner": "OneSlowMove", "ticks": 312, "ships": [0, 160],
+	 "wall_time": 0.41}
+
+`status` is one of:
+ - "ok" # the game finished (a `winner` of null means max ticks was reached)
+ - "timeout" # the game ran longer than --timeout seconds and was stopped
+ - "error" # the game raised an exception (see "error")
+ - "crashed" # the worker process running the game died
+
+Example:
+	python tournament.py -p Blanko OneSlowMove -m map001 map002 --seeds 1 2 --repeat 3 -w 4
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import itertools
+import json
+import os
+import pathlib
+import random
+import signal
+import time
+import traceback
+
+import map_cache
+
+MAPS_DIR = pathlib.Path(__file__).parent.joinpath('maps')
+
+
+class GameTimeout(BaseException):
+	# not an Exception, as it is raised inside whatever is running (often a
+	# bot), which mustn't be able to catch it with `except Exception`
+	pass
+
+
+def _on_alarm(signum, frame):
+	raise GameTimeout()
+
+
+def load_map(name):
+	''' Return the gamestate of maps/<name>.json (or .jsonc). Each worker
+		parses a map once, and only the first ever load parses its JSON (see
+		map_cache.py).
+	'''
+	return map_cache.load_map(name, MAPS_DIR)
+
+
+def play_game(job):
+	''' Play one game headless and return its result dict. Runs in a worker. '''
+	# imported here so the parent process never needs the game modules
+	from planet_wars import PlanetWarsGame
+	from entities import NEUTRAL_ID
+
+	result = dict(job)
+	del result['max_ticks'], result['timeout'], result['backend'], result['fast_forward']
+	random.seed(job['seed'])
+	# on platforms without SIGALRM (Windows) only max_ticks limits a game
+	alarm = job['timeout'] and hasattr(signal, 'SIGALRM')
+	start = time.perf_counter()
+	game = None
+	try:
+		if alarm:
+			signal.signal(signal.SIGALRM, _on_alarm)
+			signal.setitimer(signal.ITIMER_REAL, job['timeout'])
+		gamestate = load_map(job['map'])
+		gamestate['players'] = [{'ID': str(i + 1), 'name': name} for i, name in enumerate(job['players'])]
+		gamestate['max_ticks'] = job['max_ticks']
+		game = PlanetWarsGame(gamestate, backend=job['backend'], fast_forward=job['fast_forward'])
+		game.paused = False
+		while game.is_alive() and game.tick < game.max_ticks:
+			game.update()
+		result['status'] = 'ok'
+	except GameTimeout:
+		result['status'] = 'timeout'
+	except Exception:
+		result['status'] = 'error'
+		result['error'] = traceback.format_exc()
+	finally:
+		if alarm:
+			signal.setitimer(signal.ITIMER_REAL, 0)
+	result['wall_time'] = time.perf_counter() - start
+	result['winner'] = None
+	result['ticks'] = None
+	result['ships'] = None
+	if game is not None:
+		ships = {ID: game.owned_planets.ships[ID] + game.owned_fleets.ships[ID]
+				 for ID in game.players if ID != NEUTRAL_ID}
+		result['ticks'] = game.tick
+		result['ships'] = list(ships.values())
+		if result['status'] == 'ok' and not game.is_alive():
+			# as is_alive counts them: players that still own planets or fleets
+			alive = [ID for ID in ships if ID in game.owned_planets.owned or ID in game.owned_fleets.owned]
+			if len(alive) == 1:
+				result['winner'] = game.players[alive[0]].name
+	return result
+
+
+def _failed(job, status, error=None):
+	''' Result for a game that never got to report its own result. '''
+	result = dict(job)
+	del result['max_ticks'], result['timeout'], result['backend'], result['fast_forward']
+	result.update(status=status, winner=None, ticks=None, ships=None, wall_time=None)
+	if error:
+		result['error'] = error
+	return result
+
+
+def make_jobs(bots, maps, seeds, repeat, players_per_game, max_ticks, timeout, backend='objects', fast_forward=False):
+	''' One job per matchup x map x seed x repetition. '''
+	jobs = []
+	for players in itertools.combinations(bots, players_per_game):
+		for map_name in maps:
+			for seed in seeds:
+				for r in range(repeat):
+					jobs.append({
+						'map': map_name,
+						'seed': seed,
+						'repeat': r,
+						'players': list(players),
+						'max_ticks': max_ticks,
+						'timeout': timeout,
+						'backend': backend,
+						'fast_forward': fast_forward
+					})
+	return jobs
+
+
+def run_tournament(jobs, results_file, workers=None):
+	''' Play all jobs over a process pool, appending each result (as a JSON
+		line) to results_file as soon as it is known. Returns the number of
+		games that did not finish with status "ok".
+
+		If a worker process dies the pool is lost along with every game that
+		was running on it. Those games are then replayed one at a time on a
+		fresh single worker so the game responsible can be identified and
+		recorded as "crashed" without losing the others.
+	'''
+	workers = workers or os.cpu_count()
+	failures = 0
+
+	def record(result):
+		nonlocal failures
+		if result['status'] != 'ok':
+			failures += 1
+		results_file.write(json.dumps(result) + '\n')
+		results_file.flush()
+
+	pending = list(reversed(jobs))
+	suspects = []
+	while pending:
+		with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+			running = {}
+			broken = False
+			while (pending and not broken) or running:
+				# keep a bounded number of games queued so results stream out
+				while pending and not broken and len(running) < 2 * workers:
+					job = pending.pop()
+					running[pool.submit(play_game, job)] = job
+				done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+				for future in done:
+					job = running.pop(future)
+					try:
+						record(future.result())
+					except concurrent.futures.process.BrokenProcessPool:
+						broken = True
+						suspects.append(job)
+					except Exception:
+						record(_failed(job, 'error', traceback.format_exc()))
+		# retry the games lost with a broken pool, one per pool
+		for job in suspects:
+			with concurrent.futures.ProcessPoolExecutor(max_workers=1) as pool:
+				try:
+					record(pool.submit(play_game, job).result())
+				except concurrent.futures.process.BrokenProcessPool:
+					record(_failed(job, 'crashed'))
+				except Exception:
+					record(_failed(job, 'error', traceback.format_exc()))
+		suspects = []
+	return failures
+
+
+def summarise(results_path):
+	''' Print win counts per bot from a results file. '''
+	wins = collections.Counter()
+	games = collections.Counter()
+	statuses = collections.Counter()
+	with open(results_path, 'r') as f:
+		for line in f:
+			result = json.loads(line)
+			statuses[result['status']] += 1
+			for name in set(result['players']):
+				games[name] += 1
+			if result['winner']:
+				wins[result['winner']] += 1
+	for name in sorted(games, key=lambda n: -wins[n]):
+		print("%-20s won %5d of %5d games" % (name, wins[name], games[name]))
+	print(", ".join("%s: %d" % kv for kv in sorted(statuses.items())))
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(
+		prog="PlanetWars tournament",
+		description="Plays many headless PlanetWars games in parallel and streams the results to a file."
+	)
+	parser.add_argument(
+		"-p",
+		"--players",
+		nargs="+",
+		required=True,
+		help="Bots to play. Should be the name (no extension) of file found in /bots.",
+	)
+	parser.add_argument(
+		"-m",
+		"--maps",
+		nargs="*",
+		help="Filenames (no extension) of the maps to play on. Defaults to every .json map in /maps.",
+	)
+	parser.add_argument(
+		"--per-game",
+		type=int,
+		default=2,
+		help="Number of bots in each game. Every combination of this many bots from --players is played.",
+	)
+	parser.add_argument("--seeds", type=int, nargs="+", default=[0], help="Random seeds to play each matchup with.")
+	parser.add_argument("--repeat", type=int, default=1, help="Number of times to play each matchup/map/seed.")
+	parser.add_argument("-w", "--workers", type=int, default=None, help="Worker processes. Defaults to the number of CPUs.")
+	parser.add_argument("--max-ticks", type=int, default=10000, help="Tick limit of each game.")
+	parser.add_argument(
+		"--timeout",
+		type=float,
+		default=600,
+		help="Wall time limit (seconds) of each game. 0 for no limit. Not enforced on Windows.",
+	)
+	parser.add_argument("--backend", choices=["objects", "arrays"], default="objects", help="Game state backend.")
+	parser.add_argument("--fast-forward", action="store_true", help="Skip ticks in which nothing happens.")
+	parser.add_argument("-o", "--out", default="results.jsonl", help="File the results are appended to (JSON lines).")
+	args = parser.parse_args()
+
+	maps = args.maps or sorted(p.stem for p in MAPS_DIR.glob('*.json'))
+	jobs = make_jobs(args.players, maps, args.seeds, args.repeat, args.per_game, args.max_ticks, args.timeout, args.backend, args.fast_forward)
+	print("Playing %d games..." % len(jobs))
+	with open(args.out, 'a') as results_file:
+		failures = run_tournament(jobs, results_file, args.workers)
+	if failures:
+		print("%d games did not finish cleanly" % failures)
+	summarise(args.out)
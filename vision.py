@@ -0,0 +1,52 @@
+"""Cached planet to planet vision for PlanetWars
+
+Planets never move, so what a planet can see only changes when its vision
+range does (its ships change) or when planets change hands. `PlanetVision`
+sorts, once per planet, every other planet by distance, so the planets in
+range are just the ones before a binary search for the (squared) range. The
+list of planets a planet can see that its owner doesn't own is then kept
+until the range takes in or drops a planet, or any planet changes owner.
+
+Fleets do move, so they are still checked against the spatial grids every
+tick (see `PlanetWarsGame.update_facade`).
+
+"""
+import array
+import bisect
+
+
+class PlanetVision():
+
+	''' Which planets each planet of `planets` (a dict of the game's planets)
+		can see.
+	'''
+
+	def __init__(self, planets):
+		self.planets = planets
+		self._nearest = {}  # ID -> (squared distances, planets), nearest first
+		self._seen = {}  # ID -> (planets in range, owner changes, planets seen)
+
+	def _by_distance(self, planet):
+		nearest = self._nearest.get(planet.ID)
+		if nearest is None:
+			# ties in planet order, as the planets dict (and the grid) gives them
+			pairs = sorted(((planet.distance_to(other), i, other) for i, other in enumerate(self.planets.values())),
+						   key=lambda pair: pair[:2])
+			nearest = self._nearest[planet.ID] = (array.array('d', [d for d, _, _ in pairs]),
+												  [other for _, _, other in pairs])
+		return nearest
+
+	def seen_by(self, planet, owner_changes):
+		''' The planets (not owned by its owner) strictly inside the vision
+			range of planet, nearest first. `owner_changes` is a count that
+			goes up whenever any planet changes owner. The list is shared
+			between calls (don't change it), and is the same list for as long
+			as the answer is the same.
+		'''
+		distances, planets = self._by_distance(planet)
+		count = bisect.bisect_left(distances, planet.vision_range_sq())
+		seen = self._seen.get(planet.ID)
+		if seen is None or seen[0] != count or seen[1] != owner_changes:
+			owner = planet.owner
+			seen = self._seen[planet.ID] = (count, owner_changes, [p for p in planets[:count] if p.owner != owner])
+		return seen[2]